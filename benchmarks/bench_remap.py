@@ -0,0 +1,63 @@
+"""
+Micro-benchmark for remap_layout.remap(): how the cost of remapping scales with
+the number of commands and the number of language systems in the font.
+
+Compares the batched remap() against applying one command at a time with
+remap_lookups(), which freezes and thaws the lookup list for every command.
+
+    python -m benchmarks.bench_remap
+"""
+
+import argparse
+import copy
+import logging
+import time
+
+from upsetter.remap_layout import parse_command, remap, remap_lookups
+
+from .synthetic import build_font
+
+
+def remap_per_command(ttFont, commands):
+    tables = [ttFont[tag].table for tag in ("GSUB", "GPOS") if tag in ttFont]
+    for _, src, dst, operation, start in map(parse_command, commands):
+        for table in tables:
+            remap_lookups(table, src, dst, operation=operation, start=start)
+
+
+def measure(func, ttFont, commands, repeat):
+    timings = []
+    for _ in range(repeat):
+        gsub = copy.deepcopy(ttFont["GSUB"])
+        ttFont["GSUB"] = gsub
+        start = time.perf_counter()
+        func(ttFont, commands)
+        timings.append(time.perf_counter() - start)
+    return min(timings), gsub.compile(ttFont)
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--commands", default="1,5,20,40", help="Comma-separated numbers of commands")
+    parser.add_argument("--langsyses", default="10,100,500", help="Comma-separated numbers of language systems")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args(args)
+    logging.disable(logging.INFO)
+
+    num_commands = [int(n) for n in args.commands.split(",")]
+    print(f"{'langsyses':>10} {'commands':>9} {'per command (s)':>16} {'batched (s)':>12} {'speedup':>8}")
+    for num_langsyses in [int(n) for n in args.langsyses.split(",")]:
+        # 10 scripts with the given number of language systems in total
+        ttFont = build_font(
+            num_glyphs=400, num_scripts=10, num_langs=max(num_langsyses // 10 - 1, 0), num_features=max(num_commands)
+        )
+        for n in num_commands:
+            commands = [f"s{feature:03d}=>ccmp" for feature in range(n)]
+            per_command, expected = measure(remap_per_command, ttFont, commands, args.repeat)
+            batched, result = measure(remap, ttFont, commands, args.repeat)
+            assert result == expected, "Batched remap output differs"
+            print(f"{num_langsyses:>10} {n:>9} {per_command:>16.4f} {batched:>12.4f} {per_command / batched:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
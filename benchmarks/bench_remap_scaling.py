@@ -0,0 +1,75 @@
+"""
+Scaling benchmark for remap_layout.remap() on synthetic fonts with thousands of
+language systems and long lookup lists.
+
+Each run moves every feature into ccmp for all language systems, and moves
+one feature for a number of individual language systems. The time per language
+system should stay roughly constant as the fonts grow. For comparison, the
+"scan" column repeats the run with find_langsyses() scanning all language
+systems for every command instead of using the index.
+
+    python -m benchmarks.bench_remap_scaling
+"""
+
+import argparse
+import copy
+import gc
+import logging
+import time
+from unittest import mock
+
+from upsetter import remap_layout
+
+from .synthetic import build_font
+
+
+def measure(ttFont, commands, repeat, indexed=True):
+    timings = []
+    for _ in range(repeat):
+        ttFont["GSUB"] = gsub = copy.deepcopy(ttFont["GSUB"])
+        index_langsyses = remap_layout.index_langsyses if indexed else lambda lookuplist: None
+        gc.collect()
+        with mock.patch.object(remap_layout, "index_langsyses", index_langsyses):
+            start = time.perf_counter()
+            remap_layout.remap(ttFont, commands)
+            timings.append(time.perf_counter() - start)
+    return min(timings), gsub.compile(ttFont)
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--langsyses", default="1000,2000,4000", help="Comma-separated numbers of language systems")
+    parser.add_argument("--features", type=int, default=10)
+    parser.add_argument("--lookups", type=int, default=50, help="Lookups per feature")
+    parser.add_argument("--single", type=int, default=100, help="Commands for individual language systems")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args(args)
+    logging.disable(logging.ERROR)
+
+    print(f"{'langsyses':>10} {'commands':>9} {'indexed (s)':>12} {'us/langsys':>11} {'scan (s)':>9}")
+    for num_langsyses in [int(n) for n in args.langsyses.split(",")]:
+        num_scripts = 20
+        num_langs = max(num_langsyses // num_scripts - 1, 0)
+        ttFont = build_font(
+            num_glyphs=400,
+            num_scripts=num_scripts,
+            num_langs=num_langs,
+            num_features=args.features,
+            lookups_per_feature=args.lookups,
+        )
+        commands = [f"s{feature:03d}=>ccmp" for feature in range(1, args.features)]
+        for i in range(args.single):
+            langsys = f"s{i % num_scripts:03d}/L{i % num_langs:03d}"
+            commands.append(f"{langsys}/s000=>{langsys}/ccmp")
+
+        indexed, expected = measure(ttFont, commands, args.repeat)
+        scan, result = measure(ttFont, commands, args.repeat, indexed=False)
+        assert result == expected
+        print(
+            f"{num_langsyses:>10} {len(commands):>9} {indexed:>12.3f} "
+            f"{indexed / num_langsyses * 1e6:>11.1f} {scan:>9.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
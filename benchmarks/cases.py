@@ -0,0 +1,150 @@
+"""
+Benchmark cases over the bundled test fonts and synthetic large fonts.
+
+Every case is a setup function that prepares its input and returns the function to time,
+so that loading test fonts and building synthetic fonts is not part of the measurement.
+Setup runs again before every repetition because the stages modify their input font.
+"""
+
+import functools
+import io
+import os
+import shutil
+import tempfile
+
+from .synthetic import build_font
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FONTS = {
+    "inconsolata": os.path.join(ROOT, "tests", "fonts", "Inconsolata[wdth,wght].ttf"),
+    "ysabeau": os.path.join(ROOT, "tests", "fonts", "Ysabeau[wght].ttf"),
+    "substitution": os.path.join(ROOT, "tests", "fonts", "SubstitutionTest-Regular.ttf"),
+}
+LATIN = "U+0020-007E,U+00A0-00FF"
+# Static instances of the variable test fonts
+STATIC = {
+    "ysabeau-static": ("ysabeau", {"wght": 400}),
+    "inconsolata-static": ("inconsolata", {"wght": 400, "wdth": 100}),
+}
+
+
+@functools.lru_cache(maxsize=None)
+def font_data(font):
+    """Bytes of a bundled font, or of a synthetic one"""
+    if font == "synthetic":
+        # Many glyphs, language systems and features
+        ttFont = build_font(
+            num_glyphs=5000, num_scripts=10, num_langs=20, num_features=40, lookups_per_feature=2, contours=2
+        )
+        stream = io.BytesIO()
+        ttFont.save(stream)
+        return stream.getvalue()
+    if font in STATIC:
+        from concurrent.futures import ProcessPoolExecutor
+
+        # In a separate process, so that instancing doesn't count towards the peak memory of the case
+        with ProcessPoolExecutor(1) as executor:
+            return executor.submit(_static_instance, font).result()
+    with open(FONTS[font], "rb") as f:
+        return f.read()
+
+
+def _static_instance(font):
+    from fontTools.ttLib import TTFont
+    from fontTools.varLib.instancer import instantiateVariableFont
+
+    variable, location = STATIC[font]
+    stream = io.BytesIO()
+    instantiateVariableFont(TTFont(io.BytesIO(font_data(variable))), location, inplace=True).save(stream)
+    return stream.getvalue()
+
+
+def load(font):
+    from fontTools.ttLib import TTFont
+
+    return TTFont(io.BytesIO(font_data(font)))
+
+
+def _subspace(font, location):
+    from fontTools.varLib.instancer import parseLimits
+
+    from upsetter import font_subspace
+
+    ttFont, subspace = load(font), parseLimits(location.split(","))
+    return lambda: font_subspace(ttFont, subspace, inplace=True)
+
+
+def _freeze(font, features):
+    from upsetter import font_freeze_features
+
+    ttFont = load(font)
+    return lambda: font_freeze_features(ttFont, features, "", inplace=True)
+
+
+def _subset(font, unicodes):
+    from upsetter import font_subset
+
+    ttFont = load(font)
+    return lambda: font_subset(ttFont, unicodes, inplace=True)
+
+
+def _remap(font, commands):
+    from upsetter.remap_layout import remap
+
+    ttFont = load(font)
+    # Parse the layout tables beforehand, remap() works on the parsed tables
+    for tag in ("GSUB", "GPOS"):
+        if tag in ttFont:
+            ttFont[tag].table
+    return lambda: remap(ttFont, commands)
+
+
+def _woff2(font):
+    from upsetter.compress import compress_bytes
+
+    data = font_data(font)
+    return lambda: compress_bytes(data, "woff2")
+
+
+def _upset(font, subspace=None, **options):
+    from fontTools.varLib.instancer import parseLimits
+
+    from upsetter import upset
+
+    if subspace:
+        options["subspace"] = parseLimits(subspace.split(","))
+    directory = tempfile.mkdtemp()
+    font_file = os.path.join(directory, f"{font}.ttf")
+    with open(font_file, "wb") as f:
+        f.write(font_data(font))
+
+    def run():
+        try:
+            results = upset([font_file], **options)
+            assert results[0]["error"] is None, results[0]["error"]
+        finally:
+            shutil.rmtree(directory)
+
+    return run
+
+
+CASES = {}
+for font, location in (("inconsolata", "wght=400"), ("ysabeau", "wght=400")):
+    CASES[f"subspace.{font}"] = functools.partial(_subspace, font, location)
+for font, features in (("substitution", ["ss01"]), ("ysabeau", ["smcp", "c2sc"]), ("synthetic", ["s000", "s001"])):
+    CASES[f"freeze.{font}"] = functools.partial(_freeze, font, features)
+for font in ("inconsolata", "ysabeau", "substitution"):
+    CASES[f"subset.{font}"] = functools.partial(_subset, font, LATIN)
+CASES["subset.synthetic"] = functools.partial(_subset, "synthetic", None)
+CASES["remap.ysabeau"] = functools.partial(_remap, "ysabeau", ["smcp=>ccmp", "c2sc=>ccmp", "!ss01", "ss02->ccmp"])
+CASES["remap.synthetic"] = functools.partial(_remap, "synthetic", [f"s{i:03d}=>ccmp" for i in range(40)])
+for font in ("inconsolata", "ysabeau", "substitution", "synthetic"):
+    CASES[f"woff2.{font}"] = functools.partial(_woff2, font)
+CASES["upset.ysabeau"] = functools.partial(
+    _upset, "ysabeau", subspace="wght=400", unicodes=LATIN, freeze_features=["smcp"], compress=True
+)
+CASES["upset.inconsolata"] = functools.partial(_upset, "inconsolata", unicodes=LATIN, compress=True)
+# Runs that leave most tables alone, which are loaded lazily or passed through
+CASES["upset.freeze.static"] = functools.partial(_upset, "ysabeau-static", freeze_features=["smcp"])
+CASES["upset.subset.static"] = functools.partial(_upset, "inconsolata-static", unicodes=LATIN)
+CASES["upset.remove.ysabeau"] = functools.partial(_upset, "ysabeau", unicodes=LATIN, remove_features=["smcp", "c2sc"])
@@ -0,0 +1,57 @@
+"""
+Compare two result files of benchmarks.run, e.g. of two commits.
+
+Prints the ratio of the minimum time and of the peak RSS per case (new / old)
+and marks cases that got slower or bigger than the threshold.
+
+    python -m benchmarks.compare before.json after.json --threshold 1.1
+"""
+
+import argparse
+import json
+import sys
+
+
+def compare(old, new, threshold=1.1):
+    """Return one (case, time ratio, RSS ratio, regressed) tuple per case in both results"""
+    rows = []
+    for name, new_result in new["cases"].items():
+        old_result = old["cases"].get(name)
+        if old_result is None or "error" in old_result or "error" in new_result:
+            continue
+        time_ratio = new_result["min"] / old_result["min"]
+        rss_ratio = new_result["peak_rss"] / old_result["peak_rss"]
+        rows.append((name, time_ratio, rss_ratio, time_ratio > threshold or rss_ratio > threshold))
+    return rows
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("old", help="Results of the baseline")
+    parser.add_argument("new", help="Results to compare against the baseline")
+    parser.add_argument(
+        "--threshold", type=float, default=1.1, help="Ratio above which a case counts as regressed. Default is 1.1."
+    )
+    parser.add_argument("--fail", action="store_true", help="Exit with an error code if any case regressed")
+    args = parser.parse_args(args)
+
+    with open(args.old, encoding="utf-8") as f:
+        old = json.load(f)
+    with open(args.new, encoding="utf-8") as f:
+        new = json.load(f)
+
+    print(f"old: {old['metadata']['commit']}, new: {new['metadata']['commit']}")
+    print(f"{'case':<24} {'time':>8} {'peak RSS':>9}")
+    rows = compare(old, new, args.threshold)
+    for name, time_ratio, rss_ratio, regressed in rows:
+        print(f"{name:<24} {time_ratio:>7.2f}x {rss_ratio:>8.2f}x{'  <- regressed' if regressed else ''}")
+
+    missing = sorted(set(old["cases"]) ^ set(new["cases"]))
+    if missing:
+        print(f"Not in both results: {', '.join(missing)}")
+    if args.fail and any(regressed for *_, regressed in rows):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Run the benchmark suite and store the results as JSON, for comparison between commits
+with benchmarks.compare.
+
+Every case runs in its own Python process, so that the peak memory (RSS) of the
+process can be attributed to the case alone.
+
+    python -m benchmarks.run -o before.json
+    python -m benchmarks.run -k subset -k woff2 --repeat 10
+"""
+
+import argparse
+import datetime
+import fnmatch
+import json
+import logging
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+from .cases import CASES, ROOT
+
+
+def run_case(name, repeat):
+    """Time a case in this process. Returns its timings and the peak RSS of the process."""
+    from upsetter.metrics import peak_rss
+
+    timings = []
+    for _ in range(repeat):
+        function = CASES[name]()
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return {"times": timings, "peak_rss": peak_rss()}
+
+
+def run_case_process(name, repeat):
+    """Run a case in a separate Python process"""
+    process = subprocess.run(
+        [sys.executable, "-m", "benchmarks.run", "--case", name, "--repeat", str(repeat)],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+    )
+    if process.returncode:
+        return {"error": process.stderr.strip().splitlines()[-1] if process.stderr.strip() else "failed"}
+    result = json.loads(process.stdout)
+    result.update(min=min(result["times"]), median=statistics.median(result["times"]))
+    return result
+
+
+def metadata():
+    from importlib.metadata import version
+
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "date": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "fonttools": version("fonttools"),
+    }
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-k", action="append", help="Only run cases matching this glob pattern (repeatable)")
+    parser.add_argument("--repeat", type=int, default=5, help="Number of timed runs per case. Default is 5.")
+    parser.add_argument("-o", "--output", help="Write the results to this JSON file")
+    parser.add_argument("--list", action="store_true", help="List the cases and exit")
+    parser.add_argument("--case", help=argparse.SUPPRESS)
+    args = parser.parse_args(args)
+    logging.disable(logging.CRITICAL)
+
+    if args.case:
+        print(json.dumps(run_case(args.case, args.repeat)))
+        return
+
+    names = [name for name in CASES if not args.k or any(fnmatch.fnmatch(name, f"*{k}*") for k in args.k)]
+    if args.list:
+        print("\n".join(names))
+        return
+
+    results = {"metadata": metadata(), "repeat": args.repeat, "cases": {}}
+    print(f"{'case':<24} {'min (s)':>10} {'median (s)':>11} {'peak RSS (MB)':>14}")
+    for name in names:
+        result = results["cases"][name] = run_case_process(name, args.repeat)
+        if "error" in result:
+            print(f"{name:<24} failed: {result['error']}")
+        else:
+            print(f"{name:<24} {result['min']:>10.4f} {result['median']:>11.4f} {result['peak_rss'] / 1024**2:>14.1f}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
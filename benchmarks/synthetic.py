@@ -0,0 +1,69 @@
+"""
+Generate synthetic fonts for benchmarks, with a configurable number of glyphs,
+language systems and layout features.
+"""
+
+import io
+
+
+def build_font(num_glyphs=100, num_scripts=1, num_langs=1, num_features=10, lookups_per_feature=1, contours=0):
+    """Build a TrueType font with num_features GSUB features (tags s000, s001, ...), each with
+    lookups_per_feature single substitution lookups, registered for num_scripts scripts with
+    num_langs language systems each (besides dflt). Every glyph gets a square outline with
+    contours contours, so that the size of the glyf table can be scaled as well.
+    Returns a TTFont read back from the compiled font."""
+    from fontTools.feaLib.builder import addOpenTypeFeaturesFromString
+    from fontTools.fontBuilder import FontBuilder
+    from fontTools.pens.ttGlyphPen import TTGlyphPen
+    from fontTools.ttLib import TTFont
+
+    glyph_order = [".notdef"] + [f"g{i}" for i in range(num_glyphs)]
+    # Encode the first half of the glyphs in the Private Use Area
+    cmap = {0xE000 + i: f"g{i}" for i in range(num_glyphs // 2)}
+
+    glyphs = {}
+    for glyph_name in glyph_order:
+        pen = TTGlyphPen(None)
+        for i in range(contours):
+            x = 10 * i
+            pen.moveTo((x, 0))
+            pen.lineTo((x, 500))
+            pen.lineTo((x + 5, 500))
+            pen.lineTo((x + 5, 0))
+            pen.closePath()
+        glyphs[glyph_name] = pen.glyph()
+
+    fb = FontBuilder(1000, isTTF=True)
+    fb.setupGlyphOrder(glyph_order)
+    fb.setupCharacterMap(cmap)
+    fb.setupGlyf(glyphs)
+    fb.setupHorizontalMetrics({glyph_name: (500, 0) for glyph_name in glyph_order})
+    fb.setupHorizontalHeader(ascent=800, descent=-200)
+    fb.setupNameTable({"familyName": "Synthetic", "styleName": "Regular"})
+    fb.setupOS2()
+    fb.setupPost()
+
+    fea = ["languagesystem DFLT dflt;"]
+    for script in range(num_scripts):
+        script_tag = f"s{script:03d}"
+        fea.append(f"languagesystem {script_tag} dflt;")
+        for lang in range(num_langs):
+            fea.append(f"languagesystem {script_tag} L{lang:03d};")
+
+    half = num_glyphs // 2
+    for feature in range(num_features):
+        lookups = []
+        for i in range(lookups_per_feature):
+            lookup = f"F{feature}L{i}"
+            source = feature * lookups_per_feature + i
+            fea.append(
+                f"lookup {lookup} {{ sub g{source % half} by g{half + source % (num_glyphs - half)}; }} {lookup};"
+            )
+            lookups.append(f"lookup {lookup};")
+        fea.append(f"feature s{feature:03d} {{ {' '.join(lookups)} }} s{feature:03d};")
+    addOpenTypeFeaturesFromString(fb.font, "\n".join(fea))
+
+    stream = io.BytesIO()
+    fb.font.save(stream)
+    stream.seek(0)
+    return TTFont(stream)
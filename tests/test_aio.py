@@ -0,0 +1,49 @@
+import asyncio
+import threading
+
+import pytest
+
+from upsetter import upset_bytes
+from upsetter.aio import AsyncUpsetter, Overloaded
+
+FONT = "tests/fonts/SubstitutionTest-Regular.ttf"
+
+
+def test_upset_bytes(monkeypatch):
+    monkeypatch.setenv("SOURCE_DATE_EPOCH", "0")
+    data = open(FONT, "rb").read()
+    options = dict(unicodes="U+0041-005A", freeze_features=["ss01"], flavors=[None, "woff2"])
+
+    async def main():
+        async with AsyncUpsetter(max_workers=2) as upsetter:
+            return await asyncio.gather(*(upsetter.upset_bytes(data, **options) for _ in range(3)))
+
+    expected = upset_bytes(data, **options)
+    assert asyncio.run(main()) == [expected] * 3
+
+
+def test_backpressure_and_cancellation():
+    release = threading.Event()
+
+    async def main():
+        async with AsyncUpsetter("thread", max_workers=1, max_queue=1) as upsetter:
+            running = asyncio.ensure_future(upsetter.run(release.wait))
+            waiting = asyncio.ensure_future(upsetter.run(lambda: "done"))
+            await asyncio.sleep(0.05)
+            assert upsetter.stats() == {"running": 1, "waiting": 1, "max_concurrency": 1}
+            with pytest.raises(Overloaded):
+                await upsetter.run(lambda: None)
+
+            # A waiting job is withdrawn, its slot isn't taken
+            waiting.cancel()
+            await asyncio.sleep(0)
+            assert upsetter.stats()["waiting"] == 0
+            # A running job can't be interrupted and keeps its slot until it ends
+            running.cancel()
+            await asyncio.sleep(0.05)
+            assert upsetter.stats()["running"] == 1
+            release.set()
+            assert await upsetter.run(lambda: "next") == "next"
+            assert upsetter.stats()["running"] == 0
+
+    asyncio.run(main())
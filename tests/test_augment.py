@@ -0,0 +1,40 @@
+import io
+import os
+
+import pytest
+from fontTools.ttLib import TTFont
+
+from upsetter import font_subset
+from upsetter.augment import Augmenter, apply_patch, make_patch
+
+
+def test_augment(monkeypatch):
+    monkeypatch.setenv("SOURCE_DATE_EPOCH", "0")
+    with open("tests/fonts/Inconsolata[wdth,wght].ttf", "rb") as f:
+        data = f.read()
+    stream = io.BytesIO()
+    font_subset(TTFont(io.BytesIO(data)), "U+0020-007E,U+00C0-00FF", inplace=True).save(stream)
+
+    augmenter = Augmenter(data)
+    base = augmenter.subset("U+0020-007E")
+    augmented = augmenter.augment("U+0020-007E", range(0xC0, 0x100))
+    assert augmented == stream.getvalue()
+
+    patch = augmenter.patch("U+0020-007E", "U+00C0-00FF")
+    assert len(patch) < len(augmented) / 4
+    assert apply_patch(base, patch) == augmented
+    with pytest.raises(AssertionError):
+        apply_patch(augmented, patch)
+
+
+def test_patch():
+    base = bytes(range(256)) * 4
+    for target in (b"", base, base[100:700] + b"new" + base[:50], b"short"):
+        assert apply_patch(base, make_patch(base, target)) == target
+
+    # Matches at offsets of base that aren't indexed are found as well
+    base = os.urandom(4096)
+    target = b"new" + base[5:1000] + base[2003:4000]
+    patch = make_patch(base, target)
+    assert apply_patch(base, patch) == target
+    assert len(patch) < 100
@@ -0,0 +1,40 @@
+import os
+import shutil
+import sys
+
+import pytest
+
+from upsetter import upset
+from upsetter.cli import main
+
+
+def test_parallel_batch_collects_errors(tmp_path):
+    font_files = []
+    for i in range(3):
+        font_file = str(tmp_path / f"SubstitutionTest-{i}.ttf")
+        shutil.copy("tests/fonts/SubstitutionTest-Regular.ttf", font_file)
+        font_files.append(font_file)
+    broken_file = str(tmp_path / "Broken.ttf")
+    with open(broken_file, "wb") as f:
+        f.write(b"not a font")
+    font_files.insert(1, broken_file)
+
+    results = upset(font_files, freeze_features=["ss01"], compress=True, jobs=2)
+
+    assert [result["font_file"] for result in results] == font_files
+    assert results[1]["error"] and results[1]["outputs"] == []
+    for result in results[:1] + results[2:]:
+        assert result["error"] is None
+        assert result["outputs"] == [
+            result["font_file"].replace(".ttf", ".upset.ttf"),
+            result["font_file"].replace(".ttf", ".upset.woff2"),
+        ]
+        assert all(os.path.exists(output) for output in result["outputs"])
+
+
+@pytest.mark.parametrize("option", ["--jobs", "--compress-jobs"])
+def test_negative_jobs_rejected(monkeypatch, capsys, option):
+    monkeypatch.setattr(sys, "argv", ["upsetter", "tests/fonts/SubstitutionTest-Regular.ttf", option, "-1"])
+    with pytest.raises(SystemExit):
+        main()
+    assert "Must be 0 or more: -1" in capsys.readouterr().err
@@ -0,0 +1,68 @@
+import logging
+import os
+import shutil
+import sys
+
+import pytest
+
+from upsetter.build import MANIFEST, build
+from upsetter.cli import main
+
+
+def test_incremental_build(tmp_path):
+    src, out = tmp_path / "src", tmp_path / "out"
+    (src / "sub").mkdir(parents=True)
+    shutil.copy("tests/fonts/SubstitutionTest-Regular.ttf", str(src / "a.ttf"))
+    shutil.copy("tests/fonts/SubstitutionTest-Regular.ttf", str(src / "sub" / "b.ttf"))
+    options = dict(freeze_features=["ss01"], compress=True)
+
+    log = build([str(src)], str(out), **options)
+    assert [(record["reason"], os.path.relpath(record["output"], out)) for record in log["built"]] == [
+        ("new", "a.ttf"),
+        ("new", os.path.join("sub", "b.ttf")),
+    ]
+    assert (out / "sub" / "b.woff2").exists() and (out / MANIFEST).exists()
+
+    # Nothing changed
+    log = build([str(src)], str(out), **options)
+    assert not log["built"] and len(log["skipped"]) == 2
+
+    # Changed input, deleted output
+    (src / "a.ttf").write_bytes(open("tests/fonts/SubstitutionTest-Regular.ttf", "rb").read() + b"\0")
+    os.remove(out / "sub" / "b.woff2")
+    log = build([str(src)], str(out), jobs=2, **options)
+    assert [record["reason"] for record in log["built"]] == ["input changed", "output missing or modified"]
+
+    # Changed options
+    log = build([str(src)], str(out), freeze_features=["ss02"], compress=True)
+    assert [record["reason"] for record in log["built"]] == ["options changed", "options changed"]
+
+
+def test_build_several_inputs(tmp_path, caplog):
+    out = tmp_path / "out"
+    for name in ("a", "b"):
+        (tmp_path / name).mkdir()
+        shutil.copy("tests/fonts/SubstitutionTest-Regular.ttf", str(tmp_path / name / f"{name}.ttf"))
+    options = dict(freeze_features=["ss01"], cache_dir=str(tmp_path / "cache"))
+
+    with caplog.at_level(logging.INFO):
+        assert len(build([str(tmp_path / "a")], str(out), **options)["built"]) == 1
+    assert "Cache: 0 hits" in caplog.text
+    assert len(build([str(tmp_path / "b")], str(out), **options)["built"]) == 1
+    # The manifest still has the entries of the other input
+    log = build([str(tmp_path / "a")], str(out), **options)
+    assert not log["built"] and len(log["skipped"]) == 1
+
+
+def test_build_conflicting_outputs(tmp_path, monkeypatch, capsys):
+    for name in ("a", "b"):
+        (tmp_path / name).mkdir()
+        shutil.copy("tests/fonts/SubstitutionTest-Regular.ttf", str(tmp_path / name / "font.ttf"))
+    inputs = [str(tmp_path / "a"), str(tmp_path / "b")]
+    with pytest.raises(ValueError, match="Several fonts map to the same output"):
+        build(inputs, str(tmp_path / "out"))
+
+    monkeypatch.setattr(sys, "argv", ["upsetter", *inputs, "--out-dir", str(tmp_path / "out")])
+    with pytest.raises(SystemExit):
+        main()
+    assert "error: Several fonts map to the same output" in capsys.readouterr().err
@@ -0,0 +1,36 @@
+import io
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+
+from upsetter import upset_bytes, upset_file
+from upsetter.compress import compress_bytes
+
+
+def test_bytes_match_files(tmp_path, monkeypatch):
+    monkeypatch.setenv("SOURCE_DATE_EPOCH", "0")
+    font_file = str(tmp_path / "SubstitutionTest-Regular.ttf")
+    shutil.copy("tests/fonts/SubstitutionTest-Regular.ttf", font_file)
+    options = dict(unicodes="U+0061-0063", freeze_features=["ss01"])
+    ttf_file, woff2_file = upset_file(font_file, compress=True, **options)
+
+    monkeypatch.chdir(tmp_path)
+    files = sorted(os.listdir())
+    data = open(font_file, "rb").read()
+    outputs = upset_bytes(io.BytesIO(data), flavors=[None, "woff2"], **options)
+
+    assert sorted(os.listdir()) == files
+    assert outputs[None] == open(ttf_file, "rb").read()
+    assert outputs["woff2"] == open(woff2_file, "rb").read()
+    assert upset_bytes(data, **options) == {None: outputs[None]}
+
+
+def test_concurrent_compression_quality():
+    data = open("tests/fonts/SubstitutionTest-Regular.ttf", "rb").read()
+    expected = {quality: compress_bytes(data, quality=quality) for quality in (0, 11)}
+    assert expected[0] != expected[11]
+
+    with ThreadPoolExecutor(8) as executor:
+        qualities = [0, 11] * 16
+        results = list(executor.map(lambda quality: compress_bytes(data, quality=quality), qualities))
+    assert results == [expected[quality] for quality in qualities]
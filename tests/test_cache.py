@@ -0,0 +1,65 @@
+import os
+import shutil
+
+from upsetter import upset, upset_file
+from upsetter.cache import StageCache
+
+
+def test_cache_reuses_stage_results(tmp_path):
+    font_file = str(tmp_path / "SubstitutionTest-Regular.ttf")
+    shutil.copy("tests/fonts/SubstitutionTest-Regular.ttf", font_file)
+    cache_dir = str(tmp_path / "cache")
+    options = dict(freeze_features=["ss01"], compress=True, cache_dir=cache_dir)
+
+    (result,) = upset([font_file], **options)
+    first = [open(output, "rb").read() for output in result["outputs"]]
+    os.remove(result["outputs"][0])
+
+    # Same options: everything comes from the cache
+    (result,) = upset([font_file], **options)
+    assert result["error"] is None
+    assert [open(output, "rb").read() for output in result["outputs"]] == first
+
+    # Different subset options: only the subset stage runs again
+    cache = StageCache(cache_dir)
+    upset_options = dict(options, unicodes="U+0061")
+    del upset_options["cache_dir"]
+    upset_file(font_file, cache=cache, **upset_options)
+    assert cache.hits["freeze"] == 1
+    assert cache.misses["subset"] == 1
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    cache = StageCache(str(tmp_path), max_size=1000)
+    for i, key in enumerate(["a" * 64, "b" * 64, "c" * 64]):
+        cache.put(key, bytes(100))
+        os.utime(cache._path(key), (i, i))
+
+    # Reading an entry marks it as recently used
+    assert cache.get("subset", "a" * 64) is not None
+
+    cache.max_size = 250
+    cache.evict()
+    assert cache.get("subset", "a" * 64) is not None
+    assert cache.get("subset", "b" * 64) is None
+    assert cache.get("subset", "c" * 64) is not None
+    assert cache.size == 200
+
+
+def test_cache_tracks_size(tmp_path, monkeypatch):
+    StageCache(str(tmp_path)).put("a" * 64, bytes(100))
+    cache = StageCache(str(tmp_path), max_size=350)
+    cache.put("b" * 64, bytes(100))
+    assert cache.size == 200
+
+    # Writes under the limit don't walk the cache, overwriting an entry replaces its size
+    walks = []
+    monkeypatch.setattr(os, "walk", lambda *args: walks.append(args) or iter(()))
+    cache.put("b" * 64, bytes(150))
+    assert cache.size == 250 and not walks
+    monkeypatch.undo()
+
+    os.utime(cache._path("a" * 64), (0, 0))
+    cache.put("c" * 64, bytes(150))
+    assert cache.size == 300
+    assert cache.get("subset", "a" * 64) is None
@@ -0,0 +1,52 @@
+import io
+
+import pytest
+from fontTools.pens.recordingPen import DecomposingRecordingPen
+from fontTools.ttLib import TTFont
+
+from upsetter import font_compact, font_subset, font_subspace
+from upsetter.compact import compact, parse_techniques
+
+
+def _outlines(ttFont):
+    glyph_set = ttFont.getGlyphSet()
+    outlines = {}
+    for glyph_name in ttFont.getGlyphOrder():
+        pen = DecomposingRecordingPen(glyph_set)
+        glyph_set[glyph_name].draw(pen)
+        outlines[glyph_name] = pen.value
+    return outlines
+
+
+def test_parse_techniques():
+    assert parse_techniques("iup,dehint") == ["dehint", "iup"]
+    assert parse_techniques("all")[0] == "dehint"
+    with pytest.raises(AssertionError):
+        parse_techniques("dehint,squash")
+
+
+def test_iup():
+    ttFont = font_subset(TTFont("tests/fonts/Inconsolata[wdth,wght].ttf"), "U+0020-007E")
+    before = _outlines(font_subspace(ttFont, {"wght": 700, "wdth": 100}))
+    assert compact(ttFont, "iup")["iup"]["saved"] > 0
+    assert _outlines(font_subspace(ttFont, {"wght": 700, "wdth": 100})) == before
+
+
+def test_dehint():
+    ttFont = font_subspace(TTFont("tests/fonts/Inconsolata[wdth,wght].ttf"), {"wght": 400, "wdth": 100})
+    savings = compact(ttFont, "dehint,iup")
+    assert savings["dehint"]["saved"] > 0
+    # Not a variable font anymore
+    assert savings["iup"]["saved"] == 0
+
+
+def test_dehint_and_flatten():
+    ttFont = font_subspace(TTFont("tests/fonts/Inconsolata[wdth,wght].ttf"), {"wght": 400, "wdth": 100})
+    before = _outlines(ttFont)
+    ttFont = font_compact(ttFont, "dehint,flatten")
+    assert "fpgm" not in ttFont
+    stream = io.BytesIO()
+    ttFont.save(stream)
+    ttFont = TTFont(stream)
+    assert ttFont["maxp"].maxComponentDepth == 1
+    assert _outlines(ttFont) == before
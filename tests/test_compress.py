@@ -0,0 +1,51 @@
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+
+from fontTools.ttLib import TTFont, sfnt, woff2
+
+from upsetter import upset
+from upsetter.compress import compress_bytes, compress_file
+
+
+def test_compress_quality(tmp_path):
+    font_file = str(tmp_path / "SubstitutionTest-Regular.ttf")
+    shutil.copy("tests/fonts/SubstitutionTest-Regular.ttf", font_file)
+
+    (fast,) = compress_file(font_file, quality=0)
+    shutil.move(fast["output"], str(tmp_path / "fast.woff2"))
+    best, woff = compress_file(font_file, woff=True)
+    assert best["output_size"] < fast["output_size"]
+    assert woff["output"].endswith(".woff") and woff["ratio"] < 1
+
+    # Compression effort doesn't change the font itself
+    source = TTFont(font_file)
+    for output in (str(tmp_path / "fast.woff2"), best["output"], woff["output"]):
+        compressed = TTFont(output)
+        assert compressed.getBestCmap() == source.getBestCmap()
+        assert compressed["GSUB"].compile(compressed) == source["GSUB"].compile(source)
+
+
+def test_compress_restores_fonttools():
+    originals = woff2.brotli, sfnt.compress
+    with open("tests/fonts/SubstitutionTest-Regular.ttf", "rb") as f:
+        data = f.read()
+    with ThreadPoolExecutor(4) as executor:
+        sizes = list(executor.map(lambda quality: len(compress_bytes(data, "woff", quality)), [0, 9] * 4))
+    assert sizes[0] > sizes[1] and len(set(sizes)) == 2
+    assert (woff2.brotli, sfnt.compress) == originals
+
+
+def test_compression_overlaps_processing(tmp_path):
+    font_files = []
+    for i in range(3):
+        font_files.append(str(tmp_path / f"SubstitutionTest-{i}.ttf"))
+        shutil.copy("tests/fonts/SubstitutionTest-Regular.ttf", font_files[-1])
+    font_files.append(str(tmp_path / "broken.ttf"))
+    (tmp_path / "broken.ttf").write_bytes(b"not a font")
+
+    results = upset(font_files, compress=True, woff=True, compress_quality=5, compress_jobs=2)
+
+    assert [result["error"] is None for result in results] == [True, True, True, False]
+    for font_file, result in zip(font_files, results[:3]):
+        stem = font_file[: -len(".ttf")]
+        assert result["outputs"] == [f"{stem}.upset.ttf", f"{stem}.upset.woff2", f"{stem}.upset.woff"]
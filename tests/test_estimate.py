@@ -0,0 +1,36 @@
+from fontTools.ttLib import TTFont
+
+from upsetter import font_subset
+from upsetter.estimate import SizeEstimator
+
+
+def test_glyph_closure():
+    ttFont = TTFont("tests/fonts/Ysabeau[wght].ttf")
+    estimator = SizeEstimator(ttFont, calibrate=False)
+    for unicodes in ("U+0041", "U+0020-007E"):
+        subset = set(font_subset(ttFont, unicodes).getGlyphOrder())
+        estimated = estimator.glyphs(unicodes)
+        # Contextual substitutions are included regardless of their context
+        assert subset <= estimated
+        assert len(estimated) <= len(subset) * 1.05
+
+
+def test_estimate():
+    ttFont = TTFont("tests/fonts/Ysabeau[wght].ttf")
+    estimator = SizeEstimator(ttFont)
+    assert 0 < estimator.error_bound < 0.1
+    # Slices shaped like the calibration samples are within the error bound
+    for unicodes in ("U+0041", "U+0020-007E", "U+0100-017F"):
+        estimate = estimator.estimate(unicodes)
+        actual = estimator.measure(ttFont, unicodes)
+        assert abs(estimate["size"] / actual - 1) <= estimator.error_bound
+    assert estimator.estimate([0x41, 0x42, 0x10FFFF])["unicodes"] == 2
+
+
+def test_estimate_compressed():
+    ttFont = TTFont("tests/fonts/Inconsolata[wdth,wght].ttf")
+    estimator = SizeEstimator(ttFont, flavor="woff2", quality=5)
+    for unicodes in ("U+0041", "U+0020-007E", "U+2500-257F"):
+        estimate = estimator.estimate(unicodes)
+        actual = estimator.measure(ttFont, unicodes)
+        assert abs(estimate["size"] / actual - 1) <= estimator.error_bound
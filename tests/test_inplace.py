@@ -0,0 +1,59 @@
+import io
+
+import pytest
+from fontTools.ttLib import TTFont
+from fontTools.varLib.instancer import parseLimits
+
+from upsetter import font_freeze_features, font_subset, font_subspace, upset_font
+
+CASES = [
+    ("tests/fonts/SubstitutionTest-Regular.ttf", dict(freeze_features=["ss01"], name="SC")),
+    (
+        "tests/fonts/Ysabeau[wght].ttf",
+        dict(subspace="wght=400", freeze_features=["ss01", "smcp"], remove_features=["ss02"], unicodes="U+0020-007E"),
+    ),
+    ("tests/fonts/Inconsolata[wdth,wght].ttf", dict(subspace="wght=300:500", freeze_features=["zero"])),
+]
+
+
+def compile_font(ttFont):
+    stream = io.BytesIO()
+    ttFont.save(stream)
+    return stream.getvalue()
+
+
+@pytest.mark.parametrize("font_file,options", CASES)
+def test_inplace_matches_copying_stages(font_file, options):
+    subspace = parseLimits(options["subspace"].split(",")) if options.get("subspace") else None
+
+    # Copying path, stage by stage, as used before the in-place pipeline existed
+    source = TTFont(font_file, recalcTimestamp=False)
+    ttFont = source
+    if subspace:
+        ttFont = font_subspace(ttFont, subspace)
+    ttFont = font_freeze_features(ttFont, options["freeze_features"], options.get("name", ""))
+    ttFont = font_subset(ttFont, options.get("unicodes"), options.get("remove_features"))
+    assert ttFont is not source
+    copied = compile_font(ttFont)
+
+    # In-place path
+    source = TTFont(font_file, recalcTimestamp=False)
+    ttFont = upset_font(
+        source,
+        unicodes=options.get("unicodes"),
+        subspace=subspace,
+        freeze_features=options["freeze_features"],
+        remove_features=options.get("remove_features"),
+        name=options.get("name", ""),
+    )
+    assert ttFont is source
+    inplace = compile_font(ttFont)
+
+    assert copied == inplace
+
+
+def test_copying_pipeline_preserves_input():
+    source = TTFont("tests/fonts/SubstitutionTest-Regular.ttf", recalcTimestamp=False)
+    before = compile_font(source)
+    upset_font(source, freeze_features=["ss01"], inplace=False)
+    assert compile_font(source) == before
@@ -0,0 +1,55 @@
+import shutil
+
+from fontTools.ttLib import TTFont
+
+from upsetter.instances import _stat_covers_location, instance_file, named_instances
+
+
+def test_named_instances_deduplicated():
+    instances = named_instances(TTFont("tests/fonts/Inconsolata[wdth,wght].ttf"))
+    assert len(instances) == len(set(instances))
+    assert instances["Regular"] == {"wdth": 100, "wght": 400}
+
+
+def test_stat_covers_location():
+    ttFont = TTFont("tests/fonts/Ysabeau[wght].ttf")
+    assert _stat_covers_location(ttFont, {"wght": 700})
+    assert not _stat_covers_location(ttFont, {"wght": 350})
+    # Partial instances are named after the default location
+    assert _stat_covers_location(ttFont, {"wght": (300, 700)})
+    assert not _stat_covers_location(ttFont, {"wght": (1, 350)})
+
+
+def test_instance_file(tmp_path):
+    font_file = str(tmp_path / "Ysabeau.ttf")
+    shutil.copy("tests/fonts/Ysabeau[wght].ttf", font_file)
+    results = instance_file(
+        font_file,
+        instances=["Bold", "wght=300", "wght=350"],
+        unicodes="U+0020-007E",
+        freeze_features=["smcp"],
+        jobs=2,
+    )
+    assert [(result["instance"], result["error"]) for result in results] == [
+        ("Bold", None),
+        ("wght300", None),
+        ("wght350", None),
+    ]
+    assert results[0]["outputs"] == [str(tmp_path / "Ysabeau.upset.Bold.ttf")]
+
+    bold = TTFont(results[0]["outputs"][0])
+    assert "fvar" not in bold
+    assert bold["OS/2"].usWeightClass == 700
+    assert bold["name"].getDebugName(2) == "Bold"
+    assert bold.getBestCmap()[ord("a")] == TTFont(results[1]["outputs"][0]).getBestCmap()[ord("a")]
+    assert "smcp" not in {record.FeatureTag for record in bold["GSUB"].table.FeatureList.FeatureRecord}
+
+    # STAT has no axis value for wght=350, so its names are kept
+    assert TTFont(results[2]["outputs"][0])["OS/2"].usWeightClass == 350
+    # The frozen font the instances are made from is removed again
+    assert sorted(path.name for path in tmp_path.iterdir()) == [
+        "Ysabeau.ttf",
+        "Ysabeau.upset.Bold.ttf",
+        "Ysabeau.upset.wght300.ttf",
+        "Ysabeau.upset.wght350.ttf",
+    ]
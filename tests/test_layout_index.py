@@ -0,0 +1,20 @@
+from fontTools.ttLib import TTFont
+
+from upsetter.layout_index import LayoutIndex
+
+
+def test_layout_index():
+    ttFont = TTFont("tests/fonts/SubstitutionTest-Regular.ttf")
+    index = LayoutIndex(ttFont)
+
+    assert index.feature_tags("GSUB") == ["aalt", "ss01", "ss02", "ss03"]
+    assert index.feature_lookup_types("ss01", "GPOS") == {2}
+    assert index.cmap_freezable_features(["ss01", "ss02", "ss03", "ss01"]) == ["ss01"]
+    for glyph_name, codepoints in index.reverse_cmap.items():
+        assert all(index.cmap[codepoint] == glyph_name for codepoint in codepoints)
+
+    unencoded = set(ttFont.getGlyphOrder()) - index.encoded_glyphs
+    reachable = index.reachable_glyphs(index.encoded_glyphs)
+    assert index.encoded_glyphs < reachable
+    assert all(index.reachable_glyphs([glyph_name]) <= reachable for glyph_name in index.substitutions)
+    assert len(reachable & unencoded) == 3
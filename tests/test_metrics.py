@@ -0,0 +1,55 @@
+import pstats
+import shutil
+
+import pytest
+from fontTools.ttLib import TTFont
+
+from upsetter import upset, upset_font
+from upsetter.metrics import Metrics, peak_rss, stage
+
+
+def test_metrics_per_stage_and_font(tmp_path):
+    font_files = []
+    for i in range(2):
+        font_files.append(str(tmp_path / f"SubstitutionTest-{i}.ttf"))
+        shutil.copy("tests/fonts/SubstitutionTest-Regular.ttf", font_files[-1])
+
+    records = []
+    metrics = Metrics(profile=["subset"], trace_memory=True, callbacks=[records.append])
+    upset(font_files, freeze_features=["ss01"], compress=True, jobs=2, metrics=metrics)
+
+    assert records == metrics.records
+    for font_file in font_files:
+        stages = [record["stage"] for record in records if record["font_file"] == font_file]
+        assert stages == ["load", "freeze", "subset", "save", "compress"]
+        pstats.Stats(f"{font_file}.subset.prof")
+    assert all(record["wall"] >= 0 and record["peak_rss"] > 0 and "peak_traced" in record for record in records)
+    assert metrics.summary()["subset"]["count"] == 2
+
+
+def test_metrics_around_library_calls():
+    metrics = Metrics()
+    with metrics.activate("SubstitutionTest-Regular.ttf"):
+        upset_font(TTFont("tests/fonts/SubstitutionTest-Regular.ttf"), freeze_features=["ss01"])
+    upset_font(TTFont("tests/fonts/SubstitutionTest-Regular.ttf"))
+
+    assert [record["stage"] for record in metrics.records] == ["freeze", "subset"]
+    assert "subset" in metrics.report()
+
+
+def test_peak_rss_per_stage():
+    metrics = Metrics()
+    with metrics.activate("font.ttf"):
+        with stage("load"):
+            with stage("subset"):
+                allocated = bytearray(100 * 1024**2)
+                allocated[::4096] = b"x" * len(allocated[::4096])
+                del allocated
+        with stage("save"):
+            pass
+    subset, load, save = metrics.records
+    if save["peak_rss"] is None:
+        pytest.skip("Resetting the peak memory isn't supported")
+    # The enclosing stage includes the peak of the nested one, a later stage doesn't
+    assert load["peak_rss"] >= subset["peak_rss"] > save["peak_rss"] + 90 * 1024**2
+    assert peak_rss() >= load["peak_rss"]
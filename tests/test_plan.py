@@ -0,0 +1,35 @@
+import io
+
+from fontTools.ttLib import TTFont
+
+from upsetter import font_subset, upset_bytes, upset_font
+from upsetter.plan import open_font, passthrough_tables, table_plan
+
+FONT = "tests/fonts/Inconsolata[wdth,wght].ttf"
+
+
+def test_table_plan():
+    tags = TTFont(FONT).keys()
+    plan = table_plan(tags, freeze_features=["zero"])
+    assert list(plan) == ["freeze", "subset"]
+    assert plan["freeze"] == {"GSUB", "GPOS", "GDEF", "cmap", "post"}
+    assert {"glyf", "loca", "gvar", "hmtx", "hhea"} <= plan["subset"]
+    assert {"fpgm", "prep", "fvar", "STAT"} <= set(passthrough_tables(tags, plan))
+    # Instancing changes everything
+    assert passthrough_tables(tags, table_plan(tags, subspace={"wght": 400})) == []
+
+
+def test_passthrough(monkeypatch):
+    monkeypatch.setenv("SOURCE_DATE_EPOCH", "0")
+    with open(FONT, "rb") as f:
+        data = f.read()
+
+    ttFont = upset_font(open_font(data), unicodes="U+0020-007E")
+    # Decompiled to prune the name table, but passed through as they are
+    assert not ttFont.isLoaded("fpgm") and not ttFont.isLoaded("STAT")
+    assert ttFont.reader["fpgm"] == TTFont(FONT).reader["fpgm"]
+
+    # The same as compiling every table of an eagerly loaded font
+    stream = io.BytesIO()
+    font_subset(TTFont(io.BytesIO(data), lazy=False), "U+0020-007E", inplace=True).save(stream)
+    assert upset_bytes(data, unicodes="U+0020-007E")[None] == stream.getvalue()
@@ -0,0 +1,118 @@
+import io
+
+import pytest
+from fontTools.ttLib import TTFont
+
+from upsetter import upset_font
+from upsetter.prune import prune_layout
+
+TEXT = "Zażółć gęślą jaźń. Ärger über Öl, “Quote” – AVA fi ffl Tŷ 1/2 Wa Te Yo"
+
+
+def shape(data, text):
+    hb = pytest.importorskip("uharfbuzz")
+    font = hb.Font(hb.Face(data))
+    buffer = hb.Buffer()
+    buffer.add_str(text)
+    buffer.guess_segment_properties()
+    hb.shape(font, buffer)
+    names = [font.glyph_to_string(info.codepoint) for info in buffer.glyph_infos]
+    positions = [(p.x_advance, p.x_offset, p.y_offset) for p in buffer.glyph_positions]
+    return list(zip(names, positions))
+
+
+def upset(prune):
+    ttFont = upset_font(
+        TTFont("tests/fonts/Ysabeau[wght].ttf"),
+        unicodes="U+0020-017F,U+2013,U+201C,U+201D",
+        subspace={"wght": 400},
+        freeze_features=["smcp"],
+        keep_glyph_names=True,
+        prune_layout=prune,
+    )
+    stream = io.BytesIO()
+    ttFont.save(stream)
+    return stream.getvalue()
+
+
+def test_prune_layout_keeps_shaping(monkeypatch):
+    monkeypatch.setenv("SOURCE_DATE_EPOCH", "0")
+    unpruned, pruned = upset(False), upset(True)
+    assert len(pruned) < len(unpruned) * 0.9
+    assert len(TTFont(io.BytesIO(pruned)).getGlyphOrder()) < len(TTFont(io.BytesIO(unpruned)).getGlyphOrder())
+    assert shape(pruned, TEXT) == shape(unpruned, TEXT)
+    assert shape(pruned, TEXT.upper()) == shape(unpruned, TEXT.upper())
+
+
+def test_prune_layout_without_frozen_features():
+    ttFont = TTFont("tests/fonts/SubstitutionTest-Regular.ttf")
+    report = prune_layout(ttFont)
+    assert report["dead_glyphs"] == [] and report["removed_lookups"] == {}
+
+
+def build_font(features, order=None):
+    """Font with the glyphs a-d and these features, with the GSUB lookups in the given order"""
+    from fontTools.feaLib.builder import addOpenTypeFeaturesFromString
+    from fontTools.fontBuilder import FontBuilder
+    from fontTools.pens.ttGlyphPen import TTGlyphPen
+
+    glyphs = [".notdef", "a", "b", "c", "d"]
+    builder = FontBuilder(1000, isTTF=True)
+    builder.setupGlyphOrder(glyphs)
+    builder.setupCharacterMap({ord("a"): "a", ord("c"): "c"})
+    builder.setupGlyf({glyph: TTGlyphPen(None).glyph() for glyph in glyphs})
+    builder.setupHorizontalMetrics({glyph: (500, 0) for glyph in glyphs})
+    builder.setupHorizontalHeader()
+    builder.setupPost()
+    addOpenTypeFeaturesFromString(builder.font, features)
+    if order:
+        table = builder.font["GSUB"].table
+        table.LookupList.Lookup = [table.LookupList.Lookup[index] for index in order]
+        for record in table.FeatureList.FeatureRecord:
+            record.Feature.LookupListIndex = [order.index(index) for index in record.Feature.LookupListIndex]
+        for lookup in table.LookupList.Lookup:
+            for subtable in lookup.SubTable:
+                for record in getattr(subtable, "SubstLookupRecord", []):
+                    record.LookupListIndex = order.index(record.LookupListIndex)
+    stream = io.BytesIO()
+    builder.save(stream)
+    return stream.getvalue()
+
+
+def pruned(data):
+    ttFont = TTFont(io.BytesIO(data))
+    report = prune_layout(ttFont)
+    stream = io.BytesIO()
+    ttFont.save(stream)
+    return report, ttFont, stream.getvalue()
+
+
+def test_prune_layout_keeps_nested_lookups():
+    # Lookups in the order [calt, ccmp, nested]: the nested lookup comes after ccmp, but runs before it
+    unpruned = build_font(
+        """
+        lookup nested { sub a by d; } nested;
+        lookup always { sub a by b; } always;
+        feature calt { sub c a' lookup nested; } calt;
+        feature ccmp { lookup always; } ccmp;
+        """,
+        order=[2, 1, 0],
+    )
+    report, ttFont, data = pruned(unpruned)
+    assert report["dead_glyphs"] == ["a"]
+    assert len(ttFont["GSUB"].table.LookupList.Lookup) == 3
+    assert [name for name, _ in shape(data, "ca")] == ["c", "d"]
+    assert shape(data, "ca") == shape(unpruned, "ca")
+
+
+def test_prune_layout_keeps_early_features():
+    # rvrn comes after ccmp in the lookup list, but shapers apply it in a stage before ccmp
+    unpruned = build_font("""
+        feature ccmp { sub a by b; } ccmp;
+        feature rvrn { sub a by d; } rvrn;
+        """)
+    report, ttFont, data = pruned(unpruned)
+    assert report["dead_glyphs"] == ["a"]
+    assert len(ttFont["GSUB"].table.LookupList.Lookup) == 2
+    assert [name for name, _ in shape(data, "a")] == ["d"]
+    assert shape(data, "a") == shape(unpruned, "a")
@@ -0,0 +1,23 @@
+from fontTools.ttLib import TTFont
+
+from upsetter.remap_layout import delete_feature, parse_command, remap, remap_lookups
+
+COMMANDS = ["ss01=>ccmp", "smcp=>ccmp", "c2sc->|ccmp", "!liga", "*/*/ss02=>ss03", "onum->calt"]
+
+
+def test_batched_remap_matches_single_commands():
+    expected = TTFont("tests/fonts/Ysabeau[wght].ttf")
+    tables = [expected[tag].table for tag in ("GSUB", "GPOS")]
+    for command in map(parse_command, COMMANDS):
+        for table in tables:
+            if command[0] == "delete":
+                delete_feature(table, *command[1])
+            else:
+                _, src, dst, operation, start = command
+                remap_lookups(table, src, dst, operation=operation, start=start)
+
+    ttFont = TTFont("tests/fonts/Ysabeau[wght].ttf")
+    remap(ttFont, COMMANDS)
+
+    for tag in ("GSUB", "GPOS"):
+        assert ttFont[tag].compile(ttFont) == expected[tag].compile(expected)
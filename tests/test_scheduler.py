@@ -0,0 +1,58 @@
+import os
+import shutil
+import signal
+
+from upsetter import upset
+from upsetter.instances import instance_file
+from upsetter.scheduler import WORKER_MEMORY, estimate_memory, run_scheduled
+from upsetter.slicer import slice_fonts
+
+
+def _killed(font_file):
+    os.kill(os.getpid(), signal.SIGKILL)
+
+
+def test_estimate_memory():
+    small = estimate_memory("tests/fonts/SubstitutionTest-Regular.ttf")
+    assert WORKER_MEMORY < small < estimate_memory("tests/fonts/Ysabeau[wght].ttf")
+
+
+def test_memory_budget(tmp_path):
+    font_files = []
+    for font in ("SubstitutionTest-Regular.ttf", "Ysabeau[wght].ttf"):
+        font_file = str(tmp_path / font)
+        shutil.copy(f"tests/fonts/{font}", font_file)
+        font_files.append(font_file)
+    broken_file = str(tmp_path / "Broken.ttf")
+    with open(broken_file, "wb") as f:
+        f.write(b"not a font")
+    font_files.insert(1, broken_file)
+
+    # Every font needs more than the budget, so they run one at a time
+    results = upset(font_files, unicodes="U+0041-005A", jobs=2, max_memory=1)
+
+    assert [result["font_file"] for result in results] == font_files
+    assert results[1]["error"] and results[1]["outputs"] == []
+    for result in results[:1] + results[2:]:
+        assert result["error"] is None
+        assert os.path.exists(result["outputs"][0])
+
+
+def test_memory_budget_instances_and_slices(tmp_path):
+    font_file = str(tmp_path / "Ysabeau.ttf")
+    shutil.copy("tests/fonts/Ysabeau[wght].ttf", font_file)
+
+    results = instance_file(font_file, instances=["Bold", "wght=300"], unicodes="U+0041-005A", jobs=2, max_memory=1)
+    assert [result["error"] for result in results] == [None, None]
+    assert all(result["peak_rss"] for result in results)
+
+    other_file = str(tmp_path / "Other.ttf")
+    shutil.copy("tests/fonts/SubstitutionTest-Regular.ttf", other_file)
+    results = slice_fonts([font_file, other_file], slices=["U+0041-005A", "U+0061-007A"], jobs=2, max_memory=1)
+    assert [result["error"] for result in results] == [None, None]
+    assert len(results[0]["outputs"]) == 3
+
+
+def test_killed_worker():
+    ((result, exception),) = run_scheduled(_killed, ["tests/fonts/SubstitutionTest-Regular.ttf"], 1024**3)
+    assert result is None and "killed" in str(exception)
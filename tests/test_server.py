@@ -0,0 +1,67 @@
+import json
+import shutil
+import socket
+import threading
+import urllib.error
+import urllib.request
+
+import pytest
+
+from upsetter import upset_bytes
+from upsetter.server import make_server
+
+
+@pytest.fixture
+def server(tmp_path):
+    shutil.copy("tests/fonts/SubstitutionTest-Regular.ttf", str(tmp_path / "SubstitutionTest-Regular.ttf"))
+    server = make_server(str(tmp_path), port=0, pool_size=2)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server, f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_server(server, monkeypatch):
+    monkeypatch.setenv("SOURCE_DATE_EPOCH", "0")
+    server, url = server
+    source = open("tests/fonts/SubstitutionTest-Regular.ttf", "rb").read()
+    expected = upset_bytes(source, unicodes="U+0061-0063", freeze_features=["ss01"], flavors=[None, "woff2"])
+
+    query = "font=SubstitutionTest-Regular.ttf&unicodes=U+0061-0063&freeze=ss01"
+    for _ in range(3):
+        response = urllib.request.urlopen(f"{url}/upset?{query}")
+        assert response.headers["Content-Type"] == "font/ttf"
+        assert response.read() == expected[None]
+    response = urllib.request.urlopen(f"{url}/upset?{query}&format=woff2")
+    assert response.read() == expected["woff2"]
+
+    # Uploaded fonts
+    query = "unicodes=U+0061-0063&freeze=ss01"
+    assert urllib.request.urlopen(f"{url}/upset?{query}", data=source).read() == expected[None]
+
+    for query, status in (("font=../secret.ttf", 404), ("font=SubstitutionTest-Regular.ttf&format=eot", 400)):
+        with pytest.raises(urllib.error.HTTPError) as error:
+            urllib.request.urlopen(f"{url}/upset?{query}")
+        assert error.value.code == status
+
+    stats = json.loads(urllib.request.urlopen(f"{url}/stats").read())
+    assert stats["requests"] == 7 and stats["errors"] == 2
+    assert stats["pool"] == {"size": 1, "max_size": 2, "hits": 3, "misses": 1}
+    assert 0 < stats["latency_ms"]["p50"] <= stats["latency_ms"]["p99"] <= stats["latency_ms"]["max"]
+
+
+def test_unix_socket(tmp_path):
+    socket_path = str(tmp_path / "upsetter.sock")
+    server = make_server(str(tmp_path), socket_path=socket_path)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        with socket.socket(socket.AF_UNIX) as client:
+            client.connect(socket_path)
+            client.sendall(b"GET /stats HTTP/1.0\r\n\r\n")
+            response = b"".join(iter(lambda: client.recv(4096), b""))
+        assert response.startswith(b"HTTP/1.1 200")
+        assert json.loads(response.split(b"\r\n\r\n", 1)[1])["requests"] == 0
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,27 @@
+import shutil
+
+from upsetter import upset
+from upsetter.cli import parse_size
+from upsetter.metrics import Metrics
+from upsetter.sizes import check_budgets, parse_budget, size_report, size_summary
+
+
+def test_table_sizes(tmp_path):
+    font_file = str(tmp_path / "SubstitutionTest-Regular.ttf")
+    shutil.copy("tests/fonts/SubstitutionTest-Regular.ttf", font_file)
+    metrics = Metrics(table_sizes=True)
+    (result,) = upset([font_file], unicodes="U+0041-005A", compress=True, metrics=metrics)
+
+    stages = size_summary(metrics.records)[font_file]
+    assert list(stages) == ["input", "subset", "woff2"]
+    assert stages["subset"]["tables"]["cmap"] < stages["input"]["tables"]["cmap"]
+    assert sum(stages["subset"]["tables"].values()) < stages["subset"]["total"]
+    assert stages["woff2"]["tables"] is None and stages["woff2"]["total"] < stages["subset"]["total"]
+    assert "glyf" in size_report(metrics.records)
+    # Size records don't count as stage timings
+    assert "input" not in metrics.summary()
+
+    budgets = [parse_budget(budget, parse_size) for budget in ("1M", "woff2=10", "glyf=1K", "GPOS=0")]
+    assert budgets == [(None, 1024**2), ("woff2", 10), ("glyf", 1024), ("GPOS", 0)]
+    exceeded = check_budgets(result["outputs"], budgets)
+    assert [(budget["file"][-5:], budget["budget"]) for budget in exceeded] == [("t.ttf", "GPOS"), ("woff2", "woff2")]
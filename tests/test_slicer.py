@@ -0,0 +1,39 @@
+import shutil
+
+from fontTools.ttLib import TTFont
+
+from upsetter.slicer import format_unicodes, slice_fonts, split_codepoints
+
+
+def test_format_unicodes():
+    assert format_unicodes([0x61, 0x41, 0x42, 0x43, 0x62]) == "U+41-43,U+61-62"
+    assert format_unicodes([0x20, 0x22], ", ") == "U+20, U+22"
+
+
+def test_split_codepoints():
+    assert split_codepoints([0x42, 0x41, 0x100, 0x43], "blocks") == [[0x41, 0x42, 0x43], [0x100]]
+    assert split_codepoints(range(5), "2") == [[0, 1], [2, 3], [4]]
+
+
+def test_slice_fonts(tmp_path):
+    font_file = str(tmp_path / "Ysabeau.ttf")
+    shutil.copy("tests/fonts/Ysabeau[wght].ttf", font_file)
+
+    # The third slice isn't covered by the font and is left out
+    (result,) = slice_fonts([font_file], slices=["U+0041-005A", "U+0061-007A,U+00E4", "U+4E00-4E10"], compress=True)
+
+    assert result["error"] is None
+    assert [output[len(str(tmp_path)) + 1 :] for output in result["outputs"]] == [
+        "Ysabeau.upset.0.ttf",
+        "Ysabeau.upset.0.woff2",
+        "Ysabeau.upset.1.ttf",
+        "Ysabeau.upset.1.woff2",
+        "Ysabeau.upset.css",
+    ]
+    assert set(TTFont(result["outputs"][0]).getBestCmap()) == set(range(0x41, 0x5B))
+    assert set(TTFont(result["outputs"][3]).getBestCmap()) == set(range(0x61, 0x7B)) | {0xE4}
+
+    css = open(result["outputs"][-1]).read()
+    assert css.count("@font-face") == 2
+    assert 'src: url("Ysabeau.upset.1.woff2") format("woff2"), url("Ysabeau.upset.1.ttf") format("truetype");' in css
+    assert "unicode-range: U+61-7A, U+E4;" in css
@@ -0,0 +1,115 @@
+import json
+import sys
+
+import pytest
+from fontTools.ttLib import TTFont
+from fontTools.varLib.instancer import parseLimits
+
+from upsetter import upset_font
+from upsetter.spec import run_spec_file
+
+SPEC = {
+    "fonts": [
+        {
+            "source": "Ysabeau.ttf",
+            "subspace": "wght=400",
+            "outputs": [
+                {"output": "out/Ysabeau-Latin.ttf", "unicodes": "U+0020-007E", "compress": True},
+                {"output": "out/Ysabeau-SC.ttf", "unicodes": "U+0020-007E", "freeze": "smcp", "name": "SC"},
+                {"output": "out/Ysabeau-SC-Basic.ttf", "unicodes": "U+0041-005A", "freeze": ["smcp"], "name": "SC"},
+            ],
+        },
+        {
+            "source": "SubstitutionTest-Regular.ttf",
+            "freeze": ["ss01"],
+            "outputs": [
+                {"output": "out/SubstitutionTest-ss01.ttf", "glyph_names": True},
+                {"output": "out/SubstitutionTest-ss01-ss02.ttf", "freeze": ["ss01", "ss02"], "remove": ["ss03"]},
+                {"output": "out/SubstitutionTest-none.ttf", "subspace": None, "freeze": None},
+            ],
+        },
+    ]
+}
+
+
+def test_spec_matches_single_runs(tmp_path, monkeypatch):
+    monkeypatch.setenv("SOURCE_DATE_EPOCH", "0")
+    (tmp_path / "Ysabeau.ttf").write_bytes(open("tests/fonts/Ysabeau[wght].ttf", "rb").read())
+    (tmp_path / "SubstitutionTest-Regular.ttf").write_bytes(
+        open("tests/fonts/SubstitutionTest-Regular.ttf", "rb").read()
+    )
+    spec_file = tmp_path / "spec.json"
+    spec_file.write_text(json.dumps(SPEC))
+
+    results = run_spec_file(str(spec_file))
+
+    assert [result["error"] for result in results] == [None] * 6
+    assert results[0]["outputs"][1].endswith("out/Ysabeau-Latin.woff2")
+
+    # Every output equals a separate run of the whole pipeline
+    expected = [
+        ("Ysabeau.ttf", dict(subspace="wght=400", unicodes="U+0020-007E")),
+        ("Ysabeau.ttf", dict(subspace="wght=400", unicodes="U+0020-007E", freeze_features=["smcp"], name="SC")),
+        ("Ysabeau.ttf", dict(subspace="wght=400", unicodes="U+0041-005A", freeze_features=["smcp"], name="SC")),
+        ("SubstitutionTest-Regular.ttf", dict(freeze_features=["ss01"], keep_glyph_names=True)),
+        ("SubstitutionTest-Regular.ttf", dict(freeze_features=["ss01", "ss02"], remove_features=["ss03"])),
+        ("SubstitutionTest-Regular.ttf", dict()),
+    ]
+    for result, (source, options) in zip(results, expected):
+        if "subspace" in options:
+            options["subspace"] = parseLimits(options["subspace"].split(","))
+        ttFont = upset_font(TTFont(str(tmp_path / source)), **options)
+        reference = tmp_path / "reference.ttf"
+        ttFont.save(str(reference))
+        assert open(result["output"], "rb").read() == reference.read_bytes(), result["output"]
+
+
+def test_spec_pipeline_options(tmp_path, monkeypatch):
+    monkeypatch.setenv("SOURCE_DATE_EPOCH", "0")
+    (tmp_path / "Ysabeau.ttf").write_bytes(open("tests/fonts/Ysabeau[wght].ttf", "rb").read())
+    spec = {
+        "fonts": [
+            {
+                "source": "Ysabeau.ttf",
+                "subspace": "wght=400",
+                "freeze": ["smcp"],
+                "prune_layout": True,
+                "outputs": [
+                    {"output": "out/a.ttf", "unicodes": "U+0020-007E", "compact": "dehint", "woff": True},
+                    {"output": "out/b.ttf", "compress": True, "compress_quality": 1, "prune_layout": False},
+                ],
+            }
+        ]
+    }
+    spec_file = tmp_path / "spec.json"
+    spec_file.write_text(json.dumps(spec))
+
+    results = run_spec_file(str(spec_file))
+
+    assert [result["error"] for result in results] == [None, None]
+    assert [output[-4:] for output in results[0]["outputs"] + results[1]["outputs"]] == [
+        ".ttf",
+        "woff",
+        ".ttf",
+        "off2",
+    ]
+    ttFont = upset_font(
+        TTFont(str(tmp_path / "Ysabeau.ttf")),
+        unicodes="U+0020-007E",
+        subspace={"wght": 400},
+        freeze_features=["smcp"],
+        prune_layout=True,
+        compact=["dehint"],
+    )
+    reference = tmp_path / "reference.ttf"
+    ttFont.save(str(reference))
+    assert open(results[0]["outputs"][0], "rb").read() == reference.read_bytes()
+
+
+def test_spec_rejects_processing_options(tmp_path, monkeypatch, capsys):
+    from upsetter.cli import main
+
+    monkeypatch.setattr(sys, "argv", ["upsetter", "--spec", "spec.json", "--woff", "-u", "U+0041"])
+    with pytest.raises(SystemExit):
+        main()
+    assert "--unicodes, --woff can't be combined with --spec" in capsys.readouterr().err
@@ -0,0 +1,40 @@
+import json
+import subprocess
+import sys
+
+HEAVY_MODULES = ["fontTools.ttLib", "fontTools.subset", "fontTools.varLib", "opentype_feature_freezer"]
+# Generous, importing the package takes a few milliseconds without the heavy modules
+IMPORT_BUDGET = 0.15
+
+SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+from upsetter.cli import main
+elapsed = time.perf_counter() - start
+sys.argv = ["upsetter"] + json.loads(sys.argv[1])
+try:
+    main()
+except SystemExit:
+    pass
+print(json.dumps({"elapsed": elapsed, "modules": sorted(sys.modules)}))
+"""
+
+
+def run_cli(*args):
+    process = subprocess.run(
+        [sys.executable, "-c", SCRIPT, json.dumps(args)], capture_output=True, text=True, check=True
+    )
+    return json.loads(process.stdout.strip().splitlines()[-1])
+
+
+def test_startup_loads_no_heavy_modules():
+    for args in (["--help"], [], ["-s", "wght=400", "--spec", "spec.json", "font.ttf"]):
+        result = run_cli(*args)
+        loaded = [module for module in HEAVY_MODULES if module in result["modules"]]
+        assert not loaded, f"upsetter {' '.join(args)} imported {', '.join(loaded)}"
+
+
+def test_import_time_budget():
+    # Best of a few runs, to be robust against noise on busy machines
+    elapsed = min(run_cli("--help")["elapsed"] for _ in range(3))
+    assert elapsed < IMPORT_BUDGET, f"Importing upsetter.cli took {elapsed:.3f}s"
@@ -0,0 +1,38 @@
+import io
+
+import pytest
+from fontTools.ttLib import TTFont
+
+from upsetter import upset_font
+from upsetter.verify import verify, verify_font
+
+pytest.importorskip("uharfbuzz")
+
+SOURCE = "tests/fonts/SubstitutionTest-Regular.ttf"
+
+
+def test_verify_font():
+    stream = io.BytesIO()
+    # The glyphs of the test font are empty, so they can only be told apart by name
+    upset_font(TTFont(SOURCE), freeze_features=["ss01"], keep_glyph_names=True).save(stream)
+
+    result = verify_font(SOURCE, stream.getvalue(), ["a", "aa a"], freeze_features=["ss01"])
+    assert result["lines"] == 2 and result["mismatch_count"] == 0
+
+    result = verify_font(SOURCE, stream.getvalue(), ["a"], freeze_features=["ss01", "ss02"])
+    assert result["mismatch_count"] == 1
+    (mismatch,) = result["mismatches"]
+    assert mismatch["expected"] == ["a.ss01.ss02"] and "ss02" in mismatch["features"]
+
+
+def test_verify_batch(tmp_path):
+    upset_file = str(tmp_path / "SubstitutionTest-Regular.upset.ttf")
+    upset_font(TTFont(SOURCE), unicodes="U+0061", freeze_features=["ss01"]).save(upset_file)
+    corpus_file = tmp_path / "corpus.txt"
+    corpus_file.write_text("abc\n\na a\n", encoding="utf-8")
+
+    results = verify([(SOURCE, upset_file)], [str(corpus_file), None], freeze_features=["ss01"], jobs=2)
+    assert [(result["lines"], result["mismatch_count"], result["error"]) for result in results] == [
+        (2, 0, None),
+        (2, 0, None),
+    ]
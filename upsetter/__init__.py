@@ -1,21 +1,30 @@
 import os
-from fontTools.ttLib import TTFont
 import logging
 from types import SimpleNamespace
 import copy
-from fontTools.varLib.instancer import parseLimits
 
+from .metrics import record_sizes, stage
 
-def font_subspace(ttFont, subspace):
+# fontTools and the other heavy dependencies are imported by the stages that need them,
+# so that importing upsetter and starting the command line tool stay fast.
+
+
+# All stages work on a deep copy of the font by default so that the caller's TTFont stays untouched.
+# Pass inplace=True to mutate the given font instead, which avoids one full copy of the font per stage.
+# With update_names=True, font_subspace() also updates the name table for the new location (requires STAT).
+def font_subspace(ttFont, subspace, inplace=False, update_names=False):
     from fontTools.varLib.instancer import instantiateVariableFont
 
-    ttFont = copy.deepcopy(ttFont)
+    with stage("subspace"):
+        if not inplace:
+            ttFont = copy.deepcopy(ttFont)
 
-    assert "fvar" in ttFont, "Font is not a Variable Font"
-    logging.info("#" * 40)
-    logging.info(f"Subspacing {ttFont} with {subspace}")
-    ttFont = instantiateVariableFont(ttFont, subspace, inplace=True)
+        assert "fvar" in ttFont, "Font is not a Variable Font"
+        logging.info("#" * 40)
+        logging.info(f"Subspacing {ttFont} with {subspace}")
+        ttFont = instantiateVariableFont(ttFont, subspace, inplace=True, updateFontNames=update_names)
 
+    record_sizes("subspace", ttFont)
     return ttFont
 
 
@@ -23,42 +32,23 @@ def font_subspace(ttFont, subspace):
 # with pyft_featfreeze in case all lookups are of type 1 (Single Substitution)
 # AND all source glyphs are encoded (otherwise no cmap-remapping is possible)
 # OR with gftools-remap-layout in case of all other lookup types
-def font_freeze_features(ttFont, freeze_features, name):
+def font_freeze_features(ttFont, freeze_features, name, inplace=False):
+    with stage("freeze"):
+        ttFont = _font_freeze_features(ttFont, freeze_features, name, inplace)
+
+    record_sizes("freeze", ttFont)
+    return ttFont
 
-    ttFont = copy.deepcopy(ttFont)
+
+def _font_freeze_features(ttFont, freeze_features, name, inplace):
+
+    if not inplace:
+        ttFont = copy.deepcopy(ttFont)
 
     # Disable this check for now, always apply both tactics
-    encoded_glyphs = ttFont.getBestCmap().values()
-    pyft_featfreeze = []
-
-    if "GSUB" in ttFont:
-        gsub = ttFont["GSUB"].table
-        for feature in gsub.FeatureList.FeatureRecord:
-            if feature.FeatureTag in freeze_features:
-                found_lookuptypes = set()
-                lookups = []
-                for lookup_index in feature.Feature.LookupListIndex:
-                    lookup = gsub.LookupList.Lookup[lookup_index]
-                    found_lookuptypes.add(lookup.LookupType)
-                    lookups.append(lookups)
-
-                # All lookups are of type 1 (Single Substitution)
-                if found_lookuptypes and found_lookuptypes == {1}:
-
-                    # Check whether all substitution source glyphs are encoded
-                    source_glyphs_have_unicodes = []
-                    for lookup_index in feature.Feature.LookupListIndex:
-                        lookup = gsub.LookupList.Lookup[lookup_index]
-                        for subtable in lookup.SubTable:
-                            for glyph_name in subtable.mapping.keys():
-                                if glyph_name in encoded_glyphs:
-                                    source_glyphs_have_unicodes.append(True)
-                                else:
-                                    source_glyphs_have_unicodes.append(False)
-
-                    # All source glyphs are encoded
-                    if all(source_glyphs_have_unicodes):
-                        pyft_featfreeze.append(feature.FeatureTag)
+    from .layout_index import LayoutIndex
+
+    pyft_featfreeze = LayoutIndex(ttFont).cmap_freezable_features(freeze_features) if "GSUB" in ttFont else []
 
     logging.info("#" * 40)
     logging.info(f"pyft_featfreeze {freeze_features}")
@@ -117,9 +107,45 @@ def font_freeze_features(ttFont, freeze_features, name):
     return ttFont
 
 
-def font_subset(ttFont, unicodes=None, remove_features=None, keep_glyph_names=False):
+# Remove the layout rules that can't fire anymore after freezing, see upsetter.prune
+def font_prune_layout(ttFont, inplace=False):
+    from .prune import prune_layout
+
+    with stage("prune"):
+        if not inplace:
+            ttFont = copy.deepcopy(ttFont)
+        prune_layout(ttFont)
+
+    record_sizes("prune", ttFont)
+    return ttFont
+
+
+# Compact the outlines and variation data after subsetting with the given techniques, see upsetter.compact.
+# The bytes every technique saved are added to the metrics record of the stage.
+def font_compact(ttFont, techniques, inplace=False):
+    from .compact import compact
+
+    with stage("compact") as fields:
+        if not inplace:
+            ttFont = copy.deepcopy(ttFont)
+        fields["savings"] = compact(ttFont, techniques)
+
+    record_sizes("compact", ttFont)
+    return ttFont
+
+
+def font_subset(ttFont, unicodes=None, remove_features=None, keep_glyph_names=False, inplace=False):
+    with stage("subset"):
+        ttFont = _font_subset(ttFont, unicodes, remove_features, keep_glyph_names, inplace)
+
+    record_sizes("subset", ttFont)
+    return ttFont
+
+
+def _font_subset(ttFont, unicodes, remove_features, keep_glyph_names, inplace):
 
-    ttFont = copy.deepcopy(ttFont)
+    if not inplace:
+        ttFont = copy.deepcopy(ttFont)
 
     # These are the default options when nothing is specifically set
     from fontTools.subset import Subsetter, Options, parse_unicodes
@@ -127,8 +153,11 @@ def font_subset(ttFont, unicodes=None, remove_features=None, keep_glyph_names=Fa
     options = Options()
 
     # layout features
+    assert "GSUB" in ttFont, "Font has no GSUB table"
     gsub = ttFont["GSUB"].table
-    features = [FeatureRecord.FeatureTag for FeatureRecord in gsub.FeatureList.FeatureRecord]
+    features = (
+        [FeatureRecord.FeatureTag for FeatureRecord in gsub.FeatureList.FeatureRecord] if gsub.FeatureList else []
+    )
     options.layout_features = list(set(features) - set(remove_features) if remove_features else set(features))
     options.glyph_names = keep_glyph_names  # Don't keep glyph names for now (file size optimization)
 
@@ -150,8 +179,106 @@ def font_subset(ttFont, unicodes=None, remove_features=None, keep_glyph_names=Fa
     return ttFont
 
 
-def upset(
-    font_files,
+def validate_features(freeze_features, remove_features):
+    if freeze_features is not None and remove_features is not None:
+        assert (
+            set(freeze_features) & set(remove_features) == set()
+        ), f"Features to freeze and remove must not overlap: {set(freeze_features) & set(remove_features)}"
+
+
+def upset_font(
+    ttFont,
+    unicodes=None,
+    subspace=None,
+    freeze_features=None,
+    remove_features=None,
+    name="",
+    keep_glyph_names=False,
+    inplace=True,
+    prune_layout=False,
+    compact=None,
+):
+    """Run the sub-spacing, feature-freezing and subsetting stages on a single TTFont.
+    By default, all stages mutate the given font. Pass inplace=False to preserve it.
+    With prune_layout, layout rules that can't fire anymore after freezing are removed before subsetting.
+    compact lists the compaction techniques to apply after subsetting, see upsetter.compact.
+    Tables that no stage changes are passed through as the bytes they were loaded from, see upsetter.plan."""
+    from .plan import passthrough_tables, restore_raw, table_plan
+
+    if not inplace:
+        ttFont = copy.deepcopy(ttFont)
+    tags = ttFont.keys()
+    plan = table_plan(tags, subspace, freeze_features, name, prune_layout, compact)
+
+    # Sub-Spacing
+    if subspace:
+        ttFont = font_subspace(ttFont, subspace, inplace=True)
+
+    # Feature-Freezing
+    if freeze_features is not None:
+        ttFont = font_freeze_features(ttFont, freeze_features, name, inplace=True)
+        if prune_layout:
+            ttFont = font_prune_layout(ttFont, inplace=True)
+
+    # Subset
+    ttFont = font_subset(ttFont, unicodes, remove_features, keep_glyph_names, inplace=True)
+
+    # Compaction
+    if compact:
+        ttFont = font_compact(ttFont, compact, inplace=True)
+
+    restore_raw(ttFont, passthrough_tables(tags, plan))
+    return ttFont
+
+
+def upset_bytes(
+    font_data,
+    unicodes=None,
+    subspace=None,
+    freeze_features=None,
+    remove_features=None,
+    name="",
+    keep_glyph_names=False,
+    flavors=(None,),
+    compress_quality=11,
+    prune_layout=False,
+    compact=None,
+):
+    """Process a font given as bytes or a binary file object entirely in memory, without touching the disk.
+    flavors lists the output formats: None for the plain TTF/OTF, "woff2" and "woff".
+    Returns a dict of the output bytes by flavor. Safe to call from several threads at once."""
+    from io import BytesIO
+
+    from .compress import compress_bytes
+    from .plan import close_font, open_font
+
+    validate_features(freeze_features, remove_features)
+
+    ttFont = upset_font(
+        open_font(font_data),
+        unicodes=unicodes,
+        subspace=subspace,
+        freeze_features=freeze_features,
+        remove_features=remove_features,
+        name=name,
+        keep_glyph_names=keep_glyph_names,
+        prune_layout=prune_layout,
+        compact=compact,
+    )
+    stream = BytesIO()
+    ttFont.save(stream)
+    close_font(ttFont)
+    data = stream.getvalue()
+
+    return {flavor: data if flavor is None else compress_bytes(data, flavor, compress_quality) for flavor in flavors}
+
+
+def output_path(font_file):
+    return os.path.splitext(font_file)[0] + ".upset" + os.path.splitext(font_file)[1]
+
+
+def upset_file(
+    font_file,
     unicodes=None,
     subspace=None,
     freeze_features=None,
@@ -160,57 +287,293 @@ def upset(
     name="",
     keep_glyph_names=False,
     compress=False,
+    cache=None,
+    woff=False,
+    compress_quality=11,
+    output_file=None,
+    prune_layout=False,
+    compact=None,
 ):
+    """Process a single font file and save the result next to it, or as output_file if given.
+    Returns the list of written files.
+    compress and woff additionally write WOFF2 and WOFF 1.0 files with the given compress_quality (0-11).
+    Pass a upsetter.cache.StageCache as cache to reuse results of previous runs."""
+
+    output_file = output_file or output_path(font_file)
+    if cache is not None:
+        from .cache import cached_upset_file
+
+        return cached_upset_file(
+            cache,
+            font_file,
+            output_file,
+            unicodes=unicodes,
+            subspace=subspace,
+            freeze_features=freeze_features,
+            remove_features=remove_features,
+            name=name,
+            keep_glyph_names=keep_glyph_names,
+            compress=compress,
+            woff=woff,
+            compress_quality=compress_quality,
+            prune_layout=prune_layout,
+            compact=compact,
+        )
+
+    from .plan import close_font, open_font
+
+    outputs = []
+    with stage("load"):
+        with open(font_file, "rb") as f:
+            ttFont = open_font(f.read())
+    record_sizes("input", ttFont)
+
+    ttFont = upset_font(
+        ttFont,
+        unicodes=unicodes,
+        subspace=subspace,
+        freeze_features=freeze_features,
+        remove_features=remove_features,
+        name=name,
+        keep_glyph_names=keep_glyph_names,
+        prune_layout=prune_layout,
+        compact=compact,
+    )
+
+    # # Italic
+    # TODO: Keep this for later
+    # if italic:
+
+    #     # Roman
+    #     ttFont_roman = font_subspace(ttFont, parseLimits("ital=0"))
+    #     ttFont_roman = font_subset(ttFont_roman, remove_features=["ital"])
+
+    #     # Adjust file name and save the font
+    #     font_file = os.path.splitext(font_file)[0] + ".roman.upset" + os.path.splitext(font_file)[1]
+    #     ttFont.save(font_file)
+
+    #     # Italic
+    #     ttFont_italic = font_subspace(ttFont, parseLimits("ital=1"))
+    #     ttFont_italic = font_freeze_features(ttFont_italic, freeze_features=["ital"])
+    #     ttFont_italic = font_subset(ttFont_italic)
+
+    #     # Adjust file name and save the font
+    #     font_file = os.path.splitext(font_file)[0] + ".italic.upset" + os.path.splitext(font_file)[1]
+    #     ttFont.save(font_file)
+
+    # Adjust file name and save the font
+    font_file = output_file
+    with stage("save"):
+        ttFont.save(font_file)
+    outputs.append(font_file)
+    close_font(ttFont)
 
-    # Input validation
-    if freeze_features is not None and remove_features is not None:
-        assert (
-            set(freeze_features) & set(remove_features) == set()
-        ), f"Features to freeze and remove must not overlap: {set(freeze_features) & set(remove_features)}"
+    if compress or woff:
+        from .compress import compress_file
 
-    # Cycle through all font files
-    for font_file in font_files:
-        ttFont = TTFont(font_file)
+        reports = compress_file(font_file, woff2=compress, woff=woff, quality=compress_quality)
+        outputs.extend(report["output"] for report in reports)
 
-        # Sub-Spacing
-        if subspace:
-            ttFont = font_subspace(ttFont, subspace)
+    return outputs
 
-        # Feature-Freezing
-        if freeze_features is not None:
-            ttFont = font_freeze_features(ttFont, freeze_features, name)
 
-        # Subset
-        ttFont = font_subset(ttFont, unicodes, remove_features, keep_glyph_names)
+def _init_worker(log_level):
+    logging.basicConfig(level=log_level)
 
-        # # Italic
-        # TODO: Keep this for later
-        # if italic:
 
-        #     # Roman
-        #     ttFont_roman = font_subspace(ttFont, parseLimits("ital=0"))
-        #     ttFont_roman = font_subset(ttFont_roman, remove_features=["ital"])
+def run_batch(
+    function, font_files, jobs=1, metrics=None, max_memory=None, estimates=None, file_options=None, **options
+):
+    """Call function(font_file, **options) for every font file, adding the options in file_options
+    (a dict per font file) if given, so that every worker only gets the options of its own font.
+
+    With jobs > 1, fonts are processed in a pool of that many worker processes (jobs=None uses all CPUs),
+    so function must be defined at module level. With max_memory (bytes), every font gets a worker process
+    of its own instead, and fonts only run concurrently while their estimated memory fits, see
+    upsetter.scheduler, or as given in bytes per font as estimates. A font that fails doesn't abort the batch.
+    With a upsetter.metrics.Metrics collector as metrics, the stages of every call are measured into it.
+    Returns a (return value, error) tuple per font, in the order of font_files, with error None on success."""
+
+    results = []
+    file_options = file_options or [{}] * len(font_files)
+
+    if metrics is not None:
+        from .metrics import measured_call
+
+        options = dict(options, function=function, settings=metrics.settings())
+        function = measured_call
+
+    def collect(font_file, get_result):
+        try:
+            result = get_result()
+            if metrics is not None:
+                result, records = result
+                metrics.merge(records)
+            results.append((result, None))
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            logging.error(f"Processing {font_file} failed: {error}")
+            results.append((None, error))
+
+    if jobs == 1 or len(font_files) < 2:
+        # Cycle through all font files
+        for font_file, extra in zip(font_files, file_options):
+            collect(font_file, lambda: function(font_file, **options, **extra))
+
+    elif max_memory:
+        from .scheduler import run_scheduled
+
+        def get_result(outcome):
+            result, exception = outcome
+            if exception is not None:
+                raise exception
+            return result
+
+        outcomes = run_scheduled(function, font_files, max_memory, jobs, options, estimates, file_options)
+        for font_file, outcome in zip(font_files, outcomes):
+            collect(font_file, lambda: get_result(outcome))
 
-        #     # Adjust file name and save the font
-        #     font_file = os.path.splitext(font_file)[0] + ".roman.upset" + os.path.splitext(font_file)[1]
-        #     ttFont.save(font_file)
+    else:
+        from concurrent.futures import ProcessPoolExecutor
 
-        #     # Italic
-        #     ttFont_italic = font_subspace(ttFont, parseLimits("ital=1"))
-        #     ttFont_italic = font_freeze_features(ttFont_italic, freeze_features=["ital"])
-        #     ttFont_italic = font_subset(ttFont_italic)
+        with ProcessPoolExecutor(
+            max_workers=jobs, initializer=_init_worker, initargs=(logging.getLogger().level,)
+        ) as executor:
+            futures = [
+                executor.submit(function, font_file, **options, **extra)
+                for font_file, extra in zip(font_files, file_options)
+            ]
+            for font_file, future in zip(font_files, futures):
+                collect(font_file, future.result)
 
-        #     # Adjust file name and save the font
-        #     font_file = os.path.splitext(font_file)[0] + ".italic.upset" + os.path.splitext(font_file)[1]
-        #     ttFont.save(font_file)
+    return results
 
-        # Adjust file name and save the font
-        font_file = os.path.splitext(font_file)[0] + ".upset" + os.path.splitext(font_file)[1]
-        ttFont.save(font_file)
 
-        if compress:
-            ttFont.flavor = "woff2"
-            font_file = os.path.splitext(font_file)[0] + ".woff2"
-            ttFont.save(font_file, reorderTables=False)
+def _upset_file_job(font_file, cache_dir=None, cache_size=None, **options):
+    # Every job uses its own cache object, also in worker processes, and hands its statistics back
+    cache = None
+    if cache_dir:
+        from .cache import DEFAULT_MAX_SIZE, StageCache
+
+        cache = StageCache(cache_dir, cache_size or DEFAULT_MAX_SIZE)
+    outputs = upset_file(font_file, cache=cache, **options)
+    return outputs, cache.stats() if cache is not None else None
+
+
+def upset(
+    font_files,
+    unicodes=None,
+    subspace=None,
+    freeze_features=None,
+    remove_features=None,
+    italic=False,
+    name="",
+    keep_glyph_names=False,
+    compress=False,
+    jobs=1,
+    cache_dir=None,
+    cache_size=None,
+    woff=False,
+    compress_quality=11,
+    compress_jobs=1,
+    metrics=None,
+    prune_layout=False,
+    compact=None,
+    max_memory=None,
+):
+    """Process all font files with the same options.
+
+    With jobs > 1, fonts are processed in a pool of that many worker processes (jobs=None uses all CPUs).
+    With a max_memory in bytes, fonts only run concurrently while their estimated memory fits into it.
+    With jobs=1, WOFF2/WOFF compression of finished fonts runs in a pool of compress_jobs worker processes
+    instead, overlapped with processing of the next font.
+    With a cache_dir, results of each stage are cached on disk (up to cache_size bytes) and reused by later runs.
+    With a upsetter.metrics.Metrics collector as metrics, all stages are measured into it.
+    A font that fails doesn't abort the batch. Returns one summary dict per font, in the order of font_files,
+    with the keys "font_file", "outputs" (list of written files) and "error" (None on success)."""
 
-        ttFont.close()
+    # Input validation
+    validate_features(freeze_features, remove_features)
+    if compact:
+        from .compact import parse_techniques
+
+        compact = parse_techniques(compact)
+
+    function = _upset_file_job
+    compression = []
+    overlap = (compress or woff) and jobs == 1 and len(font_files) > 1 and not cache_dir
+    if overlap:
+        from concurrent.futures import ProcessPoolExecutor
+
+        from .compress import compress_file
+
+        executor = ProcessPoolExecutor(
+            max_workers=compress_jobs, initializer=_init_worker, initargs=(logging.getLogger().level,)
+        )
+
+        # Jobs run in this process here, so they can hand their output over to the compression pool right away
+        def upset_and_compress(font_file, **options):
+            outputs, cache_stats = _upset_file_job(font_file, **options)
+            compress_options = dict(woff2=compress, woff=woff, quality=compress_quality)
+            if metrics is not None:
+                from .metrics import measured_call
+
+                compress_options.update(function=compress_file, settings=metrics.settings())
+            compress_function = compress_file if metrics is None else measured_call
+            compression.append(executor.submit(compress_function, outputs[0], **compress_options))
+            return outputs, cache_stats
+
+        function = upset_and_compress
+
+    batch = run_batch(
+        function,
+        font_files,
+        jobs=jobs,
+        metrics=metrics,
+        max_memory=max_memory,
+        unicodes=unicodes,
+        subspace=subspace,
+        freeze_features=freeze_features,
+        remove_features=remove_features,
+        italic=italic,
+        name=name,
+        keep_glyph_names=keep_glyph_names,
+        compress=compress and not overlap,
+        woff=woff and not overlap,
+        compress_quality=compress_quality,
+        cache_dir=cache_dir,
+        cache_size=cache_size,
+        prune_layout=prune_layout,
+        compact=compact,
+    )
+
+    results = []
+    compression = iter(compression)
+    cache = None
+    if cache_dir:
+        from .cache import StageCache
+
+        cache = StageCache(cache_dir)
+    for font_file, (result, error) in zip(font_files, batch):
+        outputs, cache_stats = result or ([], None)
+        if cache_stats:
+            cache.merge_stats(cache_stats)
+        if overlap and error is None:
+            # Futures were submitted in order, one for every font that didn't fail
+            try:
+                reports = next(compression).result()
+                if metrics is not None:
+                    reports, records = reports
+                    metrics.merge(records)
+                outputs = outputs + [report["output"] for report in reports]
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+                logging.error(f"Compressing {font_file} failed: {error}")
+        results.append({"font_file": font_file, "outputs": outputs, "error": error})
+
+    if overlap:
+        executor.shutdown()
+    if cache is not None:
+        logging.info(cache.summary())
+
+    return results
@@ -0,0 +1,152 @@
+"""
+Asyncio API, for processing fonts from asyncio-based services without blocking the event loop.
+
+The CPU-bound work runs in a process pool (or a thread pool, or any executor you provide),
+and at most max_concurrency jobs are handed to the executor at a time. Further jobs wait
+for a free slot, which throttles the callers; with max_queue, jobs beyond that many waiting
+ones are refused with Overloaded right away, so that a service can answer with an error
+instead of piling up work. Cancelling the awaiting task withdraws a job that hasn't started
+yet. A job that is already running can't be interrupted: it runs to its end in the
+background, its result is discarded and its slot stays taken until then, so the limit holds.
+
+    async with AsyncUpsetter(max_concurrency=4, max_queue=32) as upsetter:
+        outputs = await upsetter.upset_bytes(data, unicodes="U+0020-007E", flavors=["woff2"])
+
+A whole upset_bytes() call is one job: handing a font between processes per stage would cost
+more than the stages themselves.
+"""
+
+import asyncio
+import logging
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+
+from . import _init_worker, font_subset, font_subspace, upset_bytes, validate_features
+
+EXECUTORS = ["process", "thread"]
+
+
+class Overloaded(Exception):
+    """Raised when a job is refused because max_queue jobs are already waiting"""
+
+
+def _subspace_bytes(font_data, subspace):
+    from io import BytesIO
+
+    from fontTools.ttLib import TTFont
+
+    ttFont = font_subspace(TTFont(BytesIO(font_data)), subspace, inplace=True)
+    stream = BytesIO()
+    ttFont.save(stream)
+    return stream.getvalue()
+
+
+def _subset_bytes(font_data, unicodes=None, remove_features=None, keep_glyph_names=False):
+    from io import BytesIO
+
+    from fontTools.ttLib import TTFont
+
+    ttFont = font_subset(TTFont(BytesIO(font_data)), unicodes, remove_features, keep_glyph_names, inplace=True)
+    stream = BytesIO()
+    ttFont.save(stream)
+    return stream.getvalue()
+
+
+class AsyncUpsetter:
+    """Runs upsetter jobs in an executor with a concurrency limit, for use from asyncio.
+
+    executor is "process" (default), "thread", or a concurrent.futures.Executor, which is then
+    left running on close(). max_workers is the size of the pool created for "process" and
+    "thread" (None uses all CPUs). max_concurrency limits the jobs in the executor at a time and
+    defaults to max_workers. max_queue limits the jobs waiting for a slot (None doesn't limit them)."""
+
+    def __init__(self, executor="process", max_workers=None, max_concurrency=None, max_queue=None):
+        if isinstance(executor, Executor):
+            self.executor = executor
+            self._owns_executor = False
+        else:
+            assert executor in EXECUTORS, f"Unknown executor {executor}, use one of: {', '.join(EXECUTORS)}"
+            max_workers = max_workers or os.cpu_count() or 1
+            if executor == "process":
+                self.executor = ProcessPoolExecutor(
+                    max_workers=max_workers, initializer=_init_worker, initargs=(logging.getLogger().level,)
+                )
+            else:
+                self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="upsetter")
+            self._owns_executor = True
+        self.max_concurrency = max_concurrency or max_workers or os.cpu_count() or 1
+        assert self.max_concurrency > 0, "max_concurrency must be positive"
+        assert max_queue is None or max_queue >= 0, "max_queue must not be negative"
+        self.max_queue = max_queue
+        self.waiting = 0
+        self.running = 0
+        # Created on first use, inside the running event loop
+        self._semaphore = None
+
+    async def run(self, function, *args, **kwargs):
+        """Run function(*args, **kwargs) in the executor once a slot is free, and return its result.
+        For a process executor, function and its arguments must be picklable."""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        if self.max_queue is not None and self._semaphore.locked() and self.waiting >= self.max_queue:
+            raise Overloaded(f"{self.waiting} jobs are already waiting")
+
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+
+        loop = asyncio.get_running_loop()
+        try:
+            future = self.executor.submit(function, *args, **kwargs)
+        except BaseException:
+            self._semaphore.release()
+            raise
+        self.running += 1
+
+        def release(_):
+            # The slot is freed when the job has really ended, not when its caller stopped waiting
+            try:
+                loop.call_soon_threadsafe(self._release)
+            except RuntimeError:  # Event loop closed in the meantime
+                pass
+
+        future.add_done_callback(release)
+        # Cancelling the awaiting task cancels the job too, if it hasn't started yet
+        return await asyncio.wrap_future(future)
+
+    def _release(self):
+        self.running -= 1
+        self._semaphore.release()
+
+    async def upset_bytes(self, font_data, **options):
+        """Asynchronous upset_bytes(): process a font given as bytes with the same options and
+        return a dict of the output bytes by flavor"""
+        validate_features(options.get("freeze_features"), options.get("remove_features"))
+        return await self.run(upset_bytes, bytes(font_data), **options)
+
+    async def subspace_bytes(self, font_data, subspace):
+        """Asynchronous font_subspace() of a font given as bytes, returning the font as bytes"""
+        return await self.run(_subspace_bytes, bytes(font_data), subspace)
+
+    async def subset_bytes(self, font_data, unicodes=None, remove_features=None, keep_glyph_names=False):
+        """Asynchronous font_subset() of a font given as bytes, returning the font as bytes"""
+        return await self.run(_subset_bytes, bytes(font_data), unicodes, remove_features, keep_glyph_names)
+
+    def stats(self):
+        return {"running": self.running, "waiting": self.waiting, "max_concurrency": self.max_concurrency}
+
+    async def close(self, cancel=False):
+        """Shut down an executor created by this object, waiting for running jobs to end.
+        With cancel, jobs that haven't started yet are cancelled instead of run."""
+        if self._owns_executor:
+            await asyncio.get_running_loop().run_in_executor(
+                None, lambda: self.executor.shutdown(wait=True, cancel_futures=cancel)
+            )
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, traceback):
+        await self.close(cancel=exc_type is not None)
@@ -0,0 +1,287 @@
+"""
+Augmentation of subsets that were already delivered, when a page needs more characters.
+Started with `upsetter augment`.
+
+An Augmenter keeps a source font (after sub-spacing and feature-freezing) with its layout
+tables decompiled. Augmenting a subset with more unicodes subsets this source again with all
+unicodes: the glyph closure of the previous subset isn't reused, only the decompilation of the
+source is cached. Decompiling the layout tables is the most expensive part of subsetting, so
+this is still faster than subsetting the source file. The subsets it made are kept as
+well, so that the base subset of a patch is only made once.
+
+Instead of the whole augmented font, a patch against the previous subset can be delivered:
+the byte ranges of the augmented font that also occur in the previous subset are copied from
+it, only the rest is included, and the patch is compressed. apply_patch() turns the previous
+subset and the patch into the augmented font. Patches record hashes of both fonts, so that a
+patch can't be applied to a different base and a broken result is noticed.
+
+Both ways yield the same bytes as font_subset() of the source with all unicodes.
+Fonts get the time of saving as their modification time, so a previous subset made again
+only has the same bytes with SOURCE_DATE_EPOCH set. Otherwise, make the patch against the
+file that was delivered, with --previous.
+
+    upsetter augment -b U+0000-007F -u U+00C0-00FF --patch font.patch font.ttf
+    upsetter augment --apply font.patch font.upset.ttf
+"""
+
+import argparse
+import hashlib
+import io
+import logging
+import pickle
+import time
+import zlib
+from collections import OrderedDict
+
+from . import font_subset
+from .slicer import format_unicodes
+
+PATCH_MAGIC = b"UPSP"
+PATCH_VERSION = 1
+# Compression of the patch body
+COMPRESSIONS = {0: "none", 1: "zlib", 2: "brotli"}
+# Length of the byte runs looked up in the base font
+MATCH_LENGTH = 16
+# Tables that the subsetter decompiles anyway, and that are kept decompiled
+DECOMPILED_TABLES = ["GDEF", "GSUB", "GPOS", "cmap"]
+
+
+def _unicode_set(unicodes):
+    """Unicodes as a string like for font_subset(), or an iterable of codepoints, as a frozenset"""
+    if isinstance(unicodes, str):
+        from fontTools.subset import parse_unicodes
+
+        return frozenset(parse_unicodes(unicodes))
+    return frozenset(unicodes)
+
+
+def _varint(number):
+    data = bytearray()
+    while number >= 0x80:
+        data.append(number & 0x7F | 0x80)
+        number >>= 7
+    data.append(number)
+    return bytes(data)
+
+
+def _read_varint(data, position):
+    number = shift = 0
+    while True:
+        byte = data[position]
+        position += 1
+        number |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return number, position
+        shift += 7
+
+
+def _compress(body):
+    try:
+        import brotli
+    except ImportError:
+        return 1, zlib.compress(body, 9)
+    return 2, brotli.compress(body, quality=11)
+
+
+def _decompress(compression, body):
+    if compression == 0:
+        return body
+    if compression == 1:
+        return zlib.decompress(body)
+    assert compression == 2, f"Unknown patch compression {compression}"
+    import brotli
+
+    return brotli.decompress(body)
+
+
+def make_patch(base, target):
+    """Patch that turns the font data base into target, as bytes.
+
+    The patch body is a list of operations: copying a byte range of base, or inserting bytes.
+    Only the runs of MATCH_LENGTH bytes at every MATCH_LENGTH-th offset of base are indexed, which
+    keeps the index small for big fonts. Runs of target are looked up in the index and extended as
+    far as they match in both directions, so that every match of at least 2 * MATCH_LENGTH - 1 bytes
+    is found."""
+    index = {}
+    for position in range(len(base) - len(base) % MATCH_LENGTH - MATCH_LENGTH, -1, -MATCH_LENGTH):
+        # Backwards, so that the first occurrence wins
+        index[base[position : position + MATCH_LENGTH]] = position
+
+    body = bytearray()
+    literal_start = position = 0
+
+    def insert(end):
+        if end > literal_start:
+            body.extend(b"\x01" + _varint(end - literal_start) + target[literal_start:end])
+
+    while position <= len(target) - MATCH_LENGTH:
+        match = index.get(target[position : position + MATCH_LENGTH])
+        if match is None:
+            position += 1
+            continue
+        length, limit = MATCH_LENGTH, min(len(base) - match, len(target) - position)
+        while (
+            length + 64 <= limit
+            and base[match + length : match + length + 64] == target[position + length : position + length + 64]
+        ):
+            length += 64
+        while length < limit and base[match + length] == target[position + length]:
+            length += 1
+        while match > 0 and position > literal_start and base[match - 1] == target[position - 1]:
+            match, position, length = match - 1, position - 1, length + 1
+        insert(position)
+        body.extend(b"\x00" + _varint(match) + _varint(length))
+        position += length
+        literal_start = position
+    insert(len(target))
+
+    compression, body = _compress(bytes(body))
+    return (
+        PATCH_MAGIC
+        + bytes([PATCH_VERSION, compression])
+        + hashlib.sha256(base).digest()
+        + hashlib.sha256(target).digest()
+        + body
+    )
+
+
+def apply_patch(base, patch):
+    """Turn the font data base into the target of a patch made with make_patch()"""
+    assert patch[:4] == PATCH_MAGIC, "Not an upsetter patch"
+    assert patch[4] == PATCH_VERSION, f"Unsupported patch version {patch[4]}"
+    assert hashlib.sha256(base).digest() == patch[6:38], "The patch doesn't belong to this font"
+
+    body = _decompress(patch[5], patch[70:])
+    target = bytearray()
+    position = 0
+    while position < len(body):
+        operation = body[position]
+        if operation == 0:
+            offset, position = _read_varint(body, position + 1)
+            length, position = _read_varint(body, position)
+            target.extend(base[offset : offset + length])
+        else:
+            length, position = _read_varint(body, position + 1)
+            target.extend(body[position : position + length])
+            position += length
+    target = bytes(target)
+    assert hashlib.sha256(target).digest() == patch[38:70], "The patched font is broken"
+    return target
+
+
+class Augmenter:
+    """Makes subsets of a source font, augments them with more unicodes and makes patches between them.
+
+    ttFont is the source font as a TTFont or bytes, after sub-spacing and feature-freezing if any.
+    remove_features and keep_glyph_names are passed to font_subset() for every subset.
+    The last max_subsets subsets are kept in memory."""
+
+    def __init__(self, ttFont, remove_features=None, keep_glyph_names=False, max_subsets=16):
+        from fontTools.ttLib import TTFont
+
+        if not isinstance(ttFont, TTFont):
+            ttFont = TTFont(io.BytesIO(ttFont))
+        else:
+            # Detach from the caller's font, which subsetting would change
+            stream = io.BytesIO()
+            ttFont.save(stream)
+            ttFont = TTFont(io.BytesIO(stream.getvalue()))
+        for tag in DECOMPILED_TABLES:
+            if tag in ttFont:
+                ttFont[tag]
+        # Unpickling the decompiled tables is several times faster than decompiling them again
+        self._snapshot = pickle.dumps(ttFont, pickle.HIGHEST_PROTOCOL)
+        self.remove_features = remove_features
+        self.keep_glyph_names = keep_glyph_names
+        self.max_subsets = max_subsets
+        self._subsets = OrderedDict()
+
+    def subset(self, unicodes):
+        """Subset of the source font with these unicodes, as bytes. Subsets the cached source again."""
+        unicodes = _unicode_set(unicodes)
+        data = self._subsets.get(unicodes)
+        if data is None:
+            ttFont = pickle.loads(self._snapshot)
+            ttFont = font_subset(
+                ttFont, format_unicodes(unicodes), self.remove_features, self.keep_glyph_names, inplace=True
+            )
+            stream = io.BytesIO()
+            ttFont.save(stream)
+            data = stream.getvalue()
+            self._subsets[unicodes] = data
+            while len(self._subsets) > self.max_subsets:
+                self._subsets.popitem(last=False)
+        else:
+            self._subsets.move_to_end(unicodes)
+        return data
+
+    def augment(self, base_unicodes, extra_unicodes):
+        """Subset with the unicodes of a previous subset and extra unicodes, as bytes"""
+        return self.subset(_unicode_set(base_unicodes) | _unicode_set(extra_unicodes))
+
+    def patch(self, base_unicodes, extra_unicodes):
+        """Patch that turns the subset with base_unicodes into the augmented one, see apply_patch()"""
+        base = self.subset(base_unicodes)
+        return make_patch(base, self.augment(base_unicodes, extra_unicodes))
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        prog="upsetter augment",
+        description=(
+            "Augment a subset of a font with more unicodes, as a new subset or as a patch against the previous "
+            "subset, or apply such a patch"
+        ),
+        epilog="Example: upsetter augment -b U+0000-007F -u U+00C0-00FF --patch font.patch font.ttf",
+    )
+    parser.add_argument("font_file", help="Source font, or the previous subset with --apply")
+    parser.add_argument("-b", "--base-unicodes", type=str, help="Unicodes of the previous subset")
+    parser.add_argument("-u", "--unicodes", type=str, help="Unicodes to add, in the same format as for upsetter -u")
+    parser.add_argument("-r", "--remove", type=str, help="Comma-separated list of features to remove")
+    parser.add_argument("--glyph-names", help="Keep glyph names intact", action="store_true")
+    parser.add_argument("--patch", type=str, help="Write a patch against the previous subset to this file")
+    parser.add_argument(
+        "--previous",
+        type=str,
+        help="The previous subset to make the patch against. Default is to subset the source with --base-unicodes.",
+    )
+    parser.add_argument("--apply", type=str, metavar="PATCH", help="Apply this patch to the previous subset")
+    parser.add_argument("-o", "--output", type=str, help="Output file. Default is <name>.upset.<ext>")
+    parser.add_argument("-v", "--verbose", help="Be verbose. Set logging level to INFO.", action="store_true")
+    args = parser.parse_args(args)
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING)
+
+    with open(args.font_file, "rb") as f:
+        data = f.read()
+    if args.apply:
+        with open(args.apply, "rb") as f:
+            patch = f.read()
+        output_file = args.output or args.font_file
+        augmented = apply_patch(data, patch)
+        with open(output_file, "wb") as f:
+            f.write(augmented)
+        print(f"{output_file}: applied {len(patch)} bytes of patch")
+        return
+
+    if args.base_unicodes is None or args.unicodes is None:
+        parser.error("--base-unicodes and --unicodes are required unless applying a patch")
+    from . import output_path
+
+    start = time.perf_counter()
+    augmenter = Augmenter(data, args.remove.split(",") if args.remove else None, args.glyph_names)
+    augmented = augmenter.augment(args.base_unicodes, args.unicodes)
+    output_file = args.output or output_path(args.font_file)
+    with open(output_file, "wb") as f:
+        f.write(augmented)
+    line = f"{output_file}: {len(augmented)} bytes"
+    if args.patch:
+        if args.previous:
+            with open(args.previous, "rb") as f:
+                patch = make_patch(f.read(), augmented)
+        else:
+            patch = augmenter.patch(args.base_unicodes, args.unicodes)
+        with open(args.patch, "wb") as f:
+            f.write(patch)
+        line += f", patch {args.patch}: {len(patch)} bytes"
+    print(f"{line} in {time.perf_counter() - start:.2f} s")
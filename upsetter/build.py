@@ -0,0 +1,205 @@
+"""
+Incremental builds of font directories.
+
+Input directories are walked for fonts, and every font is mapped to an output path
+under the output directory, mirroring the directory tree. A manifest in the output
+directory records, per output, the content hash of its input and a fingerprint of
+the options and tool versions it was built with. On the next build, only outputs
+whose input, options or files changed are rebuilt; everything else is skipped.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import time
+
+from . import _upset_file_job, run_batch, validate_features
+
+MANIFEST = ".upsetter-manifest.json"
+FONT_EXTENSIONS = (".ttf", ".otf")
+
+
+def find_fonts(inputs, out_dir):
+    """Map every font in inputs (font files or directories) to its output path under out_dir.
+    Returns a list of (input, output) tuples. Raises ValueError if a font is given more than once,
+    several fonts map to the same output or an output would overwrite its input."""
+    out_dir = os.path.abspath(out_dir)
+    targets = []
+    for path in inputs:
+        if not os.path.isdir(path):
+            targets.append((path, os.path.join(out_dir, os.path.basename(path))))
+            continue
+        for directory, directories, files in os.walk(path):
+            # Don't descend into the output directory, and walk in a stable order
+            directories[:] = sorted(d for d in directories if os.path.abspath(os.path.join(directory, d)) != out_dir)
+            for file in sorted(files):
+                if file.lower().endswith(FONT_EXTENSIONS) and ".upset." not in file:
+                    font_file = os.path.join(directory, file)
+                    targets.append((font_file, os.path.join(out_dir, os.path.relpath(font_file, path))))
+
+    for paths, message in (
+        ([os.path.abspath(font_file) for font_file, _ in targets], "Fonts given more than once"),
+        ([output for _, output in targets], "Several fonts map to the same output"),
+    ):
+        seen = set()
+        duplicates = sorted({path for path in paths if path in seen or seen.add(path)})
+        if duplicates:
+            raise ValueError(f"{message}: {', '.join(duplicates)}")
+    for font_file, output in targets:
+        if os.path.abspath(font_file) == output:
+            raise ValueError(f"Output {output} would overwrite its input")
+    return targets
+
+
+def fingerprint(options):
+    """Hash of the options that affect the outputs, and of the versions of the tools"""
+    from .cache import _versions, normalize_subspace, normalize_unicodes
+
+    normalized = {
+        "unicodes": normalize_unicodes(options.get("unicodes")),
+        "subspace": normalize_subspace(options["subspace"]) if options.get("subspace") else None,
+        "freeze_features": list(options["freeze_features"]) if options.get("freeze_features") is not None else None,
+        "remove_features": sorted(options.get("remove_features") or []),
+        "name": options.get("name") or "",
+        "keep_glyph_names": bool(options.get("keep_glyph_names")),
+        "compress": bool(options.get("compress")),
+        "woff": bool(options.get("woff")),
+        "compress_quality": options.get("compress_quality", 11),
+        "prune_layout": bool(options.get("prune_layout")),
+        "compact": list(options.get("compact") or []),
+        "versions": _versions(),
+    }
+    return hashlib.sha256(json.dumps(normalized, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def file_hash(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def load_manifest(out_dir):
+    try:
+        with open(os.path.join(out_dir, MANIFEST), encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def save_manifest(out_dir, manifest):
+    path = os.path.join(out_dir, MANIFEST)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(path + ".tmp", path)
+
+
+def _input_state(font_file, previous):
+    """Size, modification time and content hash of an input. The hash of the previous build
+    is reused if size and modification time are unchanged, like make does."""
+    stat = os.stat(font_file)
+    if previous and previous.get("input_size") == stat.st_size and previous.get("input_mtime") == stat.st_mtime_ns:
+        return previous["input_size"], previous["input_mtime"], previous["input_hash"]
+    return stat.st_size, stat.st_mtime_ns, file_hash(font_file)
+
+
+def _stale_reason(entry, input_hash, options_fingerprint, out_dir):
+    """Why an output has to be rebuilt, or None if it's up to date"""
+    if entry is None:
+        return "new"
+    if entry["input_hash"] != input_hash:
+        return "input changed"
+    if entry["fingerprint"] != options_fingerprint:
+        return "options changed"
+    for output, size in entry["outputs"].items():
+        path = os.path.join(out_dir, output)
+        if not os.path.exists(path) or os.path.getsize(path) != size:
+            return "output missing or modified"
+    return None
+
+
+def _build_job(font_file, output_file, **options):
+    os.makedirs(os.path.dirname(output_file), exist_ok=True)
+    start = time.perf_counter()
+    outputs, cache_stats = _upset_file_job(font_file, output_file=output_file, **options)
+    return outputs, cache_stats, time.perf_counter() - start
+
+
+def build(
+    inputs, out_dir, jobs=1, force=False, metrics=None, cache_dir=None, cache_size=None, max_memory=None, **options
+):
+    """Build all fonts in inputs (font files or directories) into out_dir, skipping up-to-date outputs.
+    options are the processing options of upset_file(). With jobs > 1, stale fonts are built in parallel,
+    within max_memory bytes if given (see upsetter.scheduler).
+    force rebuilds all outputs. Returns the build log, a dict with the keys "built", "skipped" and "failed",
+    each a list of dicts with the keys "input", "output" and "reason" ("outputs", "seconds" or "error")."""
+    validate_features(options.get("freeze_features"), options.get("remove_features"))
+    os.makedirs(out_dir, exist_ok=True)
+    targets = find_fonts(inputs, out_dir)
+    options_fingerprint = fingerprint(options)
+    previous = load_manifest(out_dir)
+    # Entries of outputs that other inputs were built into are kept
+    manifest = dict(previous)
+
+    log = {"built": [], "skipped": [], "failed": []}
+    stale = []
+    for font_file, output_file in targets:
+        key = os.path.relpath(output_file, out_dir)
+        entry = previous.get(key)
+        try:
+            input_size, input_mtime, input_hash = _input_state(font_file, entry)
+        except OSError as e:
+            manifest.pop(key, None)
+            log["failed"].append({"input": font_file, "output": output_file, "error": f"{type(e).__name__}: {e}"})
+            continue
+        reason = "forced" if force else _stale_reason(entry, input_hash, options_fingerprint, out_dir)
+        record = {"input": font_file, "output": output_file, "reason": reason}
+        if reason is None:
+            # Keep the manifest entry, refreshing the input's modification time
+            manifest[key] = dict(entry, input_size=input_size, input_mtime=input_mtime)
+            record.update(reason="up to date", outputs=[os.path.join(out_dir, output) for output in entry["outputs"]])
+            log["skipped"].append(record)
+        else:
+            manifest[key] = dict(input_size=input_size, input_mtime=input_mtime, input_hash=input_hash)
+            stale.append((font_file, key, record))
+
+    logging.info(f"{len(stale)} of {len(targets)} outputs are out of date")
+    font_files = [font_file for font_file, _, _ in stale]
+    batch = run_batch(
+        _build_job,
+        font_files,
+        jobs=jobs,
+        metrics=metrics,
+        max_memory=max_memory,
+        file_options=[{"output_file": record["output"]} for _, _, record in stale],
+        cache_dir=cache_dir,
+        cache_size=cache_size,
+        **options,
+    )
+    cache = None
+    if cache_dir:
+        from .cache import StageCache
+
+        cache = StageCache(cache_dir)
+    for (font_file, key, record), (result, error) in zip(stale, batch):
+        if error is not None:
+            # Leave the output out of the manifest, so that it's rebuilt next time
+            del manifest[key]
+            log["failed"].append(dict(record, error=error))
+            continue
+        outputs, cache_stats, seconds = result
+        if cache_stats:
+            cache.merge_stats(cache_stats)
+        manifest[key].update(
+            fingerprint=options_fingerprint,
+            outputs={os.path.relpath(output, out_dir): os.path.getsize(output) for output in outputs},
+        )
+        log["built"].append(dict(record, outputs=outputs, seconds=round(seconds, 3)))
+
+    save_manifest(out_dir, manifest)
+    if cache is not None:
+        logging.info(cache.summary())
+    logging.info(f"Built {len(log['built'])}, skipped {len(log['skipped'])}, failed {len(log['failed'])}")
+    return log
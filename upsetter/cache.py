@@ -0,0 +1,257 @@
+"""
+On-disk cache for the results of the pipeline stages.
+
+Every stage result is stored under a key that hashes the input font's bytes
+together with the normalized parameters of that stage and of all stages before it.
+Results are stored after sub-spacing, after feature-freezing, after subsetting
+and after WOFF2/WOFF compression, so a hit at any stage skips all work up to it.
+
+The cache is bounded in size. When it grows beyond its limit, the least recently
+used entries are evicted first. The size is measured once and then tracked as entries
+are written, so that writes don't have to walk the cache. Entries written by other
+processes are only accounted for when the cache is walked again for an eviction.
+"""
+
+import functools
+import hashlib
+import io
+import logging
+import os
+import tempfile
+
+from . import metrics
+
+STAGES = ["subspace", "freeze", "prune", "subset", "compact", "woff2", "woff"]
+DEFAULT_MAX_SIZE = 1024**3
+
+
+@functools.lru_cache(maxsize=None)
+def _versions():
+    from importlib.metadata import PackageNotFoundError, version
+
+    versions = []
+    for package in ("upsetter", "fonttools", "opentype-feature-freezer"):
+        try:
+            versions.append(f"{package}={version(package)}")
+        except PackageNotFoundError:
+            versions.append(f"{package}=unknown")
+    return ";".join(versions)
+
+
+def normalize_subspace(subspace):
+    """Turn the result of parseLimits() into a stable string"""
+    return ",".join(f"{tag}={limits!r}" for tag, limits in sorted(subspace.items()))
+
+
+def normalize_unicodes(unicodes):
+    """Turn a unicodes string as taken by font_subset() into a stable string"""
+    if unicodes is None:
+        return "all"
+    from fontTools.subset import parse_unicodes
+
+    return ",".join(f"{u:X}" for u in sorted(set(parse_unicodes(unicodes))))
+
+
+class StageCache:
+    def __init__(self, cache_dir, max_size=DEFAULT_MAX_SIZE):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.hits = {stage: 0 for stage in STAGES}
+        self.misses = {stage: 0 for stage in STAGES}
+        # Total size of the entries, measured on the first write
+        self.size = None
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def key(self, parent, stage, *params):
+        """Key of a stage result, derived from the key of the previous stage (or the input font's hash)"""
+        h = hashlib.sha256()
+        for part in (parent, stage) + params:
+            h.update(repr(part).encode("utf-8"))
+            h.update(b"\0")
+        return h.hexdigest()
+
+    def input_key(self, data):
+        h = hashlib.sha256(_versions().encode("utf-8"))
+        h.update(data)
+        return h.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key)
+
+    def get(self, stage, key):
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            # Mark as recently used
+            os.utime(path)
+        except FileNotFoundError:
+            self.misses[stage] += 1
+            return None
+        self.hits[stage] += 1
+        return data
+
+    def _entries(self):
+        """(modification time, size, path) of all entries"""
+        entries = []
+        for directory, _, files in os.walk(self.cache_dir):
+            for file in files:
+                if file.endswith(".tmp"):
+                    continue
+                path = os.path.join(directory, file)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def put(self, key, data):
+        path = self._path(key)
+        if self.size is None:
+            self.size = sum(size for _, size, _ in self._entries())
+        try:
+            replaced = os.path.getsize(path)
+        except FileNotFoundError:
+            replaced = 0
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write atomically so that parallel workers never read half-written entries
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, path)
+        self.size += len(data) - replaced
+        if self.size > self.max_size:
+            self.evict()
+
+    def evict(self):
+        """Delete least recently used entries until the cache fits into max_size"""
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(path)
+                logging.info(f"Evicted {path} from cache")
+            except FileNotFoundError:
+                pass
+            total -= size
+        self.size = total
+
+    def stats(self):
+        return {"hits": dict(self.hits), "misses": dict(self.misses)}
+
+    def merge_stats(self, stats):
+        for stage in STAGES:
+            self.hits[stage] += stats["hits"][stage]
+            self.misses[stage] += stats["misses"][stage]
+
+    def summary(self):
+        hits, misses = sum(self.hits.values()), sum(self.misses.values())
+        stages = ", ".join(f"{stage}: {self.hits[stage]}/{self.misses[stage]}" for stage in STAGES)
+        return f"Cache: {hits} hits, {misses} misses (hits/misses per stage: {stages})"
+
+
+def _compile(ttFont):
+    stream = io.BytesIO()
+    with metrics.stage("save"):
+        ttFont.save(stream)
+    return stream.getvalue()
+
+
+def cached_upset_file(
+    cache,
+    font_file,
+    output_file,
+    unicodes=None,
+    subspace=None,
+    freeze_features=None,
+    remove_features=None,
+    name="",
+    keep_glyph_names=False,
+    compress=False,
+    woff=False,
+    compress_quality=11,
+    prune_layout=False,
+    compact=None,
+):
+    """Like upset_file(), but reuses and stores stage results in the cache. Returns the list of written files."""
+    from . import font_compact, font_freeze_features, font_prune_layout, font_subset, font_subspace
+    from .compress import FLAVORS, compress_bytes
+    from .plan import close_font, open_font, passthrough_tables, restore_raw, table_plan
+
+    with open(font_file, "rb") as f:
+        data = f.read()
+    metrics.record_sizes("input", data=data)
+
+    # Chain the keys of all configured stages
+    stages = []
+    key = cache.input_key(data)
+    if subspace:
+        key = cache.key(key, "subspace", normalize_subspace(subspace))
+        stages.append(("subspace", key, lambda ttFont: font_subspace(ttFont, subspace, inplace=True)))
+    if freeze_features is not None:
+        key = cache.key(key, "freeze", list(freeze_features), name or "")
+        stages.append(
+            ("freeze", key, lambda ttFont: font_freeze_features(ttFont, freeze_features, name, inplace=True))
+        )
+        if prune_layout:
+            key = cache.key(key, "prune")
+            stages.append(("prune", key, lambda ttFont: font_prune_layout(ttFont, inplace=True)))
+    key = cache.key(key, "subset", normalize_unicodes(unicodes), sorted(remove_features or []), bool(keep_glyph_names))
+    stages.append(
+        (
+            "subset",
+            key,
+            lambda ttFont: font_subset(ttFont, unicodes, remove_features, keep_glyph_names, inplace=True),
+        )
+    )
+    if compact:
+        key = cache.key(key, "compact", list(compact))
+        stages.append(("compact", key, lambda ttFont: font_compact(ttFont, compact, inplace=True)))
+    flavors = [flavor for flavor, enabled in (("woff2", compress), ("woff", woff)) if enabled]
+    compressed = {}
+    for flavor in flavors:
+        flavor_key = cache.key(key, flavor, compress_quality)
+        compressed[flavor] = flavor_key, cache.get(flavor, flavor_key)
+
+    # Look for the latest stage that is cached, and only run the stages after it.
+    # After each stage, continue from the stored result so that hits and misses produce the same output.
+    remaining = list(stages)
+    while remaining:
+        stage, key, _ = remaining[-1]
+        cached = cache.get(stage, key)
+        if cached is not None:
+            logging.info(f"Reusing cached {stage} result for {font_file}")
+            data = cached
+            break
+        remaining.pop()
+    for stage, key, run in stages[len(remaining) :]:
+        logging.info(f"Running {stage} for {font_file}, no cached result")
+        ttFont = open_font(data)
+        # Every stage passes the tables it doesn't change through
+        tags = ttFont.keys()
+        plan = table_plan(tags, subspace, freeze_features, name, prune_layout, compact)
+        ttFont = run(ttFont)
+        restore_raw(ttFont, passthrough_tables(tags, {stage: plan[stage]}))
+        data = _compile(ttFont)
+        cache.put(key, data)
+        close_font(ttFont)
+
+    with open(output_file, "wb") as f:
+        f.write(data)
+    outputs = [output_file]
+
+    for flavor in flavors:
+        flavor_key, flavor_data = compressed[flavor]
+        if flavor_data is None:
+            flavor_data = compress_bytes(data, flavor, compress_quality)
+            cache.put(flavor_key, flavor_data)
+        else:
+            logging.info(f"Reusing cached {flavor} result for {font_file}")
+        outputs.append(os.path.splitext(output_file)[0] + FLAVORS[flavor])
+        with open(outputs[-1], "wb") as f:
+            f.write(flavor_data)
+
+    return outputs
@@ -1,10 +1,52 @@
 import argparse
+import json
 import logging
+import sys
 from . import upset
-from fontTools.varLib.instancer import parseLimits
+from .metrics import STAGES, Metrics
+
+SIZE_UNITS = {"": 1, "K": 1024, "M": 1024**2, "G": 1024**3, "T": 1024**4}
+
+
+def parse_size(size):
+    """Parse a size in bytes with an optional unit, e.g. '500M' or '2G'"""
+    size = size.strip().upper().rstrip("B")
+    unit = size[-1:] if size[-1:] in SIZE_UNITS else ""
+    try:
+        return int(float(size[: len(size) - len(unit)]) * SIZE_UNITS[unit])
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Invalid size: {size}")
+
+
+def non_negative_int(value):
+    """Parse a number of processes, where 0 means all CPUs"""
+    try:
+        number = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Invalid number: {value}")
+    if number < 0:
+        raise argparse.ArgumentTypeError(f"Must be 0 or more: {value}")
+    return number
 
 
 def main():
+    if sys.argv[1:2] == ["serve"]:
+        from .server import main as serve
+
+        return serve(sys.argv[2:])
+    if sys.argv[1:2] == ["estimate"]:
+        from .estimate import main as estimate
+
+        return estimate(sys.argv[2:])
+    if sys.argv[1:2] == ["augment"]:
+        from .augment import main as augment
+
+        return augment(sys.argv[2:])
+    if sys.argv[1:2] == ["verify"]:
+        from .verify import main as verify
+
+        return verify(sys.argv[2:])
+
     parser = argparse.ArgumentParser(
         description="Modern font subsetter – mostly a wrapper around various existing tools",
         epilog="Example: upsetter -s wdth=100,wght=400:700 font1.ttf font2.ttf",
@@ -45,6 +87,26 @@ def main():
         type=str,
         help="Comma-separated list of features to remove. E.g.: 'ss01' or 'ss01,ss02'",
     )
+    parser.add_argument(
+        "--prune-layout",
+        help=(
+            "After freezing, remove the layout rules that can't fire anymore because their glyphs are always "
+            "substituted by the frozen features, and the glyphs only these rules produced. "
+            "Reports the saving with -v."
+        ),
+        action="store_true",
+    )
+    parser.add_argument(
+        "--compact",
+        required=False,
+        type=str,
+        help=(
+            "Comma-separated list of compaction techniques to apply after subsetting, or 'all': "
+            "dehint (remove hinting), flatten (flatten nested components of static fonts), "
+            "iup (optimize gvar deltas), desubroutinize and subroutinize (CFF/CFF2, needs cffsubr). "
+            "Reports the bytes every technique saved with -v and in --metrics-json."
+        ),
+    )
     # parser.add_argument(
     #     "-i",
     #     "--italic",
@@ -65,37 +127,416 @@ def main():
         help="Compress the font to WOFF2",
         action="store_true",
     )
+    parser.add_argument(
+        "--woff",
+        help="Also compress the font to WOFF 1.0",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--compress-quality",
+        required=False,
+        type=int,
+        choices=range(12),
+        metavar="{0-11}",
+        help="Compression effort for WOFF2/WOFF, from 0 (fastest) to 11 (smallest). Default is 11.",
+    )
+    parser.add_argument(
+        "--compress-jobs",
+        required=False,
+        type=non_negative_int,
+        default=1,
+        help=(
+            "Number of worker processes that compress finished fonts while the next font is processed "
+            "(only with --jobs 1). 0 uses all available CPUs. Default is 1."
+        ),
+    )
     parser.add_argument(
         "--glyph-names",
         help="Keep glyph names intact. Default is to remove them to save space.",
         action="store_true",
     )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        required=False,
+        type=non_negative_int,
+        default=1,
+        help="Number of fonts to process in parallel. 0 uses all available CPUs. Default is 1.",
+    )
+    parser.add_argument(
+        "--max-memory",
+        required=False,
+        type=parse_size,
+        help=(
+            "Memory budget of the parallel jobs, e.g. '8G'. Fonts only run in parallel while their estimated "
+            "memory fits into it, and fonts that need more run alone. Not for --spec."
+        ),
+    )
     parser.add_argument(
         "-v",
         "--verbose",
         help="Be verbose. Set logging level to INFO.",
         action="store_true",
     )
-    parser.add_argument("font_files", nargs="+", help="Font files to process (repeatable)")
+    parser.add_argument(
+        "--cache-dir",
+        required=False,
+        type=str,
+        help=(
+            "Cache the results of each processing stage in this directory and reuse them "
+            "when the same font is processed again with the same options."
+        ),
+    )
+    parser.add_argument(
+        "--cache-size",
+        required=False,
+        type=parse_size,
+        help=(
+            "Maximum size of the cache, e.g. '500M' or '2G'. Least recently used results are evicted first. "
+            "Default is 1G."
+        ),
+    )
+    parser.add_argument(
+        "--slice",
+        required=False,
+        type=str,
+        action="append",
+        help=(
+            "Split each font into slices for CSS unicode-range loading, with this list of unicodes "
+            "in the same format as --unicodes making up one slice (repeatable). "
+            "Writes one font per slice plus a CSS file with the @font-face rules."
+        ),
+    )
+    parser.add_argument(
+        "--slice-strategy",
+        required=False,
+        type=str,
+        help=(
+            "Split each font into slices using a built-in strategy instead of --slice: "
+            "'blocks' for one slice per Unicode block, or a number of characters per slice."
+        ),
+    )
+    parser.add_argument(
+        "--slice-family",
+        required=False,
+        type=str,
+        help="Font family name to use in the generated CSS. Default is the font's family name.",
+    )
+    parser.add_argument(
+        "--spec",
+        required=False,
+        type=str,
+        help=(
+            "JSON or TOML job spec listing several outputs per source font. "
+            "Shared parts of the pipeline are only run once per source font. "
+            "Can't be combined with font files."
+        ),
+    )
+    parser.add_argument(
+        "--instances",
+        help=(
+            "Make a static font of every named instance of variable fonts, saved as <name>.upset.<instance>.<ext>. "
+            "Parsing and feature-freezing are shared between the instances, which are made in parallel with -j."
+        ),
+        action="store_true",
+    )
+    parser.add_argument(
+        "--instance",
+        required=False,
+        type=str,
+        action="append",
+        help=(
+            "Like --instances, but only for this named instance (e.g. 'Bold') "
+            "or location (e.g. 'wght=700,wdth=100' or 'wght=400:700'). Repeatable."
+        ),
+    )
+    parser.add_argument(
+        "--out-dir",
+        required=False,
+        type=str,
+        help=(
+            "Build into this directory instead of next to the fonts, mirroring the tree of input directories. "
+            "Outputs that are up to date with their input and the options are skipped."
+        ),
+    )
+    parser.add_argument(
+        "--force",
+        help="With --out-dir, rebuild all outputs even if they are up to date.",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--build-log",
+        required=False,
+        type=str,
+        help="With --out-dir, write the built, skipped and failed outputs to this JSON file.",
+    )
+    parser.add_argument(
+        "--report",
+        help=(
+            "Print the glyphs, layout features, their lookup types and which features can be frozen "
+            "by remapping the cmap, then exit without processing the fonts."
+        ),
+        action="store_true",
+    )
+    parser.add_argument(
+        "--profile",
+        required=False,
+        type=str,
+        help=(
+            "Comma-separated list of stages to run under cProfile, or 'all'. "
+            "Profiles are saved as <font>.<stage>.prof next to the font files. "
+            f"Stages: {', '.join(STAGES)}."
+        ),
+    )
+    parser.add_argument(
+        "--trace-memory",
+        help="Measure the peak of Python memory allocations per stage with tracemalloc (slow).",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--metrics-json",
+        required=False,
+        type=str,
+        help="Write wall time, CPU time and peak memory of every stage and font to this JSON file.",
+    )
+    parser.add_argument(
+        "--table-sizes",
+        help=(
+            "Print the size of every table of the input, after every stage and of the compressed outputs. "
+            "Stages restored from the cache are not listed."
+        ),
+        action="store_true",
+    )
+    parser.add_argument(
+        "--table-sizes-json",
+        required=False,
+        type=str,
+        help="Write the size of every table after every stage to this JSON file, along with exceeded budgets.",
+    )
+    parser.add_argument(
+        "--budget",
+        required=False,
+        type=str,
+        action="append",
+        help=(
+            "Fail if an output exceeds a size budget (repeatable): a size like '60K' for every output file, "
+            "'woff2=40K' for the output files of a format (ttf, otf, woff2 or woff), "
+            "or 'GPOS=8K' for a table of the uncompressed outputs."
+        ),
+    )
+    parser.add_argument(
+        "font_files", nargs="*", help="Font files to process (repeatable), or directories of fonts with --out-dir"
+    )
 
     args = parser.parse_args()
 
+    if args.spec and args.font_files:
+        parser.error("--spec can't be combined with font files")
+    if not args.spec and not args.font_files:
+        parser.error("the following arguments are required: font_files")
+
     if args.verbose:
         logging.basicConfig(level=logging.INFO)
     else:
         logging.basicConfig(level=logging.WARNING)
 
-    upset(
-        args.font_files,
-        unicodes=args.unicodes or None,
-        subspace=parseLimits(args.subspace.split(",")) if args.subspace else None,
-        freeze_features=args.freeze.split(",") if args.freeze else None,
-        remove_features=args.remove.split(",") if args.remove else None,
-        name=args.name,
-        # italic=args.italic,
-        compress=args.compress,
-        keep_glyph_names=args.glyph_names,
-    )
+    if args.slice and args.slice_strategy:
+        parser.error("--slice and --slice-strategy can't be combined")
+    if args.out_dir and (args.spec or args.slice or args.slice_strategy):
+        parser.error("--out-dir can't be combined with --spec or slicing")
+    instances = args.instances or args.instance
+    if instances and (args.subspace or args.spec or args.slice or args.slice_strategy or args.out_dir):
+        parser.error("--instances and --instance can't be combined with --subspace, --spec, slicing or --out-dir")
+    if args.max_memory and args.spec:
+        parser.error("--max-memory can't be combined with --spec")
+    if args.spec:
+        # Job specs set the processing options per output
+        spec_options = {
+            "--subspace": args.subspace,
+            "--unicodes": args.unicodes,
+            "--freeze": args.freeze,
+            "--remove": args.remove,
+            "--prune-layout": args.prune_layout,
+            "--compact": args.compact,
+            "--name": args.name,
+            "--compress": args.compress,
+            "--woff": args.woff,
+            "--compress-quality": args.compress_quality is not None,
+            "--glyph-names": args.glyph_names,
+        }
+        given = [option for option, value in spec_options.items() if value]
+        if given:
+            parser.error(f"{', '.join(given)} can't be combined with --spec, set them in the job spec instead")
+    if args.compress_quality is None:
+        args.compress_quality = 11
+    if (args.cache_dir or args.cache_size) and (instances or args.spec or args.slice or args.slice_strategy):
+        parser.error("--cache-dir and --cache-size can't be combined with instances, --spec or slicing")
+
+    if args.report:
+        from fontTools.ttLib import TTFont
+
+        from .layout_index import LayoutIndex
+
+        for font_file in args.font_files:
+            print(f"{font_file}\n{LayoutIndex(TTFont(font_file)).report()}\n")
+        return
+
+    from .sizes import check_budgets, parse_budget, size_report, size_summary
+
+    try:
+        budgets = [parse_budget(budget, parse_size) for budget in args.budget or []]
+    except (AssertionError, argparse.ArgumentTypeError) as e:
+        parser.error(str(e))
+
+    compact = None
+    if args.compact:
+        from .compact import parse_techniques
+
+        try:
+            compact = parse_techniques(args.compact)
+        except AssertionError as e:
+            parser.error(str(e))
+
+    metrics = None
+    table_sizes = args.table_sizes or bool(args.table_sizes_json)
+    if args.profile or args.trace_memory or args.metrics_json or args.verbose or table_sizes:
+        metrics = Metrics(
+            profile=args.profile.split(",") if args.profile else (),
+            trace_memory=args.trace_memory,
+            table_sizes=table_sizes,
+        )
+
+    subspace = None
+    if args.subspace:
+        from fontTools.varLib.instancer import parseLimits
+
+        subspace = parseLimits(args.subspace.split(","))
+
+    if instances:
+        from .instances import instance_fonts
+
+        results = instance_fonts(
+            args.font_files,
+            instances=args.instance,
+            unicodes=args.unicodes or None,
+            freeze_features=args.freeze.split(",") if args.freeze else None,
+            remove_features=args.remove.split(",") if args.remove else None,
+            name=args.name,
+            compress=args.compress,
+            woff=args.woff,
+            compress_quality=args.compress_quality,
+            keep_glyph_names=args.glyph_names,
+            prune_layout=args.prune_layout,
+            compact=compact,
+            jobs=args.jobs or None,
+            max_memory=args.max_memory,
+            metrics=metrics,
+        )
+    elif args.out_dir:
+        from .build import build
+
+        try:
+            log = build(
+                args.font_files,
+                args.out_dir,
+                unicodes=args.unicodes or None,
+                subspace=subspace,
+                freeze_features=args.freeze.split(",") if args.freeze else None,
+                remove_features=args.remove.split(",") if args.remove else None,
+                name=args.name,
+                compress=args.compress,
+                woff=args.woff,
+                compress_quality=args.compress_quality,
+                keep_glyph_names=args.glyph_names,
+                prune_layout=args.prune_layout,
+                compact=compact,
+                jobs=args.jobs or None,
+                max_memory=args.max_memory,
+                force=args.force,
+                cache_dir=args.cache_dir,
+                cache_size=args.cache_size,
+                metrics=metrics,
+            )
+        except ValueError as e:
+            # Inputs that can't be mapped to outputs, see find_fonts()
+            parser.error(str(e))
+        if args.build_log:
+            with open(args.build_log, "w", encoding="utf-8") as f:
+                json.dump(log, f, indent=2)
+        print(f"Built {len(log['built'])}, skipped {len(log['skipped'])}, failed {len(log['failed'])}")
+        results = [dict(record, error=record.get("error")) for records in log.values() for record in records]
+    elif args.spec:
+        from .spec import run_spec_file
+
+        results = run_spec_file(args.spec, jobs=args.jobs or None, metrics=metrics)
+    elif args.slice or args.slice_strategy:
+        from .slicer import slice_fonts
+
+        results = slice_fonts(
+            args.font_files,
+            slices=args.slice,
+            strategy=args.slice_strategy,
+            unicodes=args.unicodes or None,
+            subspace=subspace,
+            freeze_features=args.freeze.split(",") if args.freeze else None,
+            remove_features=args.remove.split(",") if args.remove else None,
+            name=args.name,
+            compress=args.compress,
+            woff=args.woff,
+            compress_quality=args.compress_quality,
+            keep_glyph_names=args.glyph_names,
+            prune_layout=args.prune_layout,
+            compact=compact,
+            family=args.slice_family,
+            jobs=args.jobs or None,
+            max_memory=args.max_memory,
+            metrics=metrics,
+        )
+    else:
+        results = upset(
+            args.font_files,
+            unicodes=args.unicodes or None,
+            subspace=subspace,
+            freeze_features=args.freeze.split(",") if args.freeze else None,
+            remove_features=args.remove.split(",") if args.remove else None,
+            name=args.name,
+            # italic=args.italic,
+            compress=args.compress,
+            woff=args.woff,
+            compress_quality=args.compress_quality,
+            compress_jobs=args.compress_jobs or None,
+            keep_glyph_names=args.glyph_names,
+            prune_layout=args.prune_layout,
+            compact=compact,
+            jobs=args.jobs or None,
+            max_memory=args.max_memory,
+            cache_dir=args.cache_dir,
+            cache_size=args.cache_size,
+            metrics=metrics,
+        )
+
+    if metrics is not None:
+        logging.info(f"Time and memory per stage:\n{metrics.report()}")
+        if args.metrics_json:
+            with open(args.metrics_json, "w", encoding="utf-8") as f:
+                json.dump(metrics.to_json(), f, indent=2)
+
+    exceeded = check_budgets([output for result in results for output in result.get("outputs") or []], budgets)
+    for budget in exceeded:
+        logging.error(
+            f"{budget['file']}: {budget['budget'].strip()} is {budget['size']} bytes, over {budget['limit']}"
+        )
+    if args.table_sizes:
+        print(size_report(metrics.records))
+    if args.table_sizes_json:
+        with open(args.table_sizes_json, "w", encoding="utf-8") as f:
+            json.dump({"fonts": size_summary(metrics.records), "budgets": exceeded}, f, indent=2)
+
+    failed = [result for result in results if result["error"]]
+    if failed:
+        parser.exit(1, f"{len(failed)} of {len(results)} outputs failed\n")
+    if exceeded:
+        parser.exit(1, f"{len(exceeded)} size budgets exceeded\n")
 
 
 if __name__ == "__main__":
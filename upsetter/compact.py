@@ -0,0 +1,183 @@
+"""
+Compaction of the outlines and variation data that remain after instancing and subsetting.
+
+Every technique is switched on by name, and they run in this order:
+
+- dehint: remove TrueType instructions and the hinting tables, or the hints of CFF charstrings
+- flatten: replace nested components of composite glyphs by the components they consist of,
+  so that every composite glyph refers to simple glyphs only (static TrueType fonts only).
+  This is for renderers that handle nested components poorly, and usually costs a few bytes.
+  Composite glyphs with instructions are left alone, so it works best after dehint.
+- iup: drop the gvar deltas that can be inferred by interpolation (IUP) from the other deltas,
+  within half a font unit. Deltas that were already optimized are left alone, as re-optimizing
+  them could add up to more than half a unit.
+- desubroutinize: inline the subroutines of CFF/CFF2 charstrings, which is bigger but often
+  compresses better with WOFF2
+- subroutinize: desubroutinize and subroutinize CFF/CFF2 again, for the whole font at once
+  (needs the cffsubr package, and is skipped with a warning without it)
+
+The savings of every technique are measured on the uncompressed tables it changed and reported
+per font; negative savings are costs. Techniques that don't apply to a font, like iup for fonts
+without gvar, save 0 bytes.
+"""
+
+import copy
+import logging
+import time
+
+TECHNIQUES = ["dehint", "flatten", "iup", "desubroutinize", "subroutinize"]
+# Tables only used by TrueType instructions, dropped by dehinting
+HINTING_TABLES = ["cvt ", "cvar", "fpgm", "prep", "hdmx", "VDMX", "LTSH"]
+CFF_TABLES = ["CFF ", "CFF2"]
+
+
+def parse_techniques(techniques):
+    """Techniques as a comma-separated string or list, 'all' for all of them, in the order they run"""
+    if isinstance(techniques, str):
+        techniques = techniques.split(",")
+    techniques = set(TECHNIQUES if "all" in techniques else techniques)
+    unknown = techniques - set(TECHNIQUES)
+    assert not unknown, f"Unknown compaction techniques {', '.join(sorted(unknown))}, use: {', '.join(TECHNIQUES)}"
+    return [technique for technique in TECHNIQUES if technique in techniques]
+
+
+def _size(ttFont, tags):
+    size = 0
+    for tag in tags:
+        if tag in ttFont:
+            size += len(ttFont[tag].compile(ttFont))
+            if tag == "glyf":
+                # Compiling glyf updates loca
+                size += len(ttFont["loca"].compile(ttFont))
+    return size
+
+
+def _dehint(ttFont):
+    if "glyf" in ttFont:
+        glyf = ttFont["glyf"]
+        for glyph_name in glyf.keys():
+            glyf[glyph_name].removeHinting()
+        for tag in HINTING_TABLES:
+            if tag in ttFont:
+                del ttFont[tag]
+        maxp = ttFont["maxp"]
+        if maxp.tableVersion == 0x00010000:
+            maxp.maxZones = 1
+            maxp.maxTwilightPoints = maxp.maxStorage = maxp.maxFunctionDefs = maxp.maxInstructionDefs = 0
+            maxp.maxStackElements = maxp.maxSizeOfInstructions = 0
+    for tag in CFF_TABLES:
+        if tag in ttFont:
+            import fontTools.subset.cff  # noqa: F401 (adds remove_hints() to the CFF tables)
+
+            ttFont[tag].remove_hints()
+
+
+def _flat_component(component):
+    # Components positioned by offsets, rather than by matching points, have x and y
+    return hasattr(component, "x") and not hasattr(component, "transform")
+
+
+def _flattened(glyf, component):
+    """Components that make up a component, with the offsets of nested components added up"""
+    from fontTools.ttLib.tables._g_l_y_f import USE_MY_METRICS
+
+    glyph = glyf[component.glyphName]
+    if (
+        not glyph.isComposite()
+        or not _flat_component(component)
+        or not all(_flat_component(nested) for nested in glyph.components)
+        or getattr(glyph, "program", None)
+    ):
+        return [component]
+    components = []
+    for nested in glyph.components:
+        for flattened in _flattened(glyf, nested):
+            flattened = copy.copy(flattened)
+            flattened.x += component.x
+            flattened.y += component.y
+            if not component.flags & USE_MY_METRICS:
+                flattened.flags &= ~USE_MY_METRICS
+            components.append(flattened)
+    return components
+
+
+def _flatten(ttFont):
+    if "glyf" not in ttFont:
+        return
+    if "gvar" in ttFont:
+        # The deltas of nested components would have to be merged
+        logging.info("Not flattening the components of a variable font")
+        return
+    glyf = ttFont["glyf"]
+    for glyph_name in glyf.keys():
+        glyph = glyf[glyph_name]
+        if glyph.isComposite() and not getattr(glyph, "program", None):
+            glyph.components = [
+                flattened for component in glyph.components for flattened in _flattened(glyf, component)
+            ]
+
+
+def _iup(ttFont):
+    if "gvar" not in ttFont or "glyf" not in ttFont:
+        return
+    glyf, gvar = ttFont["glyf"], ttFont["gvar"]
+    h_metrics = ttFont["hmtx"].metrics
+    v_metrics = ttFont["vmtx"].metrics if "vmtx" in ttFont else None
+
+    for glyph_name, variations in gvar.variations.items():
+        if all(None in variation.coordinates for variation in variations):
+            continue
+        coordinates, controls = glyf._getCoordinatesAndControls(glyph_name, h_metrics, v_metrics)
+        # Like the instancer, compare points as they are rendered
+        coordinates.toInt()
+        for variation in variations:
+            # Keeps deltas that are already optimized, and only uses the optimized ones if they are smaller
+            variation.optimize(coordinates, controls.endPts)
+
+
+def _desubroutinize(ttFont):
+    for tag in CFF_TABLES:
+        if tag in ttFont:
+            ttFont[tag].desubroutinize()
+
+
+def _subroutinize(ttFont):
+    if not any(tag in ttFont for tag in CFF_TABLES):
+        return
+    try:
+        import cffsubr
+    except ImportError:
+        logging.warning("Not subroutinizing, that needs cffsubr: pip install cffsubr")
+        return
+    cffsubr.subroutinize(ttFont)
+
+
+# Technique => function that applies it, and the tables whose sizes it changes
+_TECHNIQUES = {
+    "dehint": (_dehint, ["glyf", "maxp"] + HINTING_TABLES + CFF_TABLES),
+    "flatten": (_flatten, ["glyf"]),
+    "iup": (_iup, ["gvar"]),
+    "desubroutinize": (_desubroutinize, CFF_TABLES),
+    "subroutinize": (_subroutinize, CFF_TABLES),
+}
+
+
+def compact(ttFont, techniques):
+    """Apply compaction techniques (see TECHNIQUES) to a TTFont in place. Returns a dict of
+    technique => {"saved": bytes saved in the tables the technique changed, "seconds": time taken}."""
+    report = {}
+    for technique in parse_techniques(techniques):
+        function, tags = _TECHNIQUES[technique]
+        before = _size(ttFont, tags)
+        start = time.perf_counter()
+        function(ttFont)
+        seconds = time.perf_counter() - start
+        report[technique] = {"saved": before - _size(ttFont, tags), "seconds": round(seconds, 3)}
+    logging.info(
+        "Compacted: "
+        + ", ".join(
+            f"{technique} saved {result['saved']} bytes in {result['seconds']:.2f}s"
+            for technique, result in report.items()
+        )
+    )
+    return report
@@ -0,0 +1,152 @@
+"""
+Webfont compression stage: turn finished fonts into WOFF2 and optionally WOFF 1.0.
+
+Fonts are compressed from their saved bytes, so compression can run in other
+processes while the next font is still being processed. The compression effort
+is tunable with a quality setting from 0 (fastest) to 11 (smallest, the default).
+It is passed to brotli for WOFF2 as is and capped at 9 for WOFF 1.0's zlib compression.
+The quality only applies to compress_bytes() calls of the same thread or asyncio task,
+so concurrent requests with different settings don't interfere.
+
+fontTools has no quality option, so while compress_bytes() runs, the brotli module of its
+WOFF2 writer and the zlib compress() function of its WOFF writer are replaced process-wide
+with versions that apply the quality. They are restored when the last concurrent
+compress_bytes() call finishes. fontTools calls from other threads at the same time
+see the replacements, but without a quality set they behave like the originals.
+"""
+
+import contextlib
+import contextvars
+import io
+import logging
+import os
+import threading
+import time
+
+from .metrics import record_sizes, stage
+
+FLAVORS = {"woff2": ".woff2", "woff": ".woff"}
+MAX_QUALITY = 11
+
+
+# Compression quality of the current thread or task. None keeps the defaults of fontTools.
+_quality = contextvars.ContextVar("quality", default=None)
+_lock = threading.Lock()
+# Number of compress_bytes() calls in progress, and the fontTools attributes they replaced
+_active = 0
+_originals = None
+
+
+class _Brotli:
+    """Stand-in for the brotli module in fontTools' WOFF2 writer that applies the current compression quality"""
+
+    def __init__(self, brotli):
+        self._brotli = brotli
+
+    def __getattr__(self, name):
+        return getattr(self._brotli, name)
+
+    def compress(self, data, **kwargs):
+        quality = _quality.get()
+        if quality is not None:
+            kwargs["quality"] = quality
+        return self._brotli.compress(data, **kwargs)
+
+
+def _zlib_compress(data, *args, **kwargs):
+    """Stand-in for the compress() function of fontTools' WOFF writer that applies the current compression quality"""
+    zlib_compress = _originals[1]
+    quality = _quality.get()
+    if quality is not None:
+        return zlib_compress(data, min(quality, 9))
+    return zlib_compress(data, *args, **kwargs)
+
+
+@contextlib.contextmanager
+def _compression_quality(quality):
+    """Route fontTools' WOFF2 and WOFF compression in this thread or task through quality.
+    The first of concurrent calls replaces the fontTools attributes, the last one restores them."""
+    global _active, _originals
+    from fontTools.ttLib import sfnt, woff2
+
+    with _lock:
+        if not _active:
+            _originals = (woff2.brotli, sfnt.compress)
+            woff2.brotli = _Brotli(woff2.brotli)
+            sfnt.compress = _zlib_compress
+        _active += 1
+    token = _quality.set(quality)
+    try:
+        yield
+    finally:
+        _quality.reset(token)
+        with _lock:
+            _active -= 1
+            if not _active:
+                woff2.brotli, sfnt.compress = _originals
+                _originals = None
+
+
+def compress_bytes(data, flavor="woff2", quality=MAX_QUALITY):
+    """Compress the bytes of a TTF/OTF font to WOFF2 (or WOFF 1.0 with flavor='woff')"""
+    from fontTools.ttLib import TTFont
+
+    assert flavor in FLAVORS, f"Unknown flavor {flavor}, use one of: {', '.join(FLAVORS)}"
+    assert 0 <= quality <= MAX_QUALITY, f"Compression quality must be between 0 and {MAX_QUALITY}"
+    with stage("compress", flavor=flavor, quality=quality):
+        ttFont = TTFont(io.BytesIO(data), recalcBBoxes=False, recalcTimestamp=False)
+        ttFont.flavor = flavor
+        stream = io.BytesIO()
+        with _compression_quality(quality):
+            ttFont.save(stream, reorderTables=False)
+        ttFont.close()
+    record_sizes(flavor, data=stream.getvalue(), tables=False)
+    return stream.getvalue()
+
+
+def compress_file(font_file, woff2=True, woff=False, quality=MAX_QUALITY):
+    """Compress a font file into .woff2 and/or .woff files next to it.
+    Returns a report dict per written file with the keys "font_file", "output", "flavor",
+    "quality", "input_size", "output_size", "ratio" and "seconds"."""
+    with open(font_file, "rb") as f:
+        data = f.read()
+
+    reports = []
+    for flavor, enabled in (("woff2", woff2), ("woff", woff)):
+        if not enabled:
+            continue
+        start = time.perf_counter()
+        compressed = compress_bytes(data, flavor, quality)
+        output = os.path.splitext(font_file)[0] + FLAVORS[flavor]
+        with open(output, "wb") as f:
+            f.write(compressed)
+        report = {
+            "font_file": font_file,
+            "output": output,
+            "flavor": flavor,
+            "quality": quality,
+            "input_size": len(data),
+            "output_size": len(compressed),
+            "ratio": len(compressed) / len(data),
+            "seconds": time.perf_counter() - start,
+        }
+        logging.info(
+            f"Compressed {output} with quality {quality}: {report['input_size']} => {report['output_size']} bytes "
+            f"({report['ratio']:.1%}) in {report['seconds']:.2f}s"
+        )
+        reports.append(report)
+    return reports
+
+
+def compress_files(font_files, woff2=True, woff=False, quality=MAX_QUALITY, jobs=1):
+    """Compress several font files, in a pool of jobs worker processes if jobs > 1 (jobs=None uses all CPUs).
+    Returns one summary dict per font with the keys "font_file", "outputs", "reports" and "error"."""
+    from . import run_batch
+
+    results = []
+    batch = run_batch(compress_file, font_files, jobs=jobs, woff2=woff2, woff=woff, quality=quality)
+    for font_file, (reports, error) in zip(font_files, batch):
+        reports = reports or []
+        outputs = [report["output"] for report in reports]
+        results.append({"font_file": font_file, "outputs": outputs, "reports": reports, "error": error})
+    return results
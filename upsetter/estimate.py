@@ -0,0 +1,360 @@
+"""
+Fast estimates of the size of a subset font, for evaluating many candidate unicode sets,
+e.g. when choosing webfont slices. Started with `upsetter estimate`.
+
+The estimator analyses a font once: the bytes every glyph takes in the glyph tables
+(glyf, gvar, CFF, CFF2), an even share of the other per-glyph tables (metrics and layout),
+the cmap bytes per codepoint, and the closure of every glyph through GSUB substitutions
+and then composite components, like the subsetter does. An estimate then only adds up the
+costs of the glyphs a set of unicodes keeps, without subsetting.
+
+The costs of every table are calibrated against real subsets of the font shaped like real
+slices: its Unicode blocks and scripts, a single letter and all of its codepoints. Every sample
+is also estimated with the costs calibrated on the other samples, and the largest relative
+error of these held-out estimates is reported as the error bound. Slices unlike any sample may
+be off by more, e.g. glyphs of contextual substitutions are counted regardless of their context,
+and compressed sizes depend on how similar the glyphs of a set are. `--verify` reports the
+actual size as well.
+
+    upsetter estimate -u U+0000-00FF -u U+0100-024F --flavor woff2 --verify font.ttf
+"""
+
+import argparse
+import io
+import json
+import logging
+import struct
+import time
+
+from . import font_subset
+from .compress import FLAVORS, MAX_QUALITY, compress_bytes
+from .layout_index import LayoutIndex
+from .slicer import format_unicodes, split_codepoints
+
+# Tables with the exact byte ranges of every glyph
+GLYPH_TABLES = ["glyf", "gvar", "CFF ", "CFF2"]
+# Tables that grow with the number of glyphs, and are attributed to the glyphs evenly
+PER_GLYPH_TABLES = ["loca", "hmtx", "vmtx", "post", "GDEF", "GSUB", "GPOS", "HVAR", "VVAR", "kern", "hdmx", "VORG"]
+# Calibration samples are shaped like real slices: the Unicode blocks and scripts of the font's codepoints
+# with at least this many of them, the biggest first and at most MAX_SAMPLES, besides a single letter and all
+MIN_SAMPLE_UNICODES = 8
+MAX_SAMPLES = 24
+
+
+def calibration_samples(codepoints):
+    """Sets of codepoints to calibrate the estimates of a font with these codepoints against"""
+    from fontTools.unicodedata import script
+
+    codepoints = sorted(codepoints)
+    if not codepoints:
+        return [codepoints]
+    scripts = {}
+    for codepoint in codepoints:
+        scripts.setdefault(script(chr(codepoint)), []).append(codepoint)
+    groups = {tuple(group) for group in split_codepoints(codepoints, "blocks") + list(scripts.values())}
+    groups = [list(group) for group in sorted(groups, key=lambda group: (-len(group), group))]
+    groups = [group for group in groups if MIN_SAMPLE_UNICODES <= len(group) < len(codepoints)]
+    letter = next((codepoint for codepoint in codepoints if chr(codepoint).isalpha()), codepoints[0])
+    return [[letter]] + groups[:MAX_SAMPLES] + [codepoints]
+
+
+def _gvar_sizes(data):
+    """Bytes of the variation data of every glyph, from the offsets in the gvar header"""
+    glyph_count, flags, _ = struct.unpack(">HHI", data[12:20])
+    if flags & 1:
+        offsets = struct.unpack(f">{glyph_count + 1}I", data[20 : 20 + 4 * (glyph_count + 1)])
+    else:
+        offsets = [
+            offset * 2 for offset in struct.unpack(f">{glyph_count + 1}H", data[20 : 20 + 2 * (glyph_count + 1)])
+        ]
+    return [end - start for start, end in zip(offsets, offsets[1:])]
+
+
+def _charstring_sizes(ttFont, table_tag):
+    cff = ttFont[table_tag].cff
+    char_strings = cff[cff.fontNames[0]].CharStrings
+    offsets = getattr(char_strings.charStringsIndex, "offsets", None)
+    if offsets is None:
+        return None
+    return {name: offsets[index + 1] - offsets[index] for name, index in char_strings.charStrings.items()}
+
+
+def _scale(points):
+    """Least squares fit of y = scale * x to (x, y) points"""
+    squares = sum(x * x for x, _ in points)
+    return sum(x * y for x, y in points) / squares if squares else 1.0
+
+
+class SizeEstimator:
+    """Estimates the size of subsets of a font for sets of unicodes.
+
+    flavor is None for the size of the plain TTF/OTF, or "woff2" or "woff" for the compressed size
+    (compressing the calibration samples with the given quality). With calibrate=False, the raw sum
+    of the costs is returned, and the error bound is unknown (None)."""
+
+    def __init__(self, ttFont, flavor=None, quality=MAX_QUALITY, calibrate=True):
+        assert flavor is None or flavor in FLAVORS, f"Unknown flavor {flavor}, use one of: {', '.join(FLAVORS)}"
+        self.flavor = flavor
+        self.quality = quality
+        index = LayoutIndex(ttFont)
+        self.glyph_order = index.glyph_order
+        self.cmap = index.cmap
+
+        # Closure graphs: GSUB substitutions, and composite components, which the subsetter only adds
+        # after the GSUB closure. Ligatures are only added once all of their components are in a subset.
+        self.graph = {glyph_name: set(targets) for glyph_name, targets in index.unconditional_substitutions.items()}
+        self.ligatures = {}
+        for components, ligature in index.ligatures:
+            self.ligatures.setdefault(components[0], []).append((components, ligature))
+        self.components = {}
+        if "glyf" in ttFont:
+            glyf = ttFont["glyf"]
+            for glyph_name in self.glyph_order:
+                if glyf[glyph_name].isComposite():
+                    self.components[glyph_name] = set(glyf[glyph_name].getComponentNames(glyf))
+        self._closures = {}
+
+        # Costs of every glyph per table: its bytes in the glyph tables, and 1 in the other per-glyph tables
+        from fontTools.subset import Options
+
+        dropped = set(Options().drop_tables) | {"GlyphOrder"}
+        self.table_sizes = {tag: len(ttFont.getTableData(tag)) for tag in ttFont.keys() if tag not in dropped}
+        self.table_costs = {
+            tag: dict.fromkeys(self.glyph_order, 1) for tag in PER_GLYPH_TABLES if tag in self.table_sizes
+        }
+        if "glyf" in ttFont:
+            loca = ttFont["loca"]
+            self.table_costs["glyf"] = {
+                glyph_name: loca[glyph_id + 1] - loca[glyph_id] for glyph_id, glyph_name in enumerate(self.glyph_order)
+            }
+        if "gvar" in ttFont:
+            self.table_costs["gvar"] = dict(zip(self.glyph_order, _gvar_sizes(ttFont.getTableData("gvar"))))
+        for table_tag in ("CFF ", "CFF2"):
+            if table_tag in ttFont:
+                sizes = _charstring_sizes(ttFont, table_tag)
+                self.table_costs[table_tag] = sizes or dict.fromkeys(self.glyph_order, 1)
+
+        # Uncalibrated: the per-glyph tables are shared evenly, the other tables are kept as they are
+        scales = {tag: 1 for tag in GLYPH_TABLES}
+        scales.update({tag: self.table_sizes.get(tag, 0) / len(self.glyph_order) for tag in PER_GLYPH_TABLES})
+        scales["cmap"] = self.table_sizes.get("cmap", 0) / max(len(self.cmap), 1)
+        fixed = 12 + 16 * len(self.table_sizes)
+        fixed += sum(size for tag, size in self.table_sizes.items() if tag not in scales)
+        self._use(scales, fixed)
+
+        self.error_bound = None
+        if calibrate:
+            self.calibrate(ttFont)
+
+    def _use(self, scales, offset, factor=1):
+        """Combine per-table scales into a single cost per glyph, for fast estimates of
+        offset + factor * sum(scale * cost per table)"""
+        self.costs = dict.fromkeys(self.glyph_order, 0)
+        for tag, costs in self.table_costs.items():
+            scale = factor * scales.get(tag, 0)
+            for glyph_name, cost in costs.items():
+                self.costs[glyph_name] += scale * cost
+        self.cmap_cost = factor * scales.get("cmap", 0)
+        self.offset = offset
+
+    def glyphs(self, unicodes):
+        """Glyph names a subset for unicodes keeps, including .notdef and the closure"""
+        glyphs = set(self._closure(self.glyph_order[0], self.graph))
+        for codepoint in self._codepoints(unicodes):
+            glyph_name = self.cmap.get(codepoint)
+            if glyph_name is not None:
+                glyphs |= self._closure(glyph_name, self.graph)
+        # Ligatures of the glyphs, and ligatures of those, until nothing is added
+        added = True
+        while added:
+            added = set()
+            for first in glyphs & self.ligatures.keys():
+                for components, ligature in self.ligatures[first]:
+                    if ligature not in glyphs and glyphs.issuperset(components):
+                        added |= self._closure(ligature, self.graph)
+            glyphs |= added
+        components = set()
+        for glyph_name in glyphs & self.components.keys():
+            components |= self._closure(glyph_name, self.components)
+        return glyphs | components
+
+    def _closure(self, glyph_name, graph):
+        closures = self._closures.setdefault(id(graph), {})
+        if glyph_name not in closures:
+            closure = {glyph_name}
+            stack = [glyph_name]
+            while stack:
+                for target in graph.get(stack.pop(), ()):
+                    if target not in closure:
+                        closure.add(target)
+                        stack.append(target)
+            closures[glyph_name] = closure
+        return closures[glyph_name]
+
+    def _codepoints(self, unicodes):
+        if isinstance(unicodes, str):
+            from fontTools.subset import parse_unicodes
+
+            return parse_unicodes(unicodes)
+        return unicodes
+
+    def _raw(self, unicodes):
+        """Costs of a subset for unicodes per table, before scaling"""
+        codepoints = [codepoint for codepoint in set(self._codepoints(unicodes)) if codepoint in self.cmap]
+        glyphs = self.glyphs(codepoints)
+        raw = {tag: sum(costs[glyph_name] for glyph_name in glyphs) for tag, costs in self.table_costs.items()}
+        raw["cmap"] = len(codepoints)
+        return raw
+
+    def size(self, unicodes):
+        """Estimated size in bytes of a subset for unicodes"""
+        codepoints = [codepoint for codepoint in set(self._codepoints(unicodes)) if codepoint in self.cmap]
+        size = self.offset + len(codepoints) * self.cmap_cost + sum(self.costs[g] for g in self.glyphs(codepoints))
+        return max(0, round(size))
+
+    def estimate(self, unicodes):
+        """Estimate as a dict with the keys "size", "error_bound" (relative), "unicodes" and "glyphs"
+        (the number of them in the subset)"""
+        codepoints = [codepoint for codepoint in set(self._codepoints(unicodes)) if codepoint in self.cmap]
+        return {
+            "size": self.size(codepoints),
+            "error_bound": self.error_bound,
+            "unicodes": len(codepoints),
+            "glyphs": len(self.glyphs(codepoints)),
+        }
+
+    def measure(self, ttFont, unicodes):
+        """Actual size of a subset of ttFont (which is left untouched) for unicodes, in the estimated flavor"""
+        stream = io.BytesIO()
+        ttFont.save(stream)
+        size, compressed_size, _ = self._measure(stream.getvalue(), self._codepoints(unicodes))
+        return size if self.flavor is None else compressed_size
+
+    def _measure(self, data, codepoints):
+        """Subset font data for codepoints. Returns the size, the compressed size in the estimated flavor
+        (or None) and the size of every table."""
+        from fontTools.ttLib import TTFont
+
+        subset = font_subset(TTFont(io.BytesIO(data)), format_unicodes(sorted(codepoints)), inplace=True)
+        stream = io.BytesIO()
+        subset.save(stream)
+        subset.close()
+        data = stream.getvalue()
+        table_sizes = {tag: entry.length for tag, entry in TTFont(io.BytesIO(data)).reader.tables.items()}
+        compressed_size = None if self.flavor is None else len(compress_bytes(data, self.flavor, self.quality))
+        return len(data), compressed_size, table_sizes
+
+    def calibrate(self, ttFont):
+        """Fit the estimates to real subsets: the size of an empty subset is measured, and the
+        costs of every table are scaled to match the subsets of calibration_samples().
+        Compressed sizes are fitted to the estimated uncompressed sizes in the same way."""
+        start = time.perf_counter()
+        stream = io.BytesIO()
+        ttFont.save(stream)
+        data = stream.getvalue()
+        codepoints = sorted(self.cmap)
+
+        empty_raw = self._raw([])
+        empty_size, empty_compressed, empty_tables = self._measure(data, [])
+        samples = []
+        for sample in calibration_samples(codepoints):
+            raw = self._raw(sample)
+            size, compressed_size, table_sizes = self._measure(data, sample)
+            samples.append(
+                (
+                    {tag: cost - empty_raw[tag] for tag, cost in raw.items()},
+                    {tag: table_sizes.get(tag, 0) - empty_tables.get(tag, 0) for tag in raw},
+                    size - empty_size,
+                    compressed_size - empty_compressed if self.flavor else None,
+                )
+            )
+
+        def fit(samples):
+            scales = {tag: _scale([(raw[tag], tables[tag]) for raw, tables, _, _ in samples]) for tag in empty_raw}
+            factor = 1
+            if self.flavor:
+                factor = _scale([(predict(scales, raw), compressed) for raw, _, _, compressed in samples])
+            return scales, factor
+
+        def predict(scales, raw, factor=1):
+            return factor * sum(scales[tag] * cost for tag, cost in raw.items())
+
+        # Held-out error of every sample, with the scales fitted to the other samples
+        errors = []
+        for i, (raw, _, size, compressed_size) in enumerate(samples):
+            scales, factor = fit(samples[:i] + samples[i + 1 :])
+            difference = predict(scales, raw, factor) - (size if self.flavor is None else compressed_size)
+            actual = size + empty_size if self.flavor is None else compressed_size + empty_compressed
+            errors.append(abs(difference) / actual)
+        self.error_bound = max(errors)
+
+        scales, factor = fit(samples)
+        offset = (empty_size if self.flavor is None else empty_compressed) - predict(scales, empty_raw, factor)
+        self._use(scales, offset, factor)
+        logging.info(
+            f"Calibrated size estimates with {len(samples) + 1} subsets in {time.perf_counter() - start:.2f}s, "
+            f"error bound {self.error_bound:.1%}"
+        )
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        prog="upsetter estimate",
+        description="Estimate the size of subsets of fonts for sets of unicodes, without subsetting",
+        epilog="Example: upsetter estimate -u U+0000-00FF -u U+0100-024F --flavor woff2 font.ttf",
+    )
+    parser.add_argument("font_files", nargs="+", help="Font files")
+    parser.add_argument(
+        "-u",
+        "--unicodes",
+        action="append",
+        help="Set of unicodes in the same format as for upsetter -u (repeatable). Default is all unicodes.",
+    )
+    parser.add_argument("--flavor", choices=list(FLAVORS), help="Estimate the compressed size in this format")
+    parser.add_argument(
+        "--compress-quality",
+        type=int,
+        choices=range(MAX_QUALITY + 1),
+        default=MAX_QUALITY,
+        metavar=f"0-{MAX_QUALITY}",
+        help="Compression quality of the calibration samples. Default is 11.",
+    )
+    parser.add_argument("--no-calibrate", action="store_true", help="Don't calibrate against real subsets")
+    parser.add_argument("--verify", action="store_true", help="Also subset for real and report the actual size")
+    parser.add_argument("--json", action="store_true", help="Print the estimates as JSON")
+    parser.add_argument("-v", "--verbose", help="Be verbose. Set logging level to INFO.", action="store_true")
+    args = parser.parse_args(args)
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING)
+    from fontTools.ttLib import TTFont
+
+    results = []
+    for font_file in args.font_files:
+        ttFont = TTFont(font_file)
+        estimator = SizeEstimator(
+            ttFont, flavor=args.flavor, quality=args.compress_quality, calibrate=not args.no_calibrate
+        )
+        for unicodes in args.unicodes or [sorted(estimator.cmap)]:
+            start = time.perf_counter()
+            result = estimator.estimate(unicodes)
+            result.update(
+                font_file=font_file,
+                unicodes_given=unicodes if isinstance(unicodes, str) else None,
+                seconds=time.perf_counter() - start,
+            )
+            if args.verify:
+                result["actual_size"] = estimator.measure(ttFont, unicodes)
+                result["error"] = result["size"] / result["actual_size"] - 1
+            results.append(result)
+            if not args.json:
+                bound = f" ±{result['error_bound']:.1%}" if result["error_bound"] is not None else ""
+                line = (
+                    f"{font_file} [{result['unicodes_given'] or 'all'}]: ~{result['size']} bytes{bound}, "
+                    f"{result['glyphs']} glyphs for {result['unicodes']} unicodes, "
+                    f"estimated in {result['seconds'] * 1000:.2f} ms"
+                )
+                if args.verify:
+                    line += f", actual {result['actual_size']} bytes ({result['error']:+.1%})"
+                print(line)
+    if args.json:
+        print(json.dumps(results, indent=2))
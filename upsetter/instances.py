@@ -0,0 +1,222 @@
+"""
+Static instances of a variable font, e.g. as fallbacks for browsers without variable font support.
+
+The variable font is parsed and feature-frozen only once, and saved to a temporary file.
+Every instance is then instanced from this file, subset and optionally compressed,
+in a pool of worker processes. Instances are either the font's named instances or
+given locations, which may also leave axes variable.
+"""
+
+import contextlib
+import logging
+import os
+import re
+import tempfile
+import time
+
+from . import (
+    font_compact,
+    font_freeze_features,
+    font_prune_layout,
+    font_subset,
+    font_subspace,
+    run_batch,
+    validate_features,
+)
+from .compress import compress_file
+from .metrics import peak_rss, stage
+from .scheduler import estimate_memory
+
+
+def named_instances(ttFont):
+    """Named instances of a variable font as a dict of instance name => location, in fvar order"""
+    instances = {}
+    for instance in ttFont["fvar"].instances:
+        name = ttFont["name"].getDebugName(instance.subfamilyNameID) or "Instance"
+        # Some fonts list an instance twice, keep the first one
+        instances.setdefault(name, dict(instance.coordinates))
+    return instances
+
+
+def parse_instances(ttFont, instances):
+    """Turn a list of instance names and locations like 'wght=700,wdth=100' into a dict of
+    instance name => location. None selects all named instances."""
+    from fontTools.varLib.instancer import parseLimits
+
+    named = named_instances(ttFont)
+    if instances is None:
+        return named
+    parsed = {}
+    for instance in instances:
+        if "=" in instance:
+            location = parseLimits(instance.split(","))
+            parsed[re.sub(r"[=:,]", "", instance)] = location
+        else:
+            assert instance in named, f"No named instance {instance}, use one of: {', '.join(named)}"
+            parsed[instance] = named[instance]
+    return parsed
+
+
+def _stat_covers_location(ttFont, location):
+    """Whether STAT has axis values for the default location of an instance at location, on every axis
+    that has axis values at all. The instancer can only update the names of such instances."""
+    from fontTools.varLib.instancer import AxisLimits
+
+    if "STAT" not in ttFont or not ttFont["STAT"].table.AxisValueArray:
+        return False
+    stat = ttFont["STAT"].table
+    axes = [axis.AxisTag for axis in stat.DesignAxisRecord.Axis]
+    default = {axis.axisTag: axis.defaultValue for axis in ttFont["fvar"].axes}
+    default.update(AxisLimits(location).limitAxesAndPopulateDefaults(ttFont).defaultLocation())
+    with_values, found = set(), set()
+    for value in stat.AxisValueArray.AxisValue:
+        if value.Format in (1, 2, 3):
+            records = [(axes[value.AxisIndex], value.NominalValue if value.Format == 2 else value.Value)]
+        elif value.Format == 4:
+            records = [(axes[record.AxisIndex], record.Value) for record in value.AxisValueRecord]
+        else:
+            continue
+        with_values.update(tag for tag, _ in records)
+        # Like the instancer, values for several axes only count if they match on all of them
+        if all(tag not in default or coordinate == default[tag] for tag, coordinate in records):
+            found.update(tag for tag, _ in records)
+    return not (set(default) & with_values) - found
+
+
+def _instance_job(
+    output_file,
+    source_file,
+    locations,
+    update_names,
+    unicodes=None,
+    remove_features=None,
+    keep_glyph_names=False,
+    compress=False,
+    woff=False,
+    compress_quality=11,
+    compact=None,
+):
+    from fontTools.ttLib import TTFont
+
+    start = time.perf_counter()
+    ttFont = TTFont(source_file)
+    ttFont = font_subspace(ttFont, locations[output_file], inplace=True, update_names=update_names[output_file])
+    ttFont = font_subset(ttFont, unicodes, remove_features, keep_glyph_names, inplace=True)
+    if compact:
+        ttFont = font_compact(ttFont, compact, inplace=True)
+    with stage("save"):
+        ttFont.save(output_file)
+    ttFont.close()
+    outputs = [output_file]
+    if compress or woff:
+        reports = compress_file(output_file, woff2=compress, woff=woff, quality=compress_quality)
+        outputs.extend(report["output"] for report in reports)
+    return {"outputs": outputs, "seconds": time.perf_counter() - start, "peak_rss": peak_rss()}
+
+
+def instance_file(
+    font_file,
+    instances=None,
+    unicodes=None,
+    freeze_features=None,
+    remove_features=None,
+    name="",
+    keep_glyph_names=False,
+    compress=False,
+    woff=False,
+    compress_quality=11,
+    jobs=1,
+    metrics=None,
+    prune_layout=False,
+    compact=None,
+    max_memory=None,
+):
+    """Make static instances of a variable font file and save them next to it as <name>.upset.<instance>.<ext>.
+    instances is a list of named instance names and locations like 'wght=700', or None for all named instances.
+    With jobs > 1, instances are made in a pool of that many worker processes (jobs=None uses all CPUs),
+    within max_memory bytes if given, assuming every instance needs as much memory as the variable font.
+    Returns one summary dict per instance with the keys "instance", "location", "outputs", "seconds",
+    "peak_rss" (of the process that made it) and "error"."""
+    from fontTools.ttLib import TTFont
+
+    validate_features(freeze_features, remove_features)
+    start = time.perf_counter()
+
+    # Shared work: parsing, freezing (including the layout analysis) and saving, once for all instances
+    with metrics.activate(font_file) if metrics is not None else contextlib.nullcontext():
+        with stage("load"):
+            ttFont = TTFont(font_file)
+        assert "fvar" in ttFont, "Font is not a Variable Font"
+        locations = parse_instances(ttFont, instances)
+        if freeze_features is not None:
+            ttFont = font_freeze_features(ttFont, freeze_features, name, inplace=True)
+            if prune_layout:
+                ttFont = font_prune_layout(ttFont, inplace=True)
+        stem, extension = os.path.splitext(font_file)
+        outputs = {f"{stem}.upset.{instance.replace(' ', '')}{extension}": instance for instance in locations}
+        update_names = {
+            output: _stat_covers_location(ttFont, locations[instance]) for output, instance in outputs.items()
+        }
+        for output, update in update_names.items():
+            if not update:
+                logging.info(f"Not updating the names of {output}, STAT has no axis values for its location")
+        # Workers load the font from a file rather than getting it pickled with every job
+        source_file = font_file
+        if freeze_features is not None:
+            with stage("save"):
+                with tempfile.NamedTemporaryFile(
+                    suffix=extension, dir=os.path.dirname(font_file) or None, delete=False
+                ) as stream:
+                    ttFont.save(stream)
+            source_file = stream.name
+        ttFont.close()
+        del ttFont
+
+    try:
+        batch = run_batch(
+            _instance_job,
+            list(outputs),
+            jobs=jobs,
+            metrics=metrics,
+            max_memory=max_memory,
+            estimates=[estimate_memory(font_file)] * len(outputs) if max_memory else None,
+            source_file=source_file,
+            locations={output: locations[instance] for output, instance in outputs.items()},
+            update_names=update_names,
+            unicodes=unicodes,
+            remove_features=remove_features,
+            keep_glyph_names=keep_glyph_names,
+            compress=compress,
+            woff=woff,
+            compress_quality=compress_quality,
+            compact=compact,
+        )
+    finally:
+        if source_file != font_file:
+            os.remove(source_file)
+
+    results = []
+    for (output, instance), (result, error) in zip(outputs.items(), batch):
+        result = result or {"outputs": [], "seconds": None, "peak_rss": None}
+        results.append(dict(result, instance=instance, location=locations[instance], error=error))
+
+    worker_peaks = [result["peak_rss"] for result in results if result["peak_rss"]]
+    logging.info(
+        f"Processed {len(results)} instances of {font_file} in {time.perf_counter() - start:.2f}s, "
+        f"peak memory {max(worker_peaks + [peak_rss() or 0]) / 1024**2:.1f} MB per process"
+    )
+    return results
+
+
+def instance_fonts(font_files, **options):
+    """Run instance_file() with the same options on all font files, one after the other.
+    Returns one summary dict per instance, with the additional key "font_file"."""
+    results = []
+    for font_file in font_files:
+        try:
+            results.extend(dict(result, font_file=font_file) for result in instance_file(font_file, **options))
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            logging.error(f"Processing {font_file} failed: {error}")
+            results.append({"font_file": font_file, "instance": None, "outputs": [], "error": error})
+    return results
@@ -0,0 +1,180 @@
+"""
+Precomputed analysis of a font's cmap and layout tables.
+
+The index is built in a single pass over the cmap and the GSUB/GPOS feature and
+lookup lists, and answers the questions of the pipeline stages with lookups in
+sets and dicts: which lookups and lookup types make up a feature, which glyphs
+are encoded, which codepoints map to a glyph, and which glyphs a glyph can be
+substituted with.
+"""
+
+import functools
+
+LOOKUP_TYPES = {
+    "GSUB": {
+        1: "single",
+        2: "multiple",
+        3: "alternate",
+        4: "ligature",
+        5: "context",
+        6: "chaining context",
+        7: "extension",
+        8: "reverse chaining",
+    },
+    "GPOS": {
+        1: "single adjustment",
+        2: "pair adjustment",
+        3: "cursive",
+        4: "mark to base",
+        5: "mark to ligature",
+        6: "mark to mark",
+        7: "context",
+        8: "chaining context",
+        9: "extension",
+    },
+}
+
+
+def _subtables(lookup):
+    """Subtables of a lookup, with extension subtables unwrapped"""
+    for subtable in lookup.SubTable:
+        yield getattr(subtable, "ExtSubTable", subtable)
+
+
+class LayoutIndex:
+    def __init__(self, ttFont):
+        self.glyph_order = ttFont.getGlyphOrder()
+        self.cmap = ttFont.getBestCmap() or {}
+        self.encoded_glyphs = set(self.cmap.values())
+        self.reverse_cmap = {}
+        for codepoint, glyph_name in self.cmap.items():
+            self.reverse_cmap.setdefault(glyph_name, []).append(codepoint)
+
+        # Per table: feature records as (tag, lookup indices) in font order, lookups of every
+        # feature tag across all of its records, lookups and their types
+        self.feature_records = {}
+        self.features = {}
+        self.lookups = {}
+        self.lookup_types = {}
+        for table_tag in ("GSUB", "GPOS"):
+            if table_tag not in ttFont:
+                continue
+            table = ttFont[table_tag].table
+            records = table.FeatureList.FeatureRecord if table.FeatureList else []
+            self.feature_records[table_tag] = [
+                (record.FeatureTag, list(record.Feature.LookupListIndex)) for record in records
+            ]
+            self.features[table_tag] = {}
+            for tag, lookup_indices in self.feature_records[table_tag]:
+                self.features[table_tag].setdefault(tag, {}).update(dict.fromkeys(lookup_indices))
+            self.lookups[table_tag] = table.LookupList.Lookup if table.LookupList else []
+            self.lookup_types[table_tag] = [lookup.LookupType for lookup in self.lookups[table_tag]]
+        self._single_substitutions = {}
+
+    def feature_tags(self, table_tag="GSUB"):
+        """Tags of the features of a table, in font order without duplicates"""
+        return list(self.features.get(table_tag, {}))
+
+    def feature_lookups(self, tag, table_tag="GSUB"):
+        """Indices of all lookups of a feature, across all of its feature records"""
+        return list(self.features.get(table_tag, {}).get(tag, ()))
+
+    def feature_lookup_types(self, tag, table_tag="GSUB"):
+        types = self.lookup_types.get(table_tag, [])
+        return {types[index] for index in self.feature_lookups(tag, table_tag)}
+
+    def _single_substitution_of_encoded(self, lookup_index):
+        """Whether a GSUB lookup is a single substitution of encoded glyphs only, checked once per lookup"""
+        if lookup_index not in self._single_substitutions:
+            lookup = self.lookups["GSUB"][lookup_index]
+            self._single_substitutions[lookup_index] = lookup.LookupType == 1 and all(
+                glyph_name in self.encoded_glyphs for subtable in lookup.SubTable for glyph_name in subtable.mapping
+            )
+        return self._single_substitutions[lookup_index]
+
+    def cmap_freezable_features(self, tags):
+        """Features among tags that can be frozen by remapping the cmap: any of their feature records
+        consists of single substitution lookups only, and all their source glyphs are encoded"""
+        tags = set(tags)
+        freezable = []
+        for tag, lookup_indices in self.feature_records.get("GSUB", []):
+            if tag in tags and lookup_indices and tag not in freezable:
+                if all(self._single_substitution_of_encoded(index) for index in lookup_indices):
+                    freezable.append(tag)
+        return freezable
+
+    @functools.cached_property
+    def ligatures(self):
+        """Ligature substitutions of GSUB as a list of (component glyph names, ligature glyph name)"""
+        ligatures = []
+        for lookup in self.lookups.get("GSUB", []):
+            for subtable in _subtables(lookup):
+                for first, first_ligatures in getattr(subtable, "ligatures", {}).items():
+                    for ligature in first_ligatures:
+                        ligatures.append(((first, *ligature.Component), ligature.LigGlyph))
+        return ligatures
+
+    @functools.cached_property
+    def unconditional_substitutions(self):
+        """Substitution graph of GSUB without ligatures: glyph name => set of glyph names it can be
+        substituted with on its own. Contextual lookups add no edges of their own, their nested lookups
+        are part of the lookup list as well."""
+        graph = {}
+        for lookup in self.lookups.get("GSUB", []):
+            for subtable in _subtables(lookup):
+                if hasattr(subtable, "mapping"):  # Single and multiple substitutions
+                    for source, target in subtable.mapping.items():
+                        graph.setdefault(source, set()).update([target] if isinstance(target, str) else target)
+                elif hasattr(subtable, "alternates"):
+                    for source, targets in subtable.alternates.items():
+                        graph.setdefault(source, set()).update(targets)
+                elif hasattr(subtable, "Substitute"):  # Reverse chaining single substitution
+                    for source, target in zip(subtable.Coverage.glyphs, subtable.Substitute):
+                        graph.setdefault(source, set()).add(target)
+        return graph
+
+    @functools.cached_property
+    def substitutions(self):
+        """Substitution graph of GSUB: glyph name => set of glyph names it can be substituted with.
+        Ligatures are edges from each of their components."""
+        graph = {source: set(targets) for source, targets in self.unconditional_substitutions.items()}
+        for components, ligature in self.ligatures:
+            for component in components:
+                graph.setdefault(component, set()).add(ligature)
+        return graph
+
+    def reachable_glyphs(self, glyph_names):
+        """Glyphs reachable from glyph_names through any number of substitutions, including glyph_names"""
+        reachable = set(glyph_names)
+        stack = list(reachable)
+        while stack:
+            for target in self.substitutions.get(stack.pop(), ()):
+                if target not in reachable:
+                    reachable.add(target)
+                    stack.append(target)
+        return reachable
+
+    def report(self):
+        """Human readable summary of the cmap, the layout features and the substitution graph"""
+        unencoded = set(self.glyph_order) - self.encoded_glyphs
+        reachable = self.reachable_glyphs(self.encoded_glyphs) & unencoded
+        lines = [
+            f"Glyphs: {len(self.glyph_order)}, encoded: {len(self.encoded_glyphs)}, "
+            f"unencoded: {len(unencoded)} ({len(reachable)} of them reachable through GSUB)"
+        ]
+        for table_tag in ("GSUB", "GPOS"):
+            if table_tag not in self.feature_records:
+                continue
+            lines.append(
+                f"{table_tag}: {len(self.feature_tags(table_tag))} features, {len(self.lookups[table_tag])} lookups"
+            )
+            freezable = self.cmap_freezable_features(self.feature_tags(table_tag)) if table_tag == "GSUB" else []
+            for tag in self.feature_tags(table_tag):
+                lookups = self.feature_lookups(tag, table_tag)
+                types = sorted(self.feature_lookup_types(tag, table_tag))
+                names = ", ".join(LOOKUP_TYPES[table_tag].get(lookup_type, str(lookup_type)) for lookup_type in types)
+                line = f"  {tag}: {len(lookups)} lookups ({names})"
+                if tag in freezable:
+                    line += ", freezable by cmap remapping"
+                lines.append(line)
+        return "\n".join(lines)
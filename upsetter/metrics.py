@@ -0,0 +1,249 @@
+"""
+Instrumentation of the pipeline stages.
+
+While a Metrics collector is active, every stage (loading, sub-spacing, feature-freezing,
+subsetting, saving and compression) records its wall time, CPU time and peak resident memory
+for the font being processed. The peak of a stage is measured by resetting the high-water mark
+of the process's resident memory when it starts, which only Linux supports; elsewhere it is None.
+Optionally, tracemalloc measures the peak of Python allocations within each stage, and cProfile
+profiles selected stages into .prof files.
+With table_sizes, the size of every table is recorded after each stage, see upsetter.sizes.
+
+Library callers can pass callbacks that receive every record as it comes in:
+
+    metrics = Metrics(callbacks=[lambda record: print(record["stage"], record["wall"])])
+    upset(font_files, metrics=metrics)
+
+or activate a collector around their own calls of the stage functions:
+
+    with metrics.activate("font.ttf"):
+        upset_font(ttFont, unicodes="U+0020-007E")
+"""
+
+import contextlib
+import contextvars
+import logging
+import os
+import sys
+import time
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+STAGES = ["load", "subspace", "freeze", "prune", "subset", "compact", "save", "compress"]
+
+_collector = contextvars.ContextVar("collector", default=None)
+_font_file = contextvars.ContextVar("font_file", default=None)
+# Peak of the innermost running stage, see _StagePeak
+_stage_peak = contextvars.ContextVar("stage_peak", default=None)
+# The high-water mark is a property of the process, so is the peak it had before it was reset
+_peak_before_reset = [0]
+
+
+class _StagePeak:
+    """Peak resident memory of a running stage, in bytes, and of the stages it runs in. When a nested stage
+    resets the high-water mark, the enclosing stages get the peak up to then."""
+
+    def __init__(self, parent):
+        self.parent = parent
+        self.peak = 0
+
+    def update(self, peak):
+        stage_peak = self
+        while stage_peak is not None:
+            stage_peak.peak = max(stage_peak.peak, peak)
+            stage_peak = stage_peak.parent
+
+
+def _high_water_mark():
+    """High-water mark of the resident memory of this process in bytes, or None if unknown"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _reset_high_water_mark():
+    """Reset the high-water mark to the current resident memory. Returns False where that's not supported."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        return False
+    return True
+
+
+def peak_rss():
+    """Peak resident memory of this process in bytes, or None if unknown"""
+    peak = _high_water_mark()
+    return None if peak is None else max(peak, _peak_before_reset[0])
+
+
+class Metrics:
+    def __init__(self, profile=(), trace_memory=False, profile_dir=None, callbacks=(), table_sizes=False):
+        """profile lists the stages to run under cProfile (or contains "all"). Their statistics are saved
+        as <font>.<stage>.prof in profile_dir, or next to the font file if it's None.
+        trace_memory enables tracemalloc. callbacks are called with every record.
+        table_sizes additionally records the size of every table after each stage, in records with a "tables" key."""
+        self.profile = set(STAGES if "all" in profile else profile)
+        unknown = self.profile - set(STAGES)
+        assert not unknown, f"Unknown stages to profile: {', '.join(sorted(unknown))}, use: {', '.join(STAGES)}"
+        self.trace_memory = trace_memory
+        self.profile_dir = profile_dir
+        self.callbacks = list(callbacks)
+        self.table_sizes = table_sizes
+        self.records = []
+        self._profiles = {}
+
+    def settings(self):
+        """Settings for a collector of the same kind in a worker process"""
+        return dict(
+            profile=sorted(self.profile),
+            trace_memory=self.trace_memory,
+            profile_dir=self.profile_dir,
+            table_sizes=self.table_sizes,
+        )
+
+    @contextlib.contextmanager
+    def activate(self, font_file=None):
+        """Collect the stages run within this context, attributed to font_file"""
+        started_tracing = False
+        if self.trace_memory:
+            import tracemalloc
+
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                started_tracing = True
+        collector_token = _collector.set(self)
+        font_file_token = _font_file.set(font_file)
+        try:
+            yield self
+        finally:
+            _font_file.reset(font_file_token)
+            _collector.reset(collector_token)
+            if started_tracing:
+                tracemalloc.stop()
+
+    def record(self, record):
+        self.records.append(record)
+        for callback in self.callbacks:
+            callback(record)
+
+    def merge(self, records):
+        """Add the records of a collector in a worker process"""
+        for record in records:
+            self.record(record)
+
+    def _profile_path(self, font_file, stage):
+        directory = self.profile_dir or os.path.dirname(font_file or "") or "."
+        name = os.path.basename(font_file) if font_file else "upsetter"
+        count = self._profiles[name, stage] = self._profiles.get((name, stage), 0) + 1
+        suffix = f".{count}" if count > 1 else ""
+        return os.path.join(directory, f"{name}.{stage}{suffix}.prof")
+
+    def summary(self):
+        """Totals per stage, in pipeline order"""
+        summary = {}
+        timings = [record for record in self.records if "wall" in record]
+        for record in sorted(timings, key=lambda record: STAGES.index(record["stage"])):
+            stage = summary.setdefault(record["stage"], {"count": 0, "wall": 0.0, "cpu": 0.0, "peak_rss": None})
+            stage["count"] += 1
+            stage["wall"] += record["wall"]
+            stage["cpu"] += record["cpu"]
+            if record["peak_rss"] is not None:
+                stage["peak_rss"] = max(stage["peak_rss"] or 0, record["peak_rss"])
+        return summary
+
+    def report(self):
+        """Summary as a text table"""
+        lines = [f"{'stage':<10} {'count':>6} {'wall (s)':>10} {'cpu (s)':>10} {'peak RSS (MB)':>14}"]
+        for stage, totals in self.summary().items():
+            rss = f"{totals['peak_rss'] / 1024**2:.1f}" if totals["peak_rss"] is not None else "-"
+            lines.append(f"{stage:<10} {totals['count']:>6} {totals['wall']:>10.3f} {totals['cpu']:>10.3f} {rss:>14}")
+        return "\n".join(lines)
+
+    def to_json(self):
+        data = {"stages": self.summary(), "records": self.records}
+        if self.table_sizes:
+            from .sizes import size_summary
+
+            data["table_sizes"] = size_summary(self.records)
+        return data
+
+
+@contextlib.contextmanager
+def stage(name, **fields):
+    """Measure a pipeline stage for the active collector, if any.
+    Yields the fields of the record, which the stage can add results to."""
+    metrics = _collector.get()
+    if metrics is None:
+        yield fields
+        return
+
+    font_file = _font_file.get()
+    profiler = None
+    if name in metrics.profile:
+        import cProfile
+
+        profiler = cProfile.Profile()
+    if metrics.trace_memory:
+        import tracemalloc
+
+        tracemalloc.reset_peak()
+    enclosing = _stage_peak.get()
+    high_water_mark = _high_water_mark() or 0
+    _peak_before_reset[0] = max(_peak_before_reset[0], high_water_mark)
+    if enclosing is not None:
+        enclosing.update(high_water_mark)
+    stage_peak = _StagePeak(enclosing) if _reset_high_water_mark() else None
+    stage_peak_token = _stage_peak.set(stage_peak)
+    wall, cpu = time.perf_counter(), time.process_time()
+    if profiler is not None:
+        profiler.enable()
+    try:
+        yield fields
+    finally:
+        if profiler is not None:
+            profiler.disable()
+        _stage_peak.reset(stage_peak_token)
+        if stage_peak is not None:
+            stage_peak.update(_high_water_mark())
+        record = dict(
+            font_file=font_file,
+            stage=name,
+            wall=time.perf_counter() - wall,
+            cpu=time.process_time() - cpu,
+            peak_rss=stage_peak.peak if stage_peak is not None else None,
+            **fields,
+        )
+        if metrics.trace_memory:
+            record["peak_traced"] = tracemalloc.get_traced_memory()[1]
+        if profiler is not None:
+            record["profile"] = metrics._profile_path(font_file, name)
+            profiler.dump_stats(record["profile"])
+        logging.debug(f"{name} of {font_file}: {record['wall']:.3f}s wall, {record['cpu']:.3f}s CPU")
+        metrics.record(record)
+
+
+def record_sizes(name, ttFont=None, data=None, tables=True):
+    """Record the size of every table of a TTFont or compiled font data after a stage, if the active
+    collector accounts table sizes. With tables=False, only the total size of the data is recorded."""
+    metrics = _collector.get()
+    if metrics is None or not metrics.table_sizes:
+        return
+    from .sizes import table_sizes
+
+    sizes, total = table_sizes(ttFont, data) if tables else (None, len(data))
+    metrics.record(dict(font_file=_font_file.get(), stage=name, tables=sizes, total=total))
+
+
+def measured_call(font_file, function, settings, **options):
+    """Call function(font_file, **options) with a fresh collector, for use in worker processes.
+    Returns the function's return value and the collected records."""
+    metrics = Metrics(**settings)
+    with metrics.activate(font_file):
+        result = function(font_file, **options)
+    return result, metrics.records
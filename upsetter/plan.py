@@ -0,0 +1,115 @@
+"""
+Lazy loading of fonts, and raw pass-through of the tables that no stage changes.
+
+Fonts are opened lazily: a table is only decompiled when a stage accesses it, and the
+lookups of the layout tables and the glyphs of glyf and gvar only when they are used.
+Before the pipeline runs, table_plan() works out which tables each configured stage may
+change. Stages also decompile tables they only read, e.g. subsetting looks for name IDs in
+every table to prune the name table. After the stages, tables outside the plan are reset to
+the raw bytes of the input, so that saving copies them instead of compiling them again.
+Only tables that don't refer to glyph IDs are passed through, as subsetting renumbers glyphs.
+"""
+
+import io
+import logging
+
+# Tables that are recalculated when they are compiled, from the tables they are derived from
+DERIVED_TABLES = {
+    "glyf": ["loca", "hhea", "vhea", "maxp"],
+    "CFF ": ["hhea", "vhea", "maxp"],
+    "CFF2": ["hhea", "vhea", "maxp"],
+    "hmtx": ["hhea"],
+    "vmtx": ["vhea"],
+}
+# Tables that are compiled in any case, as saving updates them
+COMPILED_TABLES = ["head"]
+# Tables that don't refer to glyphs, so that their raw bytes stay valid when subsetting changes the glyph order
+GLYPH_INDEPENDENT_TABLES = [
+    "fpgm",
+    "prep",
+    "cvt ",
+    "cvar",
+    "gasp",
+    "VDMX",
+    "fvar",
+    "avar",
+    "STAT",
+    "MVAR",
+    "name",
+    "OS/2",
+    "CPAL",
+    "meta",
+]
+# Tables changed by feature-freezing and pruning, see upsetter.remap_layout and upsetter.prune
+FREEZE_TABLES = ["GSUB", "GPOS", "GDEF", "cmap", "post"]
+RENAME_TABLES = ["name", "CFF "]
+PRUNE_TABLES = ["GSUB", "GPOS", "GDEF"]
+# Tables that subsetting recalculates, besides the ones with subsetting methods
+SUBSET_TABLES = ["OS/2", "name"]
+
+
+def open_font(font_data):
+    """Lazily loaded TTFont of font data as bytes or a binary file object"""
+    from fontTools.ttLib import TTFont
+
+    if isinstance(font_data, (bytes, bytearray, memoryview)):
+        font_data = io.BytesIO(font_data)
+    return TTFont(font_data, lazy=True)
+
+
+def close_font(ttFont):
+    """Close a font that was processed and saved. Its tables are dropped, as lazily loaded tables refer to
+    the font, and the reference cycles would otherwise keep them in memory until garbage collection."""
+    ttFont.close()
+    ttFont.tables.clear()
+
+
+def _subset_tables(tags):
+    import fontTools.subset  # noqa: F401 (adds the subsetting methods to the table classes)
+    from fontTools.ttLib import getTableClass
+
+    methods = ("subset_glyphs", "prune_pre_subset", "prune_post_subset")
+    return {tag for tag in tags if any(hasattr(getTableClass(tag), method) for method in methods)} | set(SUBSET_TABLES)
+
+
+def table_plan(tags, subspace=None, freeze_features=None, name="", prune_layout=False, compact=None):
+    """Tables of a font with these table tags that each configured stage may change, with the options
+    of upset_font(). Returns a dict of stage => set of tags, in pipeline order."""
+    plan = {}
+    if subspace:
+        # Instancing may change any table
+        plan["subspace"] = set(tags)
+    if freeze_features is not None:
+        plan["freeze"] = set(FREEZE_TABLES + (RENAME_TABLES if name else []))
+        if prune_layout:
+            plan["prune"] = set(PRUNE_TABLES)
+    plan["subset"] = _subset_tables(tags)
+    if compact:
+        from .compact import _TECHNIQUES, parse_techniques
+
+        plan["compact"] = {tag for technique in parse_techniques(compact) for tag in _TECHNIQUES[technique][1]}
+
+    for stage, changed in plan.items():
+        for tag in list(changed):
+            changed.update(DERIVED_TABLES.get(tag, []))
+        plan[stage] = changed & set(tags)
+    return plan
+
+
+def passthrough_tables(tags, plan):
+    """Tags of the tables that no stage of a table_plan() changes, and that can be copied as they are"""
+    changed = set(COMPILED_TABLES).union(*plan.values())
+    return sorted(set(tags) & set(GLYPH_INDEPENDENT_TABLES) - changed)
+
+
+def restore_raw(ttFont, tags):
+    """Reset decompiled tables among tags to the raw bytes they were loaded from, so that saving copies them.
+    Returns the tags of the reset tables."""
+    restored = []
+    for tag in tags:
+        if ttFont.isLoaded(tag) and ttFont.reader is not None and tag in ttFont.reader:
+            del ttFont.tables[tag]
+            restored.append(tag)
+    if restored:
+        logging.info(f"Passing through unchanged tables: {', '.join(restored)}")
+    return restored
@@ -0,0 +1,233 @@
+"""
+Removal of layout rules that can never fire after feature-freezing.
+
+Freezing a feature with remap-layout moves its lookups into ccmp, which shapers always apply.
+A single substitution in ccmp that applies in every language system, without lookup flags,
+replaces every occurrence of its source glyphs. If no lookup can produce such a glyph again,
+the glyph is gone from the glyph run after that lookup, and all rules of later GSUB lookups
+and of GPOS that need the glyph are dead: alternates and ligatures of it, kerning pairs and
+mark attachments of it. Those rules are removed, as are lookups that end up empty. Glyphs
+that only these rules produced become unreachable, and font_subset() removes them.
+Nested lookups count as running as early as the earliest contextual lookup that calls them,
+wherever they are in the lookup list. Shapers apply some features in stages of their own before
+ccmp, like rvrn, so their lookups (also those FeatureVariations swap in) are never pruned.
+
+The pass is conservative: it does nothing for fonts whose FeatureVariations swap the lookups
+of ccmp with the location in the design space, and keeps a table as it was if the pruned table
+doesn't get smaller.
+"""
+
+import copy
+import logging
+from types import SimpleNamespace
+
+from .layout_index import LayoutIndex, _subtables
+
+# Features that shapers apply to all glyphs and that can't be turned off, the target of remap-layout freezing
+ALWAYS_ON_FEATURES = ["ccmp"]
+# Features that HarfBuzz applies in stages before the always-on features, regardless of the lookup order
+EARLY_FEATURES = ["rvrn", "stch"]
+# Rule sets and rules of contextual lookups, whose rules call nested lookups
+CONTEXT_RULES = [
+    ("SubRuleSet", "SubRule"),
+    ("SubClassSet", "SubClassRule"),
+    ("ChainSubRuleSet", "ChainSubRule"),
+    ("ChainSubClassSet", "ChainSubClassRule"),
+    ("PosRuleSet", "PosRule"),
+    ("PosClassSet", "PosClassRule"),
+    ("ChainPosRuleSet", "ChainPosRule"),
+    ("ChainPosClassSet", "ChainPosClassRule"),
+]
+
+
+def _outputs(lookup):
+    """Glyphs a GSUB lookup can put into the glyph run. Contextual lookups produce nothing
+    of their own, their nested lookups are part of the lookup list."""
+    outputs = set()
+    for subtable in _subtables(lookup):
+        if hasattr(subtable, "mapping"):  # Single and multiple substitutions
+            for target in subtable.mapping.values():
+                outputs.update([target] if isinstance(target, str) else target)
+        elif hasattr(subtable, "alternates"):
+            for targets in subtable.alternates.values():
+                outputs.update(targets)
+        elif hasattr(subtable, "ligatures"):
+            outputs.update(ligature.LigGlyph for ligatures in subtable.ligatures.values() for ligature in ligatures)
+        elif hasattr(subtable, "Substitute"):  # Reverse chaining single substitution
+            outputs.update(subtable.Substitute)
+    return outputs
+
+
+def _nested_lookups(lookup):
+    """Indices of the lookups that the rules of a contextual lookup call"""
+
+    def records(rule):
+        return (
+            (getattr(rule, "SubstLookupRecord", None) or getattr(rule, "PosLookupRecord", None) or []) if rule else []
+        )
+
+    nested = set()
+    for subtable in _subtables(lookup):
+        found = list(records(subtable))  # Format 3
+        for set_name, rule_name in CONTEXT_RULES:
+            for rule_set in getattr(subtable, set_name, None) or []:
+                for rule in (getattr(rule_set, rule_name, None) or []) if rule_set else []:
+                    found.extend(records(rule))
+        nested.update(record.LookupListIndex for record in found)
+    return nested
+
+
+def _early_lookups(table):
+    """Indices of the lookups of EARLY_FEATURES, in the FeatureList and in FeatureVariations"""
+    feature_records = table.FeatureList.FeatureRecord if table.FeatureList else []
+    features = [record.Feature for record in feature_records if record.FeatureTag in EARLY_FEATURES]
+    variations = getattr(table, "FeatureVariations", None)
+    for record in variations.FeatureVariationRecord if variations else []:
+        for substitution in record.FeatureTableSubstitution.SubstitutionRecord:
+            if feature_records[substitution.FeatureIndex].FeatureTag in EARLY_FEATURES:
+                features.append(substitution.Feature)
+    return {index for feature in features for index in feature.LookupListIndex}
+
+
+def _earliest_runs(lookups, early=()):
+    """Index of the earliest lookup during which each lookup can run: a nested lookup runs when
+    a contextual lookup that calls it (directly or through other nested lookups) runs.
+    The lookups in early run before all others, which is -1."""
+    earliest = [-1 if index in early else index for index in range(len(lookups))]
+    calls = {index: _nested_lookups(lookup) for index, lookup in enumerate(lookups)}
+    changed = True
+    while changed:
+        changed = False
+        for caller, nested in calls.items():
+            for index in nested:
+                if index < len(earliest) and earliest[caller] < earliest[index]:
+                    earliest[index] = earliest[caller]
+                    changed = True
+    return earliest
+
+
+def _always_on_lookups(table):
+    """Indices of the lookups of always-on features in every language system of a GSUB table"""
+    feature_records = table.FeatureList.FeatureRecord if table.FeatureList else []
+    langsyses = []
+    for script_record in table.ScriptList.ScriptRecord if table.ScriptList else []:
+        if script_record.Script.DefaultLangSys:
+            langsyses.append(script_record.Script.DefaultLangSys)
+        langsyses.extend(record.LangSys for record in script_record.Script.LangSysRecord)
+    if not langsyses:
+        return set()
+
+    common = None
+    for langsys in langsyses:
+        indices = list(langsys.FeatureIndex)
+        if langsys.ReqFeatureIndex != 0xFFFF:
+            indices.append(langsys.ReqFeatureIndex)
+        lookups = {
+            lookup_index
+            for feature_index in indices
+            if feature_records[feature_index].FeatureTag in ALWAYS_ON_FEATURES
+            for lookup_index in feature_records[feature_index].Feature.LookupListIndex
+        }
+        common = lookups if common is None else common & lookups
+    return common
+
+
+def _varied_features(table):
+    """Tags of the features that FeatureVariations substitute somewhere in the design space"""
+    variations = getattr(table, "FeatureVariations", None)
+    feature_records = table.FeatureList.FeatureRecord if table.FeatureList else []
+    return {
+        feature_records[substitution.FeatureIndex].FeatureTag
+        for record in (variations.FeatureVariationRecord if variations else [])
+        for substitution in record.FeatureTableSubstitution.SubstitutionRecord
+    }
+
+
+def dead_glyphs(ttFont):
+    """Glyphs that every glyph run loses for good to an always-on single substitution.
+    Returns a dict of glyph name => index of the first GSUB lookup after which the glyph is gone."""
+    if "GSUB" not in ttFont:
+        return {}
+    table = ttFont["GSUB"].table
+    if not table.LookupList or _varied_features(table) & set(ALWAYS_ON_FEATURES):
+        return {}
+    lookups = table.LookupList.Lookup
+
+    produced = set()
+    for lookup in lookups:
+        produced |= _outputs(lookup)
+
+    dead = {}
+    for index in sorted(_always_on_lookups(table)):
+        lookup = lookups[index]
+        if lookup.LookupType not in (1, 7) or lookup.LookupFlag != 0:
+            continue
+        subtables = list(_subtables(lookup))
+        if not all(type(subtable).__name__ == "SingleSubst" for subtable in subtables):
+            continue
+        # Within a lookup, the first subtable that covers a glyph applies
+        consumed = {}
+        for subtable in subtables:
+            for source, target in subtable.mapping.items():
+                consumed.setdefault(source, target)
+        for source, target in consumed.items():
+            if source != target and source not in produced:
+                dead.setdefault(source, index)
+    return dead
+
+
+def _table_size(ttFont, tag):
+    return len(ttFont[tag].compile(ttFont)) if tag in ttFont else 0
+
+
+def prune_layout(ttFont):
+    """Remove the layout rules and lookups that can never fire because their glyphs are always
+    substituted before (see the module documentation). Mutates ttFont and returns a report dict
+    with the keys "dead_glyphs", "unreachable_glyphs" (glyphs only the removed rules produced),
+    "removed_lookups" ({"GSUB": n, "GPOS": n}) and "sizes" ({table: (size before, size after)})."""
+    import fontTools.subset  # noqa: F401 (adds subset_glyphs() and subset_lookups() to the layout tables)
+
+    dead = dead_glyphs(ttFont)
+    report = {"dead_glyphs": sorted(dead), "unreachable_glyphs": [], "removed_lookups": {}, "sizes": {}}
+    if not dead:
+        return report
+
+    glyph_order = ttFont.getGlyphOrder()
+    index = LayoutIndex(ttFont)
+    reachable_before = index.reachable_glyphs(index.encoded_glyphs)
+    for tag in ("GSUB", "GPOS"):
+        if tag not in ttFont or not ttFont[tag].table.LookupList:
+            continue
+        size_before = _table_size(ttFont, tag)
+        original = copy.deepcopy(ttFont[tag].table)
+        lookups = ttFont[tag].table.LookupList.Lookup
+        earliest = _earliest_runs(lookups, _early_lookups(ttFont[tag].table) if tag == "GSUB" else ())
+        keep = []
+        for lookup_index, lookup in enumerate(lookups):
+            # GPOS runs after all of GSUB. Nested lookups run as early as the contextual lookups calling them.
+            gone = {glyph for glyph, after in dead.items() if tag == "GPOS" or after < earliest[lookup_index]}
+            if gone:
+                live = SimpleNamespace(glyphs=set(glyph_order) - gone)
+                lookup.SubTable = [subtable for subtable in lookup.SubTable if subtable.subset_glyphs(live)]
+                lookup.SubTableCount = len(lookup.SubTable)
+            if lookup.SubTable:
+                keep.append(lookup_index)
+        if len(keep) < len(lookups):
+            ttFont[tag].subset_lookups(keep)
+        size_after = _table_size(ttFont, tag)
+        if size_after >= size_before and len(keep) == len(lookups):
+            # Rebuilt subtables can come out bigger when nothing was removed from them
+            ttFont[tag].table = original
+            keep, size_after = lookups, size_before
+        report["removed_lookups"][tag] = len(lookups) - len(keep)
+        report["sizes"][tag] = (size_before, size_after)
+
+    index = LayoutIndex(ttFont)
+    report["unreachable_glyphs"] = sorted(reachable_before - index.reachable_glyphs(index.encoded_glyphs))
+    logging.info(
+        f"Pruned layout: {len(dead)} glyphs are always substituted, "
+        f"{sum(report['removed_lookups'].values())} lookups removed, "
+        f"{len(report['unreachable_glyphs'])} glyphs unreachable; "
+        + ", ".join(f"{tag} {before} => {after} bytes" for tag, (before, after) in report["sizes"].items())
+    )
+    return report
@@ -3,6 +3,7 @@
 Rearrange the features in a font file: drop features
 or move lookups into another feature or language system.
 """
+
 from collections import defaultdict
 import logging
 import re
@@ -12,15 +13,19 @@ from typing import List, Tuple
 # from fontTools.ttLib import TTFont
 from fontTools.ttLib.tables import otTables
 
-logging.basicConfig(level=logging.INFO)
+LAYOUT_TABLES = ["GSUB", "GPOS"]
+KEY_RE = r"(?:(\w+|\*)/)?(?:(\w+|\*)/)?(\w+|\*)"
 
-parser = ArgumentParser(description=__doc__, formatter_class=RawTextHelpFormatter)
-parser.add_argument("font", help="Font file")
-parser.add_argument("-o", help="Output font file")
-parser.add_argument(
-    "commands",
-    nargs="+",
-    help="""\
+
+def build_parser():
+    """Command line interface of the original gftools-remap-layout script"""
+    parser = ArgumentParser(description=__doc__, formatter_class=RawTextHelpFormatter)
+    parser.add_argument("font", help="Font file")
+    parser.add_argument("-o", help="Output font file")
+    parser.add_argument(
+        "commands",
+        nargs="+",
+        help="""\
 Commands to rearrange the features in the font file.
 
 Features and lookups are specified like so:
@@ -38,9 +43,8 @@ Commands may be:
 * `<feature> -> <feature2>` to add the lookups to the end of feature2.
 * `<feature> => |<feature2>` to move the lookups to the start of feature2.
 """,
-)
-LAYOUT_TABLES = ["GSUB", "GPOS"]
-KEY_RE = r"(?:(\w+|\*)/)?(?:(\w+|\*)/)?(\w+|\*)"
+    )
+    return parser
 
 
 def parse_key(key):
@@ -88,20 +92,24 @@ def freeze_lookuplist(table):
     to a list of lookup indices."""
     params = {}
     lookuplist = defaultdict(lambda: defaultdict(list))
-    featurelist = table.FeatureList.FeatureRecord
+    # Plain strings instead of fontTools' Tag objects, which are slow to hash
+    featurelist = [
+        (str(record.FeatureTag), record.Feature.FeatureParams, record.Feature.LookupListIndex)
+        for record in table.FeatureList.FeatureRecord
+    ]
 
     def freeze_langsys(script_tag, lang_tag, langsys):
+        features = lookuplist[(script_tag, lang_tag)]
         for index in langsys.FeatureIndex:
-            feature_tag = featurelist[index].FeatureTag
-            params[feature_tag] = featurelist[index].Feature.FeatureParams
-            lookups = featurelist[index].Feature.LookupListIndex
-            lookuplist[(script_tag, lang_tag)][feature_tag].extend(lookups)
+            feature_tag, feature_params, lookups = featurelist[index]
+            params[feature_tag] = feature_params
+            features[feature_tag].extend(lookups)
 
     for scriptrecord in table.ScriptList.ScriptRecord:
-        script_tag = scriptrecord.ScriptTag
+        script_tag = str(scriptrecord.ScriptTag)
         freeze_langsys(script_tag, "dflt", scriptrecord.Script.DefaultLangSys)
         for langsys in scriptrecord.Script.LangSysRecord:
-            freeze_langsys(script_tag, langsys.LangSysTag, langsys.LangSys)
+            freeze_langsys(script_tag, str(langsys.LangSysTag), langsys.LangSys)
     return lookuplist, params
 
 
@@ -120,9 +128,9 @@ def thaw_lookuplist(table, lookuplist, params):
     feature_indices = {}
     new_langsys_feature_indices = defaultdict(list)
     for script, lang, feature_tag, lookup_indices in combinations:
+        # Language systems with identical lookups for a feature share one feature record
         feature_key = (feature_tag, lookup_indices)
         feature_index = feature_indices.get(feature_key)
-        feature_index = feature_indices.get(feature_key)
         if feature_index is None:
             feature_index = len(table.FeatureList.FeatureRecord)
             frec = otTables.FeatureRecord()
@@ -144,7 +152,7 @@ def thaw_lookuplist(table, lookuplist, params):
         langsys.FeatureCount = len(langsys.FeatureIndex)
 
     for scriptrecord in table.ScriptList.ScriptRecord:
-        script_tag = scriptrecord.ScriptTag
+        script_tag = str(scriptrecord.ScriptTag)
         fixup_feature_indices(
             scriptrecord.Script.DefaultLangSys,
             new_langsys_feature_indices.get((script_tag, "dflt")),
@@ -152,12 +160,15 @@ def thaw_lookuplist(table, lookuplist, params):
         for langsys in scriptrecord.Script.LangSysRecord:
             fixup_feature_indices(
                 langsys.LangSys,
-                new_langsys_feature_indices.get((script_tag, langsys.LangSysTag)),
+                new_langsys_feature_indices.get((script_tag, str(langsys.LangSysTag))),
             )
 
 
-def find_langsyses(lookuplist, wanted_script, wanted_lang):
-    """Find the language systems in a lookup list"""
+def find_langsyses(lookuplist, wanted_script, wanted_lang, index=None):
+    """Find the language systems in a lookup list. Pass an index built with
+    index_langsyses() to avoid scanning all language systems."""
+    if index is not None:
+        return list(index.get((wanted_script, wanted_lang), ()))
     matching = []
     for script, lang in lookuplist.keys():
         if (script == wanted_script or wanted_script == "*   ") and (lang == wanted_lang or wanted_lang == "*   "):
@@ -165,115 +176,150 @@ def find_langsyses(lookuplist, wanted_script, wanted_lang):
     return matching
 
 
+def index_langsyses(lookuplist):
+    """Index the language systems of a lookup list by every (script, lang) query
+    that find_langsyses() can answer, including the "*" wildcards."""
+    index = defaultdict(list)
+    for script, lang in lookuplist.keys():
+        for query in ((script, lang), (script, "*   "), ("*   ", lang), ("*   ", "*   ")):
+            index[query].append((script, lang))
+    return index
+
+
 def de_default(d):
     """Turn a defaultdict into an ordinary dictionary"""
     return {k: dict(v) for k, v in d.items()}
 
 
-def remap_lookups(table, src, dst, operation="copy", start=False):
-    tag = type(table).__name__
+def _remap_lookups(tag, lookuplists, src, dst, operation="copy", start=False, index=None):
+    """Apply a copy or move command to a frozen lookup list"""
+    # Logging calls add up with thousands of language systems, so skip them early
+    verbose = logging.getLogger().isEnabledFor(logging.INFO)
     src_script, src_lang, src_feature_name = src
     dst_script, dst_lang, dst_feature_name = dst
-    lookuplists, params = freeze_lookuplist(table)
-    src_langsyses = find_langsyses(lookuplists, src_script, src_lang)
-    dst_langsyses = find_langsyses(lookuplists, dst_script, dst_lang)
-    logging.debug("[%s] Before: %s", tag, de_default(lookuplists))
+    src_langsyses = find_langsyses(lookuplists, src_script, src_lang, index)
+    dst_langsyses = find_langsyses(lookuplists, dst_script, dst_lang, index)
     to_remove = set()
     if not src_langsyses:
         logging.error(f"[%s] Languagesystem {src_script}/{src_lang} not found", tag)
         return
     for (src_script, src_lang), (dst_script, dst_lang) in build_targets(src_langsyses, dst_langsyses):
-        key = src_script + "/" + src_lang
-        if src_feature_name not in lookuplists[(src_script, src_lang)]:
-            logging.info("[%s/%s] No source feature found", tag, key)
+        src_features = lookuplists[(src_script, src_lang)]
+        if src_feature_name not in src_features:
+            if verbose:
+                logging.info("[%s/%s] No source feature found", tag, src_script + "/" + src_lang)
             continue
-        lookups = lookuplists[(src_script, src_lang)][src_feature_name]
+        lookups = src_features[src_feature_name]
         if operation == "move":
             to_remove.add((src_script, src_lang, src_feature_name, tuple(lookups)))
-        logging.info(
-            "[%s/%s/%s] Adding lookups %s",
-            tag,
-            dst_script + "/" + dst_lang,
-            dst_feature_name,
-            lookups,
-        )
-        if start:
-            lookuplists[(dst_script, dst_lang)][dst_feature_name] = (
-                lookups + lookuplists[(dst_script, dst_lang)][dst_feature_name]
+        if verbose:
+            logging.info(
+                "[%s/%s/%s] Adding lookups %s",
+                tag,
+                dst_script + "/" + dst_lang,
+                dst_feature_name,
+                lookups,
             )
+        dst_features = lookuplists[(dst_script, dst_lang)]
+        if start:
+            dst_features[dst_feature_name] = lookups + dst_features[dst_feature_name]
         else:
-            lookuplists[(dst_script, dst_lang)][dst_feature_name].extend(lookups)
+            dst_features[dst_feature_name].extend(lookups)
     for script, lang, feature, lookups in to_remove:
-        logging.info(
-            "[%s/%s/%s/%s] Removing lookups %s",
-            tag,
-            script,
-            lang,
-            feature,
-            list(lookups),
-        )
+        if verbose:
+            logging.info(
+                "[%s/%s/%s/%s] Removing lookups %s",
+                tag,
+                script,
+                lang,
+                feature,
+                list(lookups),
+            )
+        lookups = set(lookups)
         lookuplists[(script, lang)][feature] = [
             lookup for lookup in lookuplists[(script, lang)][feature] if lookup not in lookups
         ]
-    logging.debug("[%s] After: %s", tag, de_default(lookuplists))
-    thaw_lookuplist(table, lookuplists, params)
 
 
-def delete_feature(table, script, lang, feature):
-    tag = type(table).__name__
-    lookuplists, params = freeze_lookuplist(table)
-    logging.debug("[%s] Before: %s", tag, de_default(lookuplists))
-    src_langsyses = find_langsyses(lookuplists, script, lang)
+def _delete_feature(tag, lookuplists, script, lang, feature, index=None):
+    """Apply a drop command to a frozen lookup list"""
+    verbose = logging.getLogger().isEnabledFor(logging.INFO)
+    src_langsyses = find_langsyses(lookuplists, script, lang, index)
     for src_script, src_lang in src_langsyses:
         key = src_script + "/" + src_lang
         if feature not in lookuplists[(src_script, src_lang)]:
-            logging.info("[%s/%s] No source feature found", tag, key)
+            if verbose:
+                logging.info("[%s/%s] No source feature found", tag, key)
             continue
         lookuplists[(src_script, src_lang)][feature] = []
-        logging.info("[%s/%s] Removed feature %s", tag, key, feature)
-    logging.debug("[%s] After: %s", tag, de_default(lookuplists))
+        if verbose:
+            logging.info("[%s/%s] Removed feature %s", tag, key, feature)
+
+
+def apply_commands(table, commands):
+    """Apply parsed commands (see parse_command) to a GSUB/GPOS table, freezing
+    and thawing the table's lookup list only once for all of them."""
+    tag = type(table).__name__
+    lookuplists, params = freeze_lookuplist(table)
+    if logging.getLogger().isEnabledFor(logging.DEBUG):
+        logging.debug("[%s] Before: %s", tag, de_default(lookuplists))
+    # Commands never add language systems, so the index stays valid for all of them
+    index = index_langsyses(lookuplists)
+    for command in commands:
+        if command[0] == "delete":
+            _delete_feature(tag, lookuplists, *command[1], index=index)
+        else:
+            _, src, dst, operation, start = command
+            _remap_lookups(tag, lookuplists, src, dst, operation=operation, start=start, index=index)
+    if logging.getLogger().isEnabledFor(logging.DEBUG):
+        logging.debug("[%s] After: %s", tag, de_default(lookuplists))
     thaw_lookuplist(table, lookuplists, params)
 
 
+def remap_lookups(table, src, dst, operation="copy", start=False):
+    apply_commands(table, [("remap", src, dst, operation, start)])
+
+
+def delete_feature(table, script, lang, feature):
+    apply_commands(table, [("delete", (script, lang, feature))])
+
+
+def parse_command(cmd):
+    """Parse a command into ("delete", (script, lang, feature)) or
+    ("remap", src, dst, operation, start)."""
+    if cmd.startswith("!"):
+        return ("delete", parse_key(cmd[1:]))
+    src = re.match(KEY_RE, cmd)
+    if src is None:
+        raise ValueError(f"Could not parse source: {cmd}")
+    cmd = cmd[len(src.group(0)) :]
+
+    remap = None
+    if re.match(r"^\s*->\s*", cmd):
+        remap = "copy"
+    elif re.match(r"^\s*=>\s*", cmd):
+        remap = "move"
+    else:
+        raise ValueError(f"Could not parse operation: {cmd}")
+    dst = re.sub(r"^\s*->\s*|\s*=>\s*", "", cmd).strip()
+
+    start = False
+    if dst.startswith("|"):
+        dst = dst[1:]
+        start = True
+    dst = re.match(KEY_RE, dst)
+    if dst is None:
+        raise ValueError(f"Could not parse destination: {cmd}")
+    return ("remap", parse_key(src[0]), parse_key(dst[0]), remap, start)
+
+
 def remap(ttfont, commands):
     # args = parser.parse_args()
     # ttfont = TTFont(args.font)
     tables = [ttfont[table].table for table in LAYOUT_TABLES if table in ttfont]
-    for cmd in commands:
-        if cmd.startswith("!"):
-            script, lang, feature = parse_key(cmd[1:])
-            for table in tables:
-                delete_feature(table, script, lang, feature)
-            continue
-        src = re.match(KEY_RE, cmd)
-        if src is None:
-            raise ValueError(f"Could not parse source: {cmd}")
-        cmd = cmd[len(src.group(0)) :]
-
-        remap = None
-        if re.match(r"^\s*->\s*", cmd):
-            remap = "copy"
-        elif re.match(r"^\s*=>\s*", cmd):
-            remap = "move"
-        else:
-            raise ValueError(f"Could not parse operation: {cmd}")
-        dst = re.sub(r"^\s*->\s*|\s*=>\s*", "", cmd).strip()
-
-        start = False
-        if dst.startswith("|"):
-            dst = dst[1:]
-            start = True
-        dst = re.match(KEY_RE, dst)
-        if dst is None:
-            raise ValueError(f"Could not parse destination: {cmd}")
-        for table in tables:
-            remap_lookups(
-                table,
-                parse_key(src[0]),
-                parse_key(dst[0]),
-                operation=remap,
-                start=start,
-            )
+    commands = [parse_command(cmd) for cmd in commands]
+    for table in tables:
+        apply_commands(table, commands)
 
     # if args.o:
     #     ttfont.save(args.o)
@@ -0,0 +1,134 @@
+"""
+Memory-aware scheduling of batch runs, for fonts that need gigabytes of memory each.
+
+Every font is processed in a fresh worker process, and fonts are only started while the
+memory they are expected to need fits into the budget together with the fonts already
+running. A font that needs more than the whole budget runs alone, and many small fonts run
+concurrently, up to the number of jobs. The biggest fonts are started first, and smaller ones
+fill the remaining budget.
+
+The memory a font needs is estimated from the sizes of its tables, weighted by how much they
+grow when they are decompiled and copied between stages. The peak resident memory of every
+worker is measured when it finishes. If workers needed more than estimated, the estimates of
+the fonts still waiting are scaled up by the largest ratio of measured to estimated memory.
+
+    upsetter -u U+0000-00FF -j 0 --max-memory 8G fonts/*.ttf
+"""
+
+import logging
+import os
+
+# Resident memory of a worker process before it loads a font, in bytes
+WORKER_MEMORY = 32 * 1024**2
+# Bytes of memory per byte of table data, for tables the pipeline decompiles into Python objects
+DECOMPILED_FACTOR = 100
+# Bytes of memory per byte of table data, for tables that are passed through as raw data
+RAW_FACTOR = 4
+DECOMPILED_TABLES = ["glyf", "gvar", "CFF ", "CFF2", "GSUB", "GPOS", "GDEF", "cmap", "hmtx", "vmtx", "HVAR", "VVAR"]
+
+
+def estimate_memory(font_file):
+    """Estimated peak memory in bytes for processing a font file, from the uncompressed sizes of its tables"""
+    from fontTools.ttLib import TTFont
+
+    try:
+        reader = TTFont(font_file, lazy=True, fontNumber=0).reader
+    except Exception as e:
+        # The worker will report the error; assume the file size counts as raw data
+        logging.debug(f"Can't read the tables of {font_file} to estimate its memory: {e}")
+        return WORKER_MEMORY + RAW_FACTOR * os.path.getsize(font_file)
+    memory = WORKER_MEMORY
+    for tag, entry in reader.tables.items():
+        # WOFF and WOFF2 entries have the compressed length as length
+        length = getattr(entry, "origLength", entry.length)
+        memory += length * (DECOMPILED_FACTOR if tag in DECOMPILED_TABLES else RAW_FACTOR)
+    return memory
+
+
+def _worker(connection, log_level, function, font_file, options):
+    from . import _init_worker
+    from .metrics import peak_rss
+
+    _init_worker(log_level)
+    try:
+        outcome = (function(font_file, **options), None)
+    except Exception as e:
+        outcome = (None, e)
+    connection.send(outcome + (peak_rss(),))
+    connection.close()
+
+
+def run_scheduled(function, font_files, max_memory, jobs=None, options=None, estimates=None, file_options=None):
+    """Call function(font_file, **options) for every font file in a worker process of its own, keeping the
+    estimated memory of the running workers under max_memory bytes, with at most jobs workers
+    (None uses all CPUs). function must be defined at module level. estimates are the memory every call
+    needs in bytes, by default estimate_memory() of every font file. file_options are additional options
+    for every call.
+    Returns a (return value, exception) tuple per font, in the order of font_files."""
+    import multiprocessing
+    from multiprocessing.connection import wait
+
+    jobs = jobs or os.cpu_count() or 1
+    options = options or {}
+    file_options = file_options or [{}] * len(font_files)
+    log_level = logging.getLogger().level
+    estimates = estimates or [estimate_memory(font_file) for font_file in font_files]
+    # Biggest first, so that they don't have to wait for the budget at the end
+    pending = sorted(range(len(font_files)), key=lambda index: -estimates[index])
+    outcomes = [None] * len(font_files)
+    # Connection => (index, process, reserved memory)
+    running = {}
+    scale = 1.0
+
+    while pending or running:
+        reserved = sum(memory for _, _, memory in running.values())
+        for index in list(pending):
+            if len(running) >= jobs:
+                break
+            memory = estimates[index] * scale
+            if running and reserved + memory > max_memory:
+                continue
+            if memory > max_memory:
+                logging.warning(
+                    f"{font_files[index]} needs about {memory / 1024**2:.0f} MB, "
+                    f"more than the memory budget of {max_memory / 1024**2:.0f} MB, processing it alone"
+                )
+            receive, send = multiprocessing.Pipe(duplex=False)
+            process = multiprocessing.Process(
+                target=_worker,
+                args=(send, log_level, function, font_files[index], dict(options, **file_options[index])),
+                daemon=True,
+            )
+            process.start()
+            # Only the worker holds the sending end now, so that its exit ends the connection
+            send.close()
+            running[receive] = (index, process, memory)
+            reserved += memory
+            pending.remove(index)
+            logging.info(
+                f"Started {font_files[index]} (about {memory / 1024**2:.0f} MB, "
+                f"{reserved / 1024**2:.0f} of {max_memory / 1024**2:.0f} MB reserved)"
+            )
+
+        for connection in wait(list(running)):
+            index, process, memory = running.pop(connection)
+            try:
+                result, exception, peak = connection.recv()
+            except EOFError:
+                process.join()
+                killed = " (killed, possibly for running out of memory)" if process.exitcode == -9 else ""
+                result, exception, peak = (
+                    None,
+                    RuntimeError(f"Worker exited with code {process.exitcode}{killed}"),
+                    None,
+                )
+            connection.close()
+            process.join()
+            outcomes[index] = (result, exception)
+            if peak:
+                scale = max(scale, peak / estimates[index])
+                logging.info(
+                    f"Finished {font_files[index]}: peak memory {peak / 1024**2:.0f} MB, "
+                    f"estimated {memory / 1024**2:.0f} MB"
+                )
+    return outcomes
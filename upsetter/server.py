@@ -0,0 +1,295 @@
+"""
+Long-running subsetting server, started with `upsetter serve`.
+
+Fonts are requested by their path relative to the font directory, with the usual options as query parameters:
+
+    GET /upset?font=Ysabeau.ttf&unicodes=U+0020-007E&subspace=wght=400&freeze=smcp&format=woff2
+
+Fonts can also be uploaded as the body of a POST request to /upset, with the same query parameters.
+GET /stats returns the number of requests, latency percentiles and pool statistics as JSON.
+
+The server avoids the startup costs of the command line tool: all modules stay imported, and a
+bounded LRU pool keeps source fonts resident after sub-spacing and feature-freezing, the most
+expensive stages. Pool entries are kept as compiled bytes and every request subsets a fresh,
+lazily loaded copy of them, which is cheaper than deep-copying a fully parsed TTFont.
+"""
+
+import argparse
+import collections
+import io
+import json
+import logging
+import os
+import socketserver
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from . import font_freeze_features, font_subset, font_subspace, upset_bytes, validate_features
+from .compress import FLAVORS, MAX_QUALITY, compress_bytes
+
+CONTENT_TYPES = {"ttf": "font/ttf", "otf": "font/otf", "woff2": "font/woff2", "woff": "font/woff"}
+PARAMETERS = ["font", "unicodes", "subspace", "freeze", "remove", "name", "glyph_names", "format", "quality"]
+MAX_LATENCIES = 10000
+
+
+class FontPool:
+    """LRU pool of source fonts after sub-spacing and feature-freezing, as compiled bytes"""
+
+    def __init__(self, font_dir, max_fonts=16):
+        self.font_dir = os.path.realpath(font_dir)
+        self.max_fonts = max_fonts
+        self.fonts = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._loading = {}
+
+    def resolve(self, font):
+        """Return the path of a font in the font directory, refusing paths outside of it"""
+        path = os.path.realpath(os.path.join(self.font_dir, font))
+        if os.path.commonpath([path, self.font_dir]) != self.font_dir or not os.path.isfile(path):
+            raise FileNotFoundError(f"No font {font}")
+        return path
+
+    def get(self, font, subspace=None, freeze_features=None, name=""):
+        from .cache import normalize_subspace
+
+        path = self.resolve(font)
+        # Fonts that change on disk get a new key, their old entries fall out of the pool eventually
+        key = (
+            path,
+            os.stat(path).st_mtime_ns,
+            normalize_subspace(subspace) if subspace else None,
+            tuple(freeze_features) if freeze_features is not None else None,
+            name or "",
+        )
+        with self._lock:
+            if key in self.fonts:
+                self.hits += 1
+                self.fonts.move_to_end(key)
+                return self.fonts[key]
+            self.misses += 1
+            # Requests for the same font wait for a single thread to prepare it
+            loading = self._loading.setdefault(key, threading.Lock())
+
+        with loading:
+            with self._lock:
+                if key in self.fonts:
+                    return self.fonts[key]
+            try:
+                data = self._prepare(path, subspace, freeze_features, name)
+                with self._lock:
+                    self.fonts[key] = data
+                    while len(self.fonts) > self.max_fonts:
+                        self.fonts.popitem(last=False)
+            finally:
+                with self._lock:
+                    self._loading.pop(key, None)
+        return data
+
+    def _prepare(self, path, subspace, freeze_features, name):
+        from fontTools.ttLib import TTFont
+
+        logging.info(f"Loading {path} into the pool")
+        ttFont = TTFont(path)
+        if subspace:
+            ttFont = font_subspace(ttFont, subspace, inplace=True)
+        if freeze_features is not None:
+            ttFont = font_freeze_features(ttFont, freeze_features, name, inplace=True)
+        stream = io.BytesIO()
+        ttFont.save(stream)
+        ttFont.close()
+        return stream.getvalue()
+
+    def stats(self):
+        with self._lock:
+            return {"size": len(self.fonts), "max_size": self.max_fonts, "hits": self.hits, "misses": self.misses}
+
+
+class LatencyStats:
+    """Request counts and latency percentiles over the most recent requests"""
+
+    def __init__(self, max_latencies=MAX_LATENCIES):
+        self.requests = 0
+        self.errors = 0
+        self.latencies = collections.deque(maxlen=max_latencies)
+        self._lock = threading.Lock()
+
+    def record(self, seconds, error=False):
+        with self._lock:
+            self.requests += 1
+            self.errors += bool(error)
+            self.latencies.append(seconds)
+
+    def summary(self):
+        with self._lock:
+            latencies = sorted(self.latencies)
+            summary = {"requests": self.requests, "errors": self.errors, "latency_ms": {}}
+        for name, percentile in (("p50", 50), ("p90", 90), ("p99", 99), ("max", 100)):
+            if latencies:
+                # Nearest-rank percentile
+                index = max(0, -(-percentile * len(latencies) // 100) - 1)
+                summary["latency_ms"][name] = round(latencies[index] * 1000, 3)
+        return summary
+
+
+def parse_request(query):
+    """Turn the query string of a request into options, raising ValueError for invalid ones"""
+    from fontTools.varLib.instancer import parseLimits
+
+    # A literal '+' is part of unicode ranges like U+0041, not an encoded space
+    params = {key: values[-1] for key, values in parse_qs(query.replace("+", "%2B")).items()}
+    unknown = set(params) - set(PARAMETERS)
+    if unknown:
+        raise ValueError(f"Unknown parameters: {', '.join(sorted(unknown))}")
+
+    font_format = params.get("format", "ttf")
+    if font_format not in CONTENT_TYPES:
+        raise ValueError(f"Unknown format {font_format}, use one of: {', '.join(CONTENT_TYPES)}")
+    quality = int(params.get("quality", MAX_QUALITY))
+    if not 0 <= quality <= MAX_QUALITY:
+        raise ValueError(f"Quality must be between 0 and {MAX_QUALITY}")
+
+    options = dict(
+        unicodes=params.get("unicodes") or None,
+        subspace=parseLimits(params["subspace"].split(",")) if params.get("subspace") else None,
+        freeze_features=params["freeze"].split(",") if params.get("freeze") else None,
+        remove_features=params["remove"].split(",") if params.get("remove") else None,
+        name=params.get("name", ""),
+        keep_glyph_names=params.get("glyph_names", "") in ("1", "true"),
+    )
+    validate_features(options["freeze_features"], options["remove_features"])
+    return params.get("font"), font_format, quality, options
+
+
+def process(pool, query, body=None):
+    """Answer an /upset request. Returns the output bytes and their format."""
+    from fontTools.ttLib import TTFont
+
+    font, font_format, quality, options = parse_request(query)
+    flavor = font_format if font_format in FLAVORS else None
+
+    if body is not None:
+        return upset_bytes(body, flavors=[flavor], compress_quality=quality, **options)[flavor], font_format
+
+    if not font:
+        raise ValueError("Parameter font is required")
+    data = pool.get(font, options["subspace"], options["freeze_features"], options["name"])
+    ttFont = font_subset(
+        TTFont(io.BytesIO(data)),
+        options["unicodes"],
+        options["remove_features"],
+        options["keep_glyph_names"],
+        inplace=True,
+    )
+    stream = io.BytesIO()
+    ttFont.save(stream)
+    ttFont.close()
+    data = stream.getvalue()
+    if flavor is not None:
+        data = compress_bytes(data, flavor, quality)
+    return data, font_format
+
+
+class UpsetHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if url.path == "/stats":
+            stats = dict(self.server.stats.summary(), pool=self.server.pool.stats())
+            self._send(200, json.dumps(stats).encode("utf-8"), "application/json")
+        elif url.path == "/upset":
+            self._upset(url.query)
+        else:
+            self._send(404, b"Not found\n", "text/plain")
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        if url.path != "/upset":
+            self._send(404, b"Not found\n", "text/plain")
+            return
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self._upset(url.query, body)
+
+    def _upset(self, query, body=None):
+        start = time.perf_counter()
+        try:
+            data, font_format = process(self.server.pool, query, body)
+            status, content_type = 200, CONTENT_TYPES[font_format]
+        except FileNotFoundError as e:
+            status, data, content_type = 404, f"{e}\n".encode("utf-8"), "text/plain"
+        except (AssertionError, ValueError) as e:
+            status, data, content_type = 400, f"{e}\n".encode("utf-8"), "text/plain"
+        except Exception as e:
+            logging.exception(f"Request {self.path} failed")
+            status, data, content_type = 500, f"{type(e).__name__}: {e}\n".encode("utf-8"), "text/plain"
+        self.server.stats.record(time.perf_counter() - start, error=status != 200)
+        self._send(status, data, content_type)
+
+    def _send(self, status, data, content_type):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def address_string(self):
+        # Unix socket clients have no address
+        return self.client_address[0] if self.client_address else "unix"
+
+    def log_message(self, format, *args):
+        logging.info(f"{self.address_string()} {format % args}")
+
+
+class UnixHTTPServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+
+def make_server(font_dir=".", host="127.0.0.1", port=8000, socket_path=None, pool_size=16):
+    """Create a threaded server on a TCP port or, with socket_path, on a Unix socket.
+    Call serve_forever() on it to start serving."""
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        server = UnixHTTPServer(socket_path, UpsetHandler)
+    else:
+        server = ThreadingHTTPServer((host, port), UpsetHandler)
+    server.pool = FontPool(font_dir, pool_size)
+    server.stats = LatencyStats()
+    return server
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        prog="upsetter serve",
+        description="Serve subset fonts over HTTP, keeping prepared source fonts in memory",
+        epilog="Example: upsetter serve --font-dir fonts --port 8000",
+    )
+    parser.add_argument("--font-dir", default=".", help="Directory of the fonts to serve. Default is the current one.")
+    parser.add_argument("--host", default="127.0.0.1", help="Host to listen on. Default is 127.0.0.1.")
+    parser.add_argument("--port", type=int, default=8000, help="Port to listen on. Default is 8000.")
+    parser.add_argument("--socket", help="Listen on this Unix socket instead of a TCP port")
+    parser.add_argument(
+        "--pool-size",
+        type=int,
+        default=16,
+        help="Number of prepared fonts to keep in memory, per subspace/freeze combination. Default is 16.",
+    )
+    parser.add_argument("-v", "--verbose", help="Be verbose. Set logging level to INFO.", action="store_true")
+    args = parser.parse_args(args)
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING)
+
+    server = make_server(args.font_dir, args.host, args.port, args.socket, args.pool_size)
+    print(f"Serving {server.pool.font_dir} on {args.socket or f'http://{args.host}:{server.server_address[1]}'}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if args.socket and os.path.exists(args.socket):
+            os.remove(args.socket)
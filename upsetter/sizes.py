@@ -0,0 +1,97 @@
+"""
+Byte accounting of the tables of fonts across the pipeline stages, and size budgets.
+
+While a Metrics collector with table_sizes=True is active, the input font and the result
+of every stage (sub-spacing, feature-freezing, pruning, subsetting and compaction) are compiled and the
+size of every table is recorded, as well as the total size of the WOFF2 and WOFF outputs.
+Stages restored from the cache are not recorded, as they don't run.
+
+Budgets limit the size of output files, or of single tables in the uncompressed outputs:
+
+    upsetter -u U+0000-00FF -c --budget woff2=40K --budget GPOS=8K --table-sizes font.ttf
+"""
+
+import io
+import os
+
+SIZE_STAGES = ["input", "subspace", "freeze", "prune", "subset", "compact", "woff2", "woff"]
+# Budget keys for whole output files, by file extension
+FILE_BUDGETS = {"ttf": ".ttf", "otf": ".otf", "woff2": ".woff2", "woff": ".woff"}
+
+
+def table_sizes(ttFont=None, data=None):
+    """Size of every table of a TTFont or compiled font data in bytes, and the total size"""
+    from fontTools.ttLib import TTFont
+
+    if data is None:
+        stream = io.BytesIO()
+        ttFont.save(stream)
+        data = stream.getvalue()
+    reader = TTFont(io.BytesIO(data), lazy=True).reader
+    return {tag: reader.tables[tag].length for tag in sorted(reader.tables)}, len(data)
+
+
+def size_summary(records):
+    """Size records of a Metrics collector as a dict of font file => stage => {"total": n, "tables": {...}},
+    in pipeline order. Compressed outputs have tables None."""
+    summary = {}
+    for record in records:
+        if "tables" in record:
+            summary.setdefault(record["font_file"], {})[record["stage"]] = {
+                "total": record["total"],
+                "tables": record["tables"],
+            }
+    return {
+        font_file: {stage: stages[stage] for stage in SIZE_STAGES if stage in stages}
+        for font_file, stages in summary.items()
+    }
+
+
+def size_report(records):
+    """Size records as a text table per font, with one row per table and one column per stage"""
+    lines = []
+    for font_file, stages in size_summary(records).items():
+        tags = sorted({tag for sizes in stages.values() for tag in sizes["tables"] or {}})
+        lines.append(font_file)
+        lines.append(f"{'table':<8}" + "".join(f"{stage:>10}" for stage in stages))
+        for tag in tags:
+            cells = []
+            for sizes in stages.values():
+                size = (sizes["tables"] or {}).get(tag)
+                cells.append("" if sizes["tables"] is None else "-" if size is None else str(size))
+            lines.append(f"{tag:<8}" + "".join(f"{cell:>10}" for cell in cells))
+        lines.append(f"{'total':<8}" + "".join(f"{sizes['total']:>10}" for sizes in stages.values()))
+    return "\n".join(lines)
+
+
+def parse_budget(budget, parse_size):
+    """Parse a budget like '40K' (every output file), 'woff2=40K' (output files of a format)
+    or 'GPOS=8K' (a table in the uncompressed outputs). Returns a (key, bytes) tuple with key None
+    for every output file."""
+    key, _, size = budget.rpartition("=")
+    if key and key not in FILE_BUDGETS:
+        assert len(key) <= 4, f"Invalid budget {budget}: neither a format ({', '.join(FILE_BUDGETS)}) nor a table"
+        key = key.ljust(4)
+    return key or None, parse_size(size)
+
+
+def check_budgets(output_files, budgets):
+    """Check output files against budgets given as (key, bytes) tuples, see parse_budget().
+    Returns a list of dicts with the keys "file", "budget" (the key), "size" and "limit" for every exceeded budget."""
+    exceeded = []
+    for output_file in output_files:
+        extension = os.path.splitext(output_file)[1].lower()
+        tables = None
+        for key, limit in budgets:
+            if key is None or FILE_BUDGETS.get(key) == extension:
+                size = os.path.getsize(output_file)
+            elif key not in FILE_BUDGETS and extension in (".ttf", ".otf"):
+                if tables is None:
+                    with open(output_file, "rb") as f:
+                        tables = table_sizes(data=f.read())[0]
+                size = tables.get(key, 0)
+            else:
+                continue
+            if size > limit:
+                exceeded.append({"file": output_file, "budget": key or "file", "size": size, "limit": limit})
+    return exceeded
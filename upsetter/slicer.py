@@ -0,0 +1,188 @@
+"""
+Split one font into several fonts by unicode ranges, for use with the
+`unicode-range` descriptor of CSS @font-face rules.
+
+The source font is parsed, sub-spaced and feature-frozen only once. Its
+result is kept as compiled bytes, and every slice is subset from a fresh,
+lazily loaded copy of these bytes and written to disk right away. This keeps
+peak memory close to the size of a single font regardless of the number of slices.
+"""
+
+import io
+import logging
+import os
+
+from . import (
+    font_compact,
+    font_freeze_features,
+    font_prune_layout,
+    font_subset,
+    font_subspace,
+    run_batch,
+    validate_features,
+)
+from .compress import compress_file
+from .metrics import stage
+
+STRATEGIES = ["blocks", "<number of characters per slice>"]
+
+
+def format_unicodes(codepoints, separator=","):
+    """Format codepoints as a list of ranges, e.g. 'U+41-5A,U+61'"""
+    ranges = []
+    for codepoint in sorted(set(codepoints)):
+        if ranges and ranges[-1][1] == codepoint - 1:
+            ranges[-1][1] = codepoint
+        else:
+            ranges.append([codepoint, codepoint])
+    return separator.join(f"U+{start:X}" if start == end else f"U+{start:X}-{end:X}" for start, end in ranges)
+
+
+def split_codepoints(codepoints, strategy):
+    """Split codepoints into slices with a built-in strategy: 'blocks' makes one slice per Unicode block,
+    a number makes slices of that many characters each, in codepoint order."""
+    codepoints = sorted(codepoints)
+    if strategy == "blocks":
+        from fontTools.unicodedata import block
+
+        slices = {}
+        for codepoint in codepoints:
+            slices.setdefault(block(chr(codepoint)), []).append(codepoint)
+        return list(slices.values())
+
+    try:
+        size = int(strategy)
+    except ValueError:
+        raise ValueError(f"Unknown slicing strategy {strategy!r}, use one of: {', '.join(STRATEGIES)}")
+    assert size > 0, "Number of characters per slice must be positive"
+    return [codepoints[i : i + size] for i in range(0, len(codepoints), size)]
+
+
+def font_face_descriptors(ttFont):
+    """Return the font-style and font-weight descriptors of a font"""
+    style = "italic" if ttFont["OS/2"].fsSelection & 1 else "normal"
+    weight = str(ttFont["OS/2"].usWeightClass)
+    if "fvar" in ttFont:
+        for axis in ttFont["fvar"].axes:
+            if axis.axisTag == "wght":
+                weight = f"{axis.minValue:g} {axis.maxValue:g}"
+    return style, weight
+
+
+def font_face_css(family, style, weight, slices):
+    """Build @font-face rules for the slices, a list of (sources, codepoints) tuples
+    where sources is a list of (file name, format) tuples"""
+    rules = []
+    for sources, codepoints in slices:
+        src = ", ".join(f'url("{file_name}") format("{font_format}")' for file_name, font_format in sources)
+        rules.append(
+            "@font-face {\n"
+            f'  font-family: "{family}";\n'
+            f"  font-style: {style};\n"
+            f"  font-weight: {weight};\n"
+            "  font-display: swap;\n"
+            f"  src: {src};\n"
+            f"  unicode-range: {format_unicodes(codepoints, ', ')};\n"
+            "}\n"
+        )
+    return "\n".join(rules)
+
+
+def slice_file(
+    font_file,
+    slices=None,
+    strategy=None,
+    unicodes=None,
+    subspace=None,
+    freeze_features=None,
+    remove_features=None,
+    name="",
+    keep_glyph_names=False,
+    compress=False,
+    family=None,
+    woff=False,
+    compress_quality=11,
+    prune_layout=False,
+    compact=None,
+):
+    """Split a font file into slices and save them next to it as <name>.upset.<slice number>.<ext>,
+    together with a <name>.upset.css file containing the @font-face rules for all slices.
+
+    slices is a list of unicodes strings as taken by font_subset(), one per slice. Alternatively,
+    strategy selects a built-in slicing strategy, see split_codepoints(). Characters outside of
+    unicodes (if given) and characters not in the font are left out, as are slices that end up empty.
+    compress and woff additionally write WOFF2 and WOFF 1.0 files of every slice.
+    Returns the list of written files."""
+    from fontTools.subset import parse_unicodes
+    from fontTools.ttLib import TTFont
+
+    assert bool(slices) != bool(strategy), "Either slices or a slicing strategy is required"
+
+    with stage("load"):
+        ttFont = TTFont(font_file)
+    if subspace:
+        ttFont = font_subspace(ttFont, subspace, inplace=True)
+    if freeze_features is not None:
+        ttFont = font_freeze_features(ttFont, freeze_features, name, inplace=True)
+        if prune_layout:
+            ttFont = font_prune_layout(ttFont, inplace=True)
+
+    available = set(ttFont.getBestCmap())
+    if unicodes is not None:
+        available &= set(parse_unicodes(unicodes))
+    if slices:
+        slices = [sorted(set(parse_unicodes(slice_unicodes)) & available) for slice_unicodes in slices]
+    else:
+        slices = split_codepoints(available, strategy)
+    slices = [codepoints for codepoints in slices if codepoints]
+    family = family or ttFont["name"].getBestFamilyName()
+    style, weight = font_face_descriptors(ttFont)
+
+    # Keep only the compiled bytes around and let go of the parsed font
+    stream = io.BytesIO()
+    ttFont.save(stream)
+    ttFont.close()
+    data = stream.getvalue()
+    del ttFont, stream
+
+    stem, extension = os.path.splitext(font_file)
+    font_format = "opentype" if extension.lower() == ".otf" else "truetype"
+    digits = len(str(len(slices) - 1))
+    outputs = []
+    css = []
+    for i, codepoints in enumerate(slices):
+        logging.info(f"Slice {i}: {len(codepoints)} characters, {format_unicodes(codepoints)}")
+        ttFont = font_subset(
+            TTFont(io.BytesIO(data)), format_unicodes(codepoints), remove_features, keep_glyph_names, inplace=True
+        )
+        if compact:
+            ttFont = font_compact(ttFont, compact, inplace=True)
+        output = f"{stem}.upset.{i:0{digits}d}{extension}"
+        with stage("save"):
+            ttFont.save(output)
+        ttFont.close()
+        outputs.append(output)
+        sources = [(os.path.basename(output), font_format)]
+        if compress or woff:
+            reports = compress_file(output, woff2=compress, woff=woff, quality=compress_quality)
+            outputs.extend(report["output"] for report in reports)
+            sources[:0] = [(os.path.basename(report["output"]), report["flavor"]) for report in reports]
+        css.append((sources, codepoints))
+
+    css_file = f"{stem}.upset.css"
+    with open(css_file, "w", encoding="utf-8") as f:
+        f.write(font_face_css(family, style, weight, css))
+    outputs.append(css_file)
+
+    return outputs
+
+
+def slice_fonts(font_files, jobs=1, max_memory=None, **options):
+    """Run slice_file() with the same options on all font files, optionally in parallel (within max_memory bytes
+    if given) like upset(). Returns one summary dict per font with the keys "font_file", "outputs" and "error"."""
+    validate_features(options.get("freeze_features"), options.get("remove_features"))
+    batch = run_batch(slice_file, font_files, jobs=jobs, max_memory=max_memory, **options)
+    return [
+        {"font_file": font_file, "outputs": outputs or [], "error": error}
+        for font_file, (outputs, error) in zip(font_files, batch)
+    ]
@@ -0,0 +1,272 @@
+"""
+Build many output variants of the same source fonts from one job spec.
+
+A job spec is a JSON or TOML file listing the source fonts and, for each of them,
+the outputs to build. Options set on a font apply to all of its outputs unless
+an output overrides them:
+
+    {
+        "fonts": [
+            {
+                "source": "Ysabeau[wght].ttf",
+                "subspace": "wght=400",
+                "outputs": [
+                    {"output": "Ysabeau-Latin.ttf", "unicodes": "U+0000-00FF", "compress": true},
+                    {"output": "Ysabeau-SC.ttf", "freeze": ["smcp"], "name": "SC"}
+                ]
+            }
+        ]
+    }
+
+Relative paths are resolved against the directory of the spec file.
+
+Each source font is parsed once. Outputs that share the same subspace share the
+instancing, and outputs that additionally share the features to freeze, the name
+suffix and prune_layout share the freezing and pruning. The font is only copied where
+the outputs' options diverge. Compaction and compression run for every output.
+"""
+
+import copy
+import json
+import logging
+import os
+
+from . import (
+    _init_worker,
+    font_compact,
+    font_freeze_features,
+    font_prune_layout,
+    font_subset,
+    font_subspace,
+    validate_features,
+)
+from .compress import MAX_QUALITY, compress_file
+from .metrics import measured_call, stage
+
+OPTIONS = [
+    "unicodes",
+    "subspace",
+    "freeze",
+    "remove",
+    "name",
+    "prune_layout",
+    "glyph_names",
+    "compact",
+    "compress",
+    "woff",
+    "compress_quality",
+]
+
+
+def load_spec(spec_file):
+    """Read a job spec from a .json or .toml file"""
+    if os.path.splitext(spec_file)[1].lower() == ".toml":
+        try:
+            import tomllib
+        except ImportError:
+            import tomli as tomllib
+
+        with open(spec_file, "rb") as f:
+            return tomllib.load(f)
+
+    with open(spec_file, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _feature_list(value):
+    if value is None:
+        return None
+    if isinstance(value, str):
+        return [feature.strip() for feature in value.split(",") if feature.strip()]
+    return list(value)
+
+
+def parse_variant(source_options, output_options, base_dir="."):
+    """Merge the options of a source font and one of its outputs into a variant dict"""
+    from fontTools.varLib.instancer import parseLimits
+
+    options = {key: source_options[key] for key in OPTIONS if key in source_options}
+    options.update(output_options)
+    unknown = set(options) - set(OPTIONS) - {"output"}
+    assert not unknown, f"Unknown options in job spec: {sorted(unknown)}"
+    assert options.get("output"), f"Output path missing in job spec for {source_options.get('source')}"
+
+    freeze_features = _feature_list(options.get("freeze"))
+    remove_features = _feature_list(options.get("remove"))
+    validate_features(freeze_features, remove_features)
+
+    compact = None
+    if options.get("compact"):
+        from .compact import parse_techniques
+
+        compact = parse_techniques(options["compact"])
+    compress_quality = options.get("compress_quality", MAX_QUALITY)
+    assert compress_quality in range(MAX_QUALITY + 1), f"compress_quality must be 0-{MAX_QUALITY} in job spec"
+
+    subspace = options.get("subspace") or None
+    return {
+        "output": os.path.join(base_dir, options["output"]),
+        "unicodes": options.get("unicodes") or None,
+        "subspace_key": subspace,
+        "subspace": parseLimits(subspace.split(",")) if subspace else None,
+        "freeze_features": freeze_features,
+        # The name suffix is only applied while freezing
+        "name": (options.get("name") or "") if freeze_features is not None else "",
+        # Pruning only follows freezing as well
+        "prune_layout": bool(options.get("prune_layout")) and freeze_features is not None,
+        "remove_features": remove_features,
+        "keep_glyph_names": bool(options.get("glyph_names", False)),
+        "compact": compact,
+        "compress": bool(options.get("compress", False)),
+        "woff": bool(options.get("woff", False)),
+        "compress_quality": compress_quality,
+    }
+
+
+def _group(variants, key):
+    groups = {}
+    for variant in variants:
+        groups.setdefault(key(variant), []).append(variant)
+    return groups
+
+
+def _branches(ttFont, groups):
+    """Yield a font for each group. All groups but the last one get a copy of the font."""
+    for i, (key, variants) in enumerate(groups.items()):
+        if i == len(groups) - 1:
+            yield key, variants, ttFont
+        else:
+            yield key, variants, copy.deepcopy(ttFont)
+
+
+def _fail(variants, results, error):
+    for variant in variants:
+        logging.error(f"Building {variant['output']} failed: {error}")
+        results[variant["output"]] = {"outputs": [], "error": error}
+
+
+def _error(e):
+    return f"{type(e).__name__}: {e}"
+
+
+def build_source(source, variants):
+    """Build all variants of one source font, sharing the pipeline stages between them.
+    Returns a dict mapping each variant's output path to its outputs and error."""
+    from fontTools.ttLib import TTFont
+
+    results = {}
+    try:
+        with stage("load"):
+            ttFont = TTFont(source)
+    except Exception as e:
+        _fail(variants, results, _error(e))
+        return results
+
+    by_subspace = _group(variants, lambda variant: variant["subspace_key"])
+    for subspace_key, subspace_variants, subspace_font in _branches(ttFont, by_subspace):
+        try:
+            if subspace_key:
+                logging.info(f"Sharing subspace {subspace_key} across {len(subspace_variants)} outputs")
+                subspace_font = font_subspace(subspace_font, subspace_variants[0]["subspace"], inplace=True)
+        except Exception as e:
+            _fail(subspace_variants, results, _error(e))
+            continue
+
+        by_freeze = _group(
+            subspace_variants,
+            lambda variant: (
+                tuple(variant["freeze_features"]) if variant["freeze_features"] is not None else None,
+                variant["name"],
+                variant["prune_layout"],
+            ),
+        )
+        for (freeze_features, name, prune_layout), freeze_variants, freeze_font in _branches(subspace_font, by_freeze):
+            try:
+                if freeze_features is not None:
+                    freeze_features = list(freeze_features)
+                    logging.info(f"Sharing frozen features {freeze_features} across {len(freeze_variants)} outputs")
+                    freeze_font = font_freeze_features(freeze_font, freeze_features, name, inplace=True)
+                    if prune_layout:
+                        freeze_font = font_prune_layout(freeze_font, inplace=True)
+            except Exception as e:
+                _fail(freeze_variants, results, _error(e))
+                continue
+
+            by_output = _group(freeze_variants, lambda variant: variant["output"])
+            for output, (variant,), output_font in _branches(freeze_font, by_output):
+                try:
+                    output_font = font_subset(
+                        output_font,
+                        variant["unicodes"],
+                        variant["remove_features"],
+                        variant["keep_glyph_names"],
+                        inplace=True,
+                    )
+                    if variant["compact"]:
+                        output_font = font_compact(output_font, variant["compact"], inplace=True)
+                    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+                    with stage("save"):
+                        output_font.save(output)
+                    outputs = [output]
+                    if variant["compress"] or variant["woff"]:
+                        reports = compress_file(
+                            output,
+                            woff2=variant["compress"],
+                            woff=variant["woff"],
+                            quality=variant["compress_quality"],
+                        )
+                        outputs.extend(report["output"] for report in reports)
+                    results[output] = {"outputs": outputs, "error": None}
+                except Exception as e:
+                    _fail([variant], results, _error(e))
+
+    return results
+
+
+def _build_source_job(source, variants, settings=None):
+    if settings is None:
+        return build_source(source, variants), []
+    return measured_call(source, build_source, settings, variants=variants)
+
+
+def run_spec(spec, base_dir=".", jobs=1, metrics=None):
+    """Build all outputs listed in a job spec (as returned by load_spec()).
+
+    With jobs > 1, source fonts are processed in a pool of that many worker processes (jobs=None uses all CPUs).
+    With a upsetter.metrics.Metrics collector as metrics, all stages are measured into it.
+    Returns one summary dict per output in the order of the spec, with the keys "font_file" (the source),
+    "output", "outputs" (list of written files) and "error" (None on success)."""
+
+    sources = []
+    for source_options in spec["fonts"]:
+        assert source_options.get("source"), "Source font missing in job spec"
+        source = os.path.join(base_dir, source_options["source"])
+        variants = [parse_variant(source_options, output, base_dir) for output in source_options.get("outputs", [])]
+        outputs = [variant["output"] for variant in variants]
+        assert len(set(outputs)) == len(outputs), f"Duplicate output paths in job spec for {source}"
+        sources.append((source, variants))
+
+    settings = metrics.settings() if metrics is not None else None
+    if jobs == 1 or len(sources) < 2:
+        built = [_build_source_job(source, variants, settings) for source, variants in sources]
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(
+            max_workers=jobs, initializer=_init_worker, initargs=(logging.getLogger().level,)
+        ) as executor:
+            built = list(executor.map(_build_source_job, *zip(*sources), [settings] * len(sources)))
+
+    results = []
+    for (source, variants), (source_results, records) in zip(sources, built):
+        if metrics is not None:
+            metrics.merge(records)
+        for variant in variants:
+            results.append({"font_file": source, "output": variant["output"], **source_results[variant["output"]]})
+    return results
+
+
+def run_spec_file(spec_file, jobs=1, metrics=None):
+    """Load a job spec file and build all its outputs. See run_spec()."""
+    base_dir = os.path.dirname(os.path.abspath(spec_file))
+    return run_spec(load_spec(spec_file), base_dir=base_dir, jobs=jobs, metrics=metrics)
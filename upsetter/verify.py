@@ -0,0 +1,290 @@
+"""
+Verification that processed fonts shape text like their sources. Started with `upsetter verify`.
+
+The source font is shaped with the frozen features turned on and the removed features turned
+off, the processed font with its defaults, and the glyph runs of every line of the text corpora
+are compared: the outline of every glyph, drawn at the same location in the design space, and
+its advance and offsets. Processed fonts usually lost their glyph names, so glyphs are compared
+by what they look like; names are only compared if both fonts have them. Characters that the
+processed font doesn't contain are left out of the text for both fonts.
+
+Shaping runs in-process with HarfBuzz (uharfbuzz, installed with the 'verify' extra), and every
+font and corpus is verified in a worker process of its own with -j. For every mismatch, the
+frozen or removed features that change the shaping of that line in the source are reported,
+as the likely cause; if there are none, the difference comes from somewhere else, e.g. subsetting.
+
+    upsetter verify -f smcp -r ss01 --corpus texts.txt -j 0 font.ttf
+"""
+
+import argparse
+import json
+import logging
+
+from . import output_path, run_batch
+from .cli import non_negative_int
+
+# Characters per line of the default corpus, which also has a line for every single character
+DEFAULT_LINE_LENGTH = 40
+# Difference in font units up to which coordinates and positions count as the same. Instancing rounds
+# coordinates, while HarfBuzz interpolates them unrounded, also the implied points of quadratic curves.
+TOLERANCE = 1
+
+
+def _hb():
+    try:
+        import uharfbuzz
+    except ImportError:
+        raise ImportError("Verification needs uharfbuzz, install it with: pip install upsetter[verify]")
+    return uharfbuzz
+
+
+class _Shaper:
+    """A font loaded into HarfBuzz, with a cache of the outlines of its glyphs"""
+
+    def __init__(self, data, location=None):
+        hb = _hb()
+        self.font = hb.Font(hb.Face(data))
+        if location:
+            axes = {axis.tag for axis in self.font.face.axis_infos}
+            self.font.set_variations({tag: value for tag, value in location.items() if tag in axes})
+        self._outlines = {}
+        # Fonts without glyph names get names like "gid1" from HarfBuzz
+        self.named = self.font.glyph_to_string(0) != "gid0"
+        self.codepoints = set(self.font.face.unicodes)
+
+    def outline(self, glyph):
+        if glyph not in self._outlines:
+            from fontTools.pens.recordingPen import RecordingPen
+
+            pen = RecordingPen()
+            self.font.draw_glyph_with_pen(glyph, pen)
+            self._outlines[glyph] = [
+                (operator, [value for point in points for value in point]) for operator, points in pen.value
+            ]
+        return self._outlines[glyph]
+
+    def shape(self, text, features=None):
+        """Glyph run of text as a list of (name, outline, advance, x offset, y offset) tuples,
+        with name None if the font has no glyph names"""
+        hb = _hb()
+        buffer = hb.Buffer()
+        buffer.add_str(text)
+        buffer.guess_segment_properties()
+        hb.shape(self.font, buffer, features or {})
+        return [
+            (
+                self.font.glyph_to_string(info.codepoint) if self.named else None,
+                self.outline(info.codepoint),
+                position.x_advance,
+                position.x_offset,
+                position.y_offset,
+            )
+            for info, position in zip(buffer.glyph_infos, buffer.glyph_positions)
+        ]
+
+    def glyph_names(self, text, features=None):
+        hb = _hb()
+        buffer = hb.Buffer()
+        buffer.add_str(text)
+        buffer.guess_segment_properties()
+        hb.shape(self.font, buffer, features or {})
+        return [self.font.glyph_to_string(info.codepoint) for info in buffer.glyph_infos]
+
+
+def _same_run(run, other):
+    """Whether two glyph runs of _Shaper.shape() are the same, up to TOLERANCE"""
+
+    def close(values, others):
+        return len(values) == len(others) and all(abs(a - b) <= TOLERANCE for a, b in zip(values, others))
+
+    return len(run) == len(other) and all(
+        (glyph[0] is None or other_glyph[0] is None or glyph[0] == other_glyph[0])
+        and close(glyph[2:], other_glyph[2:])
+        and len(glyph[1]) == len(other_glyph[1])
+        and all(
+            operator == other_operator and close(values, other_values)
+            for (operator, values), (other_operator, other_values) in zip(glyph[1], other_glyph[1])
+        )
+        for glyph, other_glyph in zip(run, other)
+    )
+
+
+def default_corpus(codepoints):
+    """Lines of text with all codepoints, alone and in runs of DEFAULT_LINE_LENGTH"""
+    characters = [chr(codepoint) for codepoint in sorted(codepoints) if codepoint >= 0x20]
+    runs = ["".join(characters[i : i + DEFAULT_LINE_LENGTH]) for i in range(0, len(characters), DEFAULT_LINE_LENGTH)]
+    return characters + runs
+
+
+def read_corpus(corpus_file):
+    with open(corpus_file, encoding="utf-8") as f:
+        return [line.rstrip("\n") for line in f if line.strip()]
+
+
+def verify_font(
+    source,
+    upset,
+    texts=None,
+    freeze_features=None,
+    remove_features=None,
+    location=None,
+    max_mismatches=100,
+):
+    """Compare the shaping of texts (a list of lines, by default all characters of the processed font)
+    with the source font and the processed font, given as file names or bytes. location pins axes of
+    the source, like the subspace the processed font was made with.
+
+    Returns a dict with the keys "lines" (number of lines compared), "mismatch_count" and "mismatches",
+    a list of at most max_mismatches dicts with the keys "text", "expected" and "actual" (glyph names
+    of both runs) and "features" (the frozen or removed features that change the shaping of the line)."""
+    datas = []
+    for font in (source, upset):
+        if isinstance(font, str):
+            with open(font, "rb") as f:
+                font = f.read()
+        datas.append(font)
+    source, upset = _Shaper(datas[0], location), _Shaper(datas[1], location)
+
+    toggles = {feature: True for feature in freeze_features or []}
+    toggles.update({feature: False for feature in remove_features or []})
+
+    result = {"lines": 0, "mismatch_count": 0, "mismatches": []}
+    for text in default_corpus(upset.codepoints) if texts is None else texts:
+        text = "".join(character for character in text if ord(character) in upset.codepoints)
+        if not text:
+            continue
+        result["lines"] += 1
+        expected = source.shape(text, toggles)
+        if _same_run(upset.shape(text), expected):
+            continue
+        result["mismatch_count"] += 1
+        if len(result["mismatches"]) < max_mismatches:
+            result["mismatches"].append(
+                {
+                    "text": text,
+                    "expected": source.glyph_names(text, toggles),
+                    "actual": upset.glyph_names(text),
+                    "features": [
+                        feature
+                        for feature, value in toggles.items()
+                        if not _same_run(source.shape(text, dict(toggles, **{feature: not value})), expected)
+                    ],
+                }
+            )
+    return result
+
+
+def _verify_job(job, freeze_features=None, remove_features=None, location=None, max_mismatches=100):
+    source_file, upset_file, corpus_file = job
+    return verify_font(
+        source_file,
+        upset_file,
+        read_corpus(corpus_file) if corpus_file else None,
+        freeze_features,
+        remove_features,
+        location,
+        max_mismatches,
+    )
+
+
+def verify(
+    font_pairs,
+    corpus_files=(),
+    freeze_features=None,
+    remove_features=None,
+    location=None,
+    max_mismatches=100,
+    jobs=1,
+):
+    """Verify (source file, processed file) pairs against every corpus file, with jobs worker processes
+    (None uses all CPUs). Returns one dict per pair and corpus, with the keys of verify_font() and
+    "source", "upset", "corpus" and "error"."""
+    tasks = [(source, upset, corpus) for source, upset in font_pairs for corpus in corpus_files or [None]]
+    results = run_batch(
+        _verify_job,
+        tasks,
+        jobs=jobs,
+        freeze_features=freeze_features,
+        remove_features=remove_features,
+        location=location,
+        max_mismatches=max_mismatches,
+    )
+    empty = {"lines": 0, "mismatch_count": 0, "mismatches": []}
+    return [
+        dict(result or empty, source=source, upset=upset, corpus=corpus, error=error)
+        for (source, upset, corpus), (result, error) in zip(tasks, results)
+    ]
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        prog="upsetter verify",
+        description="Verify that processed fonts shape text like their sources, with and without the frozen features",
+        epilog="Example: upsetter verify -f smcp --corpus texts.txt -j 0 font.ttf",
+    )
+    parser.add_argument(
+        "font_files", nargs="+", help="Source fonts. They are compared to <name>.upset.<ext> unless --upset is given."
+    )
+    parser.add_argument(
+        "--upset", type=str, action="append", help="Processed font to compare to the source font (repeatable)"
+    )
+    parser.add_argument("-f", "--freeze", type=str, help="Comma-separated list of the frozen features")
+    parser.add_argument("-r", "--remove", type=str, help="Comma-separated list of the removed features")
+    parser.add_argument(
+        "-s", "--subspace", type=str, help="Subspace the fonts were made with. Pinned axes are set in the source."
+    )
+    parser.add_argument(
+        "--corpus",
+        type=str,
+        action="append",
+        help="Text file with one line of text per line (repeatable). Default is every character of the font.",
+    )
+    parser.add_argument("--max-mismatches", type=int, default=100, help="Mismatches to report per font and corpus")
+    parser.add_argument("-j", "--jobs", type=non_negative_int, default=1, help="Number of processes. 0 uses all CPUs.")
+    parser.add_argument("--json", action="store_true", help="Print the results as JSON")
+    parser.add_argument("-v", "--verbose", help="Be verbose. Set logging level to INFO.", action="store_true")
+    args = parser.parse_args(args)
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING)
+    if args.upset and len(args.upset) != len(args.font_files):
+        parser.error("--upset must be given once per font file")
+    _hb()
+
+    location = None
+    if args.subspace:
+        from fontTools.varLib.instancer import parseLimits
+
+        # Pinned axes are numbers in older versions of fontTools, (minimum, default, maximum) triples in newer ones
+        location = {}
+        for tag, value in parseLimits(args.subspace.split(",")).items():
+            if isinstance(value, (int, float)):
+                location[tag] = value
+            elif value is not None and value[0] == value[-1]:
+                location[tag] = value[0]
+
+    results = verify(
+        list(zip(args.font_files, args.upset or [output_path(font_file) for font_file in args.font_files])),
+        args.corpus or (),
+        freeze_features=args.freeze.split(",") if args.freeze else None,
+        remove_features=args.remove.split(",") if args.remove else None,
+        location=location,
+        max_mismatches=args.max_mismatches,
+        jobs=args.jobs or None,
+    )
+    if args.json:
+        print(json.dumps(results, indent=2, ensure_ascii=False))
+    else:
+        for result in results:
+            corpus = f" [{result['corpus']}]" if result["corpus"] else ""
+            if result["error"]:
+                print(f"{result['upset']}{corpus}: {result['error']}")
+                continue
+            print(f"{result['upset']}{corpus}: {result['lines']} lines, {result['mismatch_count']} mismatches")
+            for mismatch in result["mismatches"]:
+                features = ", ".join(mismatch["features"]) or "no frozen or removed feature"
+                print(f"  {mismatch['text']!r} ({features}):")
+                print(f"    expected [{' '.join(mismatch['expected'])}]")
+                print(f"    actual   [{' '.join(mismatch['actual'])}]")
+
+    if any(result["error"] or result["mismatch_count"] for result in results):
+        parser.exit(1)